@@ -1,25 +1,58 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Callable
+from contextlib import asynccontextmanager
 import os
-import tempfile
-import shutil
+import time
+import asyncio
+import hashlib
 from datetime import datetime
 import json
+import orjson
 
 # Importera våra moduler
 from services.report_generator import ReportGenerator
 from services.supabase_service import SupabaseService
-from services.database_parser import DatabaseParser
+from services.database_parser import DatabaseParser, mapping_refresher
 from services.supabase_database import db
-from models.schemas import ReportRequest, ReportResponse, CompanyData
+from services.upload_sessions import UploadSession, upload_sessions
+from services.row_skeleton import get_row_skeleton, compact_rows
+from services.result_cache import UploadResult, result_cache
+from services.singleflight import upload_flights, recalc_flights
+from services.report_jobs import report_jobs, QueueFullError, UserQuotaError, DONE, FAILED
+from services.render_pool import render_pool
+from services.parsed_se import ParsedSE
+from services.upload_pipeline import UPLOAD_PIPELINE
+from services.ixbrl_export import iter_ixbrl, xbrl_concepts
+from services.bulk_upload import stream_bulk_upload, bulk_upload_pool
+from services.admission import admission, AdmissionRejected, release_after
+from utils.compression import CompressionMiddleware
+from utils.responses import negotiated_response, range_file_response
+from utils.sse import StageStream, sse_event, SSE_MEDIA_TYPE, SSE_HEADERS, SSE_KEEPALIVE, KEEPALIVE_SECONDS
+from models.schemas import ReportRequest, ReportResponse, ReportJobResponse, ReportJobStatus, CompanyData, UploadSeFileResponse, RecalculateInk2Response
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load mappings once and keep them fresh in the background
+    await mapping_refresher.start()
+    await report_jobs.start(run_report_job)
+    yield
+    await report_jobs.stop()
+    render_pool.shutdown()
+    bulk_upload_pool.shutdown()
+    await mapping_refresher.stop()
 
 app = FastAPI(
     title="Raketrapport API",
     description="API för att generera årsredovisningar enligt K2",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson instead of the stdlib encoder for all JSON responses
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware för React frontend
@@ -39,151 +72,445 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# brotli/gzip for responses above 1 KB (streaming responses are left alone)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    # Saturated or over the client's quota: tell the client when to come back
+    return ORJSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
 # Initiera services
 report_generator = ReportGenerator()
 supabase_service = SupabaseService()
 
+# Seconds between job table reads for /report-jobs/{job_id}/events
+REPORT_EVENTS_POLL_INTERVAL = float(os.getenv('REPORT_EVENTS_POLL_INTERVAL', '0.5'))
+
 @app.get("/")
 async def root():
     return {"message": "Raketrapport API är igång! 🚀"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "mapping_snapshot": mapping_refresher.status(),
+        "result_cache": result_cache.stats(),
+        "report_jobs": report_jobs.stats(),
+        "report_store": report_generator.artifacts.stats(),
+        "admission": admission.stats()
+    }
 
-@app.post("/upload-se-file", response_model=dict)
-async def upload_se_file(file: UploadFile = File(...)):
+@app.get("/api/skeleton")
+async def get_skeleton(request: Request):
+    """
+    Static RR/BR/INK2 row metadata for the current mapping version (cacheable via ETag)
+    """
+    skeleton = get_row_skeleton(DatabaseParser())
+    etag = f'"{skeleton["version"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    # Weak comparison: compressed responses carry W/"<version>"
+    if_none_match = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(skeleton, headers=headers)
+
+@app.post("/upload-se-file", response_model=UploadSeFileResponse)
+async def upload_se_file(request: Request, file: UploadFile = File(...), layout: str = "full"):
     """
     Laddar upp en .SE-fil och extraherar grundläggande information
+    layout=compact returnerar endast belopp i skelettets ordning (se /api/skeleton)
     """
     if not file.filename.lower().endswith('.se'):
         raise HTTPException(status_code=400, detail="Endast .SE-filer accepteras")
     
     try:
-        # Skapa temporär fil
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.se') as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
-        
-        # Read SE file content with encoding detection
-        encodings = ['iso-8859-1', 'windows-1252', 'utf-8', 'cp1252']
-        se_content = None
-        
-        for encoding in encodings:
-            try:
-                with open(temp_path, 'r', encoding=encoding) as f:
-                    se_content = f.read()
-                break
-            except UnicodeDecodeError:
-                continue
+        raw_content = await file.read()
         
-        if se_content is None:
-            raise HTTPException(status_code=500, detail="Kunde inte läsa SE-filen med någon av de försökta kodningarna")
+        # Uploads are identified by the content hash of the file
+        upload_id = hashlib.sha256(raw_content).hexdigest()
         
         # Use the new database-driven parser
         parser = DatabaseParser()
-        current_accounts, previous_accounts = parser.parse_account_balances(se_content)
-        company_info = parser.extract_company_info(se_content)
-        rr_data = parser.parse_rr_data(current_accounts, previous_accounts)
+        snapshot_version = parser.snapshot.version if parser.snapshot else None
         
-        # Pass RR data to BR parsing so calculated values from RR are available
-        br_data = parser.parse_br_data(current_accounts, previous_accounts, rr_data)
-        
-        # Parse INK2 data (tax calculations) - pass RR data for variable references
-        ink2_data = parser.parse_ink2_data(current_accounts, company_info.get('fiscal_year'), rr_data)
-        
-        # Calculate pension tax variables for frontend
-        pension_premier = abs(float(current_accounts.get('7410', 0.0)))
-        sarskild_loneskatt_pension = abs(float(current_accounts.get('7531', 0.0)))
-        # Get sarskild_loneskatt rate from global variables
-        sarskild_loneskatt_rate = float(parser.global_variables.get('sarskild_loneskatt', 0.0))
-        sarskild_loneskatt_pension_calculated = pension_premier * sarskild_loneskatt_rate
-        
-        # Store financial data in database
-        if company_info.get('organization_number'):
-            company_id = company_info['organization_number']
-            fiscal_year = company_info.get('fiscal_year', datetime.now().year)
+        # Same file and same mappings give the same result - skip parsing and the financial_data write
+        result = result_cache.get(upload_id, snapshot_version)
+        if result is not None:
+            if result.store_pending:
+                await run_in_threadpool(retry_financial_data_store, parser, result)
+        else:
+            def compute() -> UploadResult:
+                # A coalesced request that just finished may have filled the cache
+                cached = result_cache.get(upload_id, snapshot_version)
+                if cached is not None:
+                    return retry_financial_data_store(parser, cached)
+                return result_cache.put(process_se_upload(parser, upload_id, raw_content))
             
-            # Store the parsed financial data
-            stored_ids = parser.store_financial_data(company_id, fiscal_year, rr_data, br_data)
-            print(f"Stored financial data with IDs: {stored_ids}")
-        
-        # Rensa upp temporär fil
-        os.unlink(temp_path)
-        
-        return {
+            # Identical concurrent uploads share one computation, run off the event loop;
+            # only that computation takes an admission slot
+            result = await upload_flights.do(
+                f"{upload_id}:{snapshot_version}",
+                lambda: admission.run("upload", request, lambda: run_in_threadpool(compute))
+            )
+        
+        register_upload_session(result)
+        
+        # Cached results are shared, so build the response from a copy
+        response_data = dict(result.response_data)
+        if layout == "compact":
+            rr_data, br_data, ink2_data = (response_data.pop(key) for key in ("rr_data", "br_data", "ink2_data"))
+            response_data.update(compact_rows(get_row_skeleton(parser), rr_data, br_data, ink2_data))
+        
+        # The response model documents the shape; the rows are serialized as-is by orjson
+        # (or msgpack) instead of being re-validated and re-encoded by FastAPI
+        return negotiated_response(request, {
             "success": True,
-            "data": {
-                "company_info": company_info,
-                "current_accounts_count": len(current_accounts),
-                "previous_accounts_count": len(previous_accounts),
-                "current_accounts_sample": dict(list(current_accounts.items())[:10]),
-                "previous_accounts_sample": dict(list(previous_accounts.items())[:10]),
-                "current_accounts": current_accounts,  # Add full accounts for recalculation
-                "rr_data": rr_data,
-                "br_data": br_data,
-                "ink2_data": ink2_data,
-                "rr_count": len(rr_data),
-                "br_count": len(br_data),
-                "ink2_count": len(ink2_data),
-                "pension_premier": pension_premier,
-                "sarskild_loneskatt_pension": sarskild_loneskatt_pension,
-                "sarskild_loneskatt_pension_calculated": sarskild_loneskatt_pension_calculated
-            },
+            "data": response_data,
             "message": "SE-fil laddad framgångsrikt"
-        }
+        })
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fel vid laddning av fil: {str(e)}")
 
-@app.post("/generate-report", response_model=ReportResponse)
-async def generate_report(
-    request: ReportRequest,
-    background_tasks: BackgroundTasks
-):
+def retry_financial_data_store(parser: DatabaseParser, result: UploadResult) -> UploadResult:
     """
-    Genererar årsredovisning baserat på .SE-fil och användarinput
+    Cache hits skip the financial_data write, so a write that failed when the result was
+    computed is retried on the next hit until it succeeds
     """
-    try:
-        # Generera rapport
-        report_data = await report_generator.generate_full_report(request)
-        
-        # Spara till Supabase (i bakgrunden)
-        background_tasks.add_task(
-            supabase_service.save_report,
-            request.user_id,
-            report_data
-        )
-        
-        return ReportResponse(
-            success=True,
-            report_id=report_data["report_id"],
-            download_url=f"/download-report/{report_data['report_id']}",
-            message="Rapport genererad framgångsrikt!"
+    if result.store_pending:
+        company_info = result.company_info
+        stored_ids = parser.store_financial_data(
+            company_info['organization_number'], company_info.get('fiscal_year', datetime.now().year),
+            result.response_data['rr_data'], result.response_data['br_data']
         )
-        
+        if stored_ids:
+            result.stored_ids = stored_ids
+            # Also updates the shared cache, so other workers don't write again
+            result_cache.put(result)
+    return result
+
+def register_upload_session(result: UploadResult) -> UploadSession:
+    # Account details for SHOW rows are computed once per upload and reused by recalculations
+    return upload_sessions.put(UploadSession(
+        upload_id=result.upload_id,
+        snapshot_version=result.snapshot_version,
+        current_accounts=result.current_accounts,
+        previous_accounts=result.previous_accounts,
+        company_info=result.company_info,
+        account_details=result.account_details
+    ))
+
+@app.post("/upload-se-file/stream")
+async def upload_se_file_stream(request: Request, file: UploadFile = File(...)):
+    """
+    Som /upload-se-file men strömmar förloppet som Server-Sent Events:
+    ett 'stage'-event per steg (med tider och delresultat, t.ex. RR före BR),
+    sedan 'result' med samma data som /upload-se-file. Avbryts klienten hoppas
+    återstående steg över (inklusive lagringen).
+    """
+    if not file.filename.lower().endswith('.se'):
+        raise HTTPException(status_code=400, detail="Endast .SE-filer accepteras")
+    
+    raw_content = await file.read()
+    upload_id = hashlib.sha256(raw_content).hexdigest()
+    parser = DatabaseParser()
+    snapshot_version = parser.snapshot.version if parser.snapshot else None
+    stream = StageStream()
+    
+    def compute() -> tuple:
+        cached = result_cache.get(upload_id, snapshot_version)
+        if cached is not None:
+            return retry_financial_data_store(parser, cached), True
+        return result_cache.put(process_se_upload(parser, upload_id, raw_content, on_stage=stream)), False
+    
+    def on_result(outcome: tuple):
+        result, cached = outcome
+        register_upload_session(result)
+        yield "result", {
+            "success": True,
+            "cached": cached,
+            "data": result.response_data,
+            "message": "SE-fil laddad framgångsrikt"
+        }
+    
+    # The slot is held until the stream ends
+    ticket = await admission.acquire("upload", request)
+    return StreamingResponse(
+        release_after(ticket, stream.events(run_in_threadpool(compute), on_result)),
+        media_type=SSE_MEDIA_TYPE,
+        headers=SSE_HEADERS,
+        background=BackgroundTask(ticket.release)
+    )
+
+@app.post("/upload-se-files")
+async def upload_se_files(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Laddar upp flera .SE-filer och/eller zip-arkiv med .SE-filer.
+    Filerna beräknas parallellt och resultatet strömmas som NDJSON, en rad per fil
+    i den ordning de blir klara, följt av en sammanfattningsrad.
+    """
+    parser = DatabaseParser()
+    
+    def store(record: dict):
+        # Same financial_data write as the single file upload
+        company_info = record["company_info"]
+        if company_info.get('organization_number'):
+            fiscal_year = company_info.get('fiscal_year', datetime.now().year)
+            parser.store_financial_data(company_info['organization_number'], fiscal_year,
+                                        record["rr_data"], record["br_data"])
+    
+    ticket = await admission.acquire("bulk_upload", request)
+    return StreamingResponse(
+        release_after(ticket, stream_bulk_upload(files, parser, bulk_upload_pool, store)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store"},
+        background=BackgroundTask(ticket.release)
+    )
+
+# Everything the upload response needs (store_financial_data runs alongside INK2)
+UPLOAD_TARGETS = ("company_info", "rr_data", "br_data", "account_details", "ink2_data", "stored_ids")
+
+def process_se_upload(parser: DatabaseParser, upload_id: str, raw_content: bytes,
+                      on_stage: Optional[Callable[[str, dict], None]] = None) -> UploadResult:
+    """
+    Parse an SE file, calculate RR/BR/INK2 and store the financial data (see UPLOAD_PIPELINE)
+    on_stage(stage, data) is called after each stage with its partial result (see /upload-se-file/stream)
+    """
+    snapshot_version = parser.snapshot.version if parser.snapshot else None
+    values = UPLOAD_PIPELINE.run(
+        {"parser": parser, "raw": raw_content},
+        targets=UPLOAD_TARGETS,
+        on_stage=on_stage
+    )
+    current_accounts, previous_accounts = values["current_accounts"], values["previous_accounts"]
+    company_info = values["company_info"]
+    rr_data, br_data, ink2_data = values["rr_data"], values["br_data"], values["ink2_data"]
+    account_details = values["account_details"]
+    
+    # Calculate pension tax variables for frontend
+    pension_premier = abs(float(current_accounts.get('7410', 0.0)))
+    sarskild_loneskatt_pension = abs(float(current_accounts.get('7531', 0.0)))
+    # Get sarskild_loneskatt rate from global variables
+    sarskild_loneskatt_rate = float(parser.global_variables.get('sarskild_loneskatt', 0.0))
+    sarskild_loneskatt_pension_calculated = pension_premier * sarskild_loneskatt_rate
+    
+    response_data = {
+        "upload_id": upload_id,
+        "company_info": company_info,
+        "current_accounts_count": len(current_accounts),
+        "previous_accounts_count": len(previous_accounts),
+        "current_accounts_sample": dict(list(current_accounts.items())[:10]),
+        "previous_accounts_sample": dict(list(previous_accounts.items())[:10]),
+        "current_accounts": current_accounts,  # Add full accounts for recalculation
+        "rr_data": rr_data,
+        "br_data": br_data,
+        "ink2_data": ink2_data,
+        "rr_count": len(rr_data),
+        "br_count": len(br_data),
+        "ink2_count": len(ink2_data),
+        "pension_premier": pension_premier,
+        "sarskild_loneskatt_pension": sarskild_loneskatt_pension,
+        "sarskild_loneskatt_pension_calculated": sarskild_loneskatt_pension_calculated
+    }
+    
+    return UploadResult(
+        upload_id=upload_id,
+        snapshot_version=snapshot_version,
+        current_accounts=current_accounts,
+        previous_accounts=previous_accounts,
+        company_info=company_info,
+        account_details=account_details,
+        response_data=response_data,
+        stored_ids=values["stored_ids"]
+    )
+
+@app.post("/generate-report", response_model=ReportJobResponse, status_code=202)
+async def generate_report(request: ReportRequest):
+    """
+    Köar generering av årsredovisning baserat på .SE-fil och användarinput.
+    Returnerar ett jobb-ID direkt; följ jobbet via /report-jobs/{job_id}
+    """
+    try:
+        job_id = await report_jobs.submit(request.user_id, request.model_dump(mode="json"))
+    except QueueFullError as e:
+        # Load spikes queue up to REPORT_QUEUE_LIMIT; beyond that the client retries later
+        raise HTTPException(status_code=503, detail=f"Rapportkön är full: {str(e)}", headers={"Retry-After": "30"})
+    except UserQuotaError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fel vid generering av rapport: {str(e)}")
+    
+    return ReportJobResponse(
+        success=True,
+        job_id=job_id,
+        status="queued",
+        status_url=f"/report-jobs/{job_id}",
+        progress_url=f"/report-jobs/{job_id}/progress",
+        message="Rapporten har köats för generering"
+    )
+
+async def run_report_job(job_id: str, payload: dict, progress) -> dict:
+    """
+    Körs av jobbkön: renderar rapporten i en arbetstråd och sparar den till Supabase
+    """
+    request = ReportRequest.model_validate(payload)
+    report_data = await report_generator.generate_full_report(request, progress)
+    await supabase_service.save_report(request.user_id, report_data)
+    return report_data
+
+@app.get("/report-jobs/{job_id}", response_model=ReportJobStatus)
+async def get_report_job(job_id: str):
+    """
+    Hämtar status för ett rapportjobb (med nedladdningslänk när rapporten är klar)
+    """
+    try:
+        job = await run_in_threadpool(report_jobs.store.get, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fel vid hämtning av jobb: {str(e)}")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Jobbet hittades inte")
+    
+    result = job["result"] or {}
+    report_id = result.get("report_id")
+    return ReportJobStatus(
+        job_id=job["job_id"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        report_id=report_id,
+        download_url=f"/download-report/{report_id}" if job["status"] == DONE and report_id else None,
+        error=job["error"],
+        created_at=datetime.fromtimestamp(job["created_at"]),
+        started_at=datetime.fromtimestamp(job["started_at"]) if job["started_at"] else None,
+        finished_at=datetime.fromtimestamp(job["finished_at"]) if job["finished_at"] else None
+    )
+
+@app.get("/report-jobs/{job_id}/progress")
+async def get_report_job_progress(job_id: str):
+    """
+    Lättviktig förloppsstatus för polling (status, steg och andel klart)
+    """
+    try:
+        progress = await run_in_threadpool(report_jobs.store.progress, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fel vid hämtning av jobb: {str(e)}")
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Jobbet hittades inte")
+    return progress
 
-@app.get("/download-report/{report_id}")
-async def download_report(report_id: str):
+@app.get("/report-jobs/{job_id}/events")
+async def get_report_job_events(job_id: str):
     """
-    Laddar ner genererad PDF-rapport
+    Förloppet för ett rapportjobb som Server-Sent Events: 'progress' när status,
+    steg eller andel ändras (med tid sedan start), sedan 'done' eller 'failed'
+    med samma data som /report-jobs/{job_id}. Jobbet fortsätter om klienten kopplar ner.
     """
     try:
-        file_path = report_generator.get_report_path(report_id)
-        if not os.path.exists(file_path):
+        progress = await run_in_threadpool(report_jobs.store.progress, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fel vid hämtning av jobb: {str(e)}")
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Jobbet hittades inte")
+    
+    async def events():
+        last = None
+        idle = 0.0
+        started = time.monotonic()
+        while True:
+            progress = await run_in_threadpool(report_jobs.store.progress, job_id)
+            if progress is None:
+                yield sse_event("failed", {"job_id": job_id, "error": "Jobbet hittades inte"})
+                return
+            state = (progress["status"], progress["stage"], progress["progress"])
+            if state != last:
+                last, idle = state, 0.0
+                yield sse_event("progress", {**progress, "elapsed": round(time.monotonic() - started, 3)})
+            if progress["status"] in (DONE, FAILED):
+                status = await get_report_job(job_id)
+                yield sse_event(progress["status"], status.model_dump(mode="json"))
+                return
+            # Jobs may run in another worker process, so changes are picked up from the job table
+            await asyncio.sleep(REPORT_EVENTS_POLL_INTERVAL)
+            idle += REPORT_EVENTS_POLL_INTERVAL
+            if idle >= KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield SSE_KEEPALIVE
+    
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+@app.api_route("/download-report/{report_id}", methods=["GET", "HEAD"])
+async def download_report(request: Request, report_id: str):
+    """
+    Laddar ner genererad PDF-rapport (stöder ETag och Range för återupptagna nedladdningar)
+    """
+    try:
+        artifact = await run_in_threadpool(report_generator.find_report, report_id)
+        if artifact is None:
             raise HTTPException(status_code=404, detail="Rapport hittades inte")
         
-        return FileResponse(
-            path=file_path,
+        return range_file_response(
+            request,
+            artifact.path,
+            etag=artifact.sha256,
             filename=f"arsredovisning_{report_id}.pdf",
             media_type="application/pdf"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fel vid nedladdning: {str(e)}")
 
+@app.post("/export-ixbrl")
+async def export_ixbrl(request: Request, file: UploadFile = File(...)):
+    """
+    Exporterar RR och BR som iXBRL (XHTML) för digital inlämning till Bolagsverket.
+    Dokumentet strömmas medan det skrivs.
+    """
+    if not file.filename.lower().endswith('.se'):
+        raise HTTPException(status_code=400, detail="Endast .SE-filer accepteras")
+    
+    # Held through the evaluation and the streamed document
+    ticket = await admission.acquire("export", request)
+    try:
+        raw_content = await file.read()
+        parser = DatabaseParser()
+        
+        def evaluate():
+            parsed = ParsedSE.from_bytes(raw_content, parser)
+            rr_rows = parser.evaluate_rr_rows(parsed.current_accounts, parsed.previous_accounts)
+            br_rows = parser.evaluate_br_rows(parsed.current_accounts, parsed.previous_accounts, rr_rows)
+            return parsed, rr_rows, br_rows
+        
+        parsed, rr_rows, br_rows = await run_in_threadpool(evaluate)
+        if parsed.current_period is None:
+            raise HTTPException(status_code=400, detail="Räkenskapsår (#RAR 0) saknas i SE-filen")
+        
+        stream = iter_ixbrl(
+            rr_rows, br_rows,
+            xbrl_concepts(parser.rr_compiled), xbrl_concepts(parser.br_compiled),
+            parsed.company_info, parsed.periods
+        )
+        organization_number = (parsed.company_info.get("organization_number") or parsed.upload_id[:12]).replace("-", "")
+        return StreamingResponse(
+            release_after(ticket, stream),
+            media_type="application/xhtml+xml",
+            headers={"Content-Disposition": f'attachment; filename="arsredovisning_{organization_number}.xhtml"'},
+            background=BackgroundTask(ticket.release)
+        )
+        
+    except HTTPException:
+        ticket.release()
+        raise
+    except Exception as e:
+        ticket.release()
+        raise HTTPException(status_code=500, detail=f"Fel vid iXBRL-export: {str(e)}")
+
 @app.get("/user-reports/{user_id}")
 async def get_user_reports(user_id: str):
     """
@@ -218,6 +545,7 @@ async def update_formula(row_id: int, formula: str):
         success = parser.update_calculation_formula(row_id, formula)
         
         if success:
+            mapping_refresher.poke()
             return {"success": True, "message": f"Formula updated for row {row_id}"}
         else:
             raise HTTPException(status_code=500, detail="Failed to update formula")
@@ -226,7 +554,7 @@ async def update_formula(row_id: int, formula: str):
         raise HTTPException(status_code=500, detail=f"Error updating formula: {str(e)}")
 
 @app.post("/test-parser", response_model=dict)
-async def test_parser(file: UploadFile = File(...)):
+async def test_parser(request: Request, file: UploadFile = File(...)):
     """
     Test endpoint for the new database-driven parser
     """
@@ -236,56 +564,33 @@ async def test_parser(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail=f"Endast .SE-filer accepteras. Fick: {file.filename}")
     
     try:
-        # Skapa temporär fil
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.se') as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
-        
-        print(f"Created temp file: {temp_path}")
-        
-        # Read SE file content - try different encodings
-        se_content = None
-        encodings_to_try = ['iso-8859-1', 'windows-1252', 'utf-8', 'cp1252']
-        
-        for encoding in encodings_to_try:
-            try:
-                with open(temp_path, 'r', encoding=encoding) as f:
-                    se_content = f.read()
-                print(f"Successfully read file with {encoding} encoding")
-                break
-            except UnicodeDecodeError as e:
-                print(f"Failed to read with {encoding} encoding: {e}")
-                continue
-        
-        if se_content is None:
-            raise Exception("Could not read file with any supported encoding")
-        
-        print(f"Read {len(se_content)} characters from file")
-        
-        # Initialize parser
+        raw_content = await file.read()
         parser = DatabaseParser()
-        
-        # Parse data
-        current_accounts, previous_accounts = parser.parse_account_balances(se_content)
-        company_info = parser.extract_company_info(se_content)
-        rr_data = parser.parse_rr_data(current_accounts, previous_accounts)
-        br_data = parser.parse_br_data(current_accounts, previous_accounts)
+        snapshot_version = parser.snapshot.version if parser.snapshot else None
+        
+        # A file already uploaded with this mapping version is taken from the result cache
+        cached = result_cache.get(hashlib.sha256(raw_content).hexdigest(), snapshot_version)
+        if cached is not None:
+            await run_in_threadpool(retry_financial_data_store, parser, cached)
+            current_accounts, previous_accounts = cached.current_accounts, cached.previous_accounts
+            company_info = cached.company_info
+            rr_data, br_data = cached.response_data['rr_data'], cached.response_data['br_data']
+            print("Using cached upload result")
+        else:
+            # Same stages as the upload (BR gets the RR values)
+            with await admission.acquire("upload", request):
+                values = await run_in_threadpool(
+                    UPLOAD_PIPELINE.run,
+                    {"parser": parser, "raw": raw_content},
+                    targets=("company_info", "rr_data", "br_data", "stored_ids")
+                )
+            current_accounts, previous_accounts = values["current_accounts"], values["previous_accounts"]
+            company_info, rr_data, br_data = values["company_info"], values["rr_data"], values["br_data"]
+            print(f"Read file with {values['encoding']} encoding")
         
         print(f"Parsed {len(current_accounts)} current year accounts, {len(previous_accounts)} previous year accounts")
         print(f"Generated {len(rr_data)} RR items, {len(br_data)} BR items")
         
-        # Store financial data in database
-        if company_info.get('organization_number'):
-            company_id = company_info['organization_number']
-            fiscal_year = company_info.get('fiscal_year', datetime.now().year)
-            
-            # Store the parsed financial data
-            stored_ids = parser.store_financial_data(company_id, fiscal_year, rr_data, br_data)
-            print(f"Stored financial data with IDs: {stored_ids}")
-        
-        # Rensa upp temporär fil
-        os.unlink(temp_path)
-        
         return {
             "success": True,
             "company_info": company_info,
@@ -300,6 +605,8 @@ async def test_parser(file: UploadFile = File(...)):
             "message": "Parser test completed successfully"
         }
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Error in test_parser: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Fel vid parser test: {str(e)}")
@@ -350,56 +657,163 @@ async def list_companies_with_data():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing companies: {str(e)}")
 
-@app.post("/api/recalculate-ink2")
-async def recalculate_ink2(data: dict):
+@app.post("/api/recalculate-ink2", response_model=RecalculateInk2Response)
+async def recalculate_ink2(request: Request, data: dict, layout: str = "full"):
     """
     Recalculate INK2 values with manual amount overrides
+    layout=compact returns amounts only, in skeleton order (see /api/skeleton)
     """
     try:
-        current_accounts = data.get('current_accounts', {})
-        fiscal_year = data.get('fiscal_year')
-        rr_data = data.get('rr_data', [])
-        br_data = data.get('br_data', [])
-        manual_amounts = data.get('manual_amounts', {})
-        justering_sarskild_loneskatt = data.get('justering_sarskild_loneskatt', 0)
-        
-        # Initialize parser
+        # Identical concurrent recalculations (double clicks, retries) share one computation
         parser = DatabaseParser()
-        
-        # Add pension tax adjustment to manual amounts if provided
-        if justering_sarskild_loneskatt != 0:
-            manual_amounts['justering_sarskild_loneskatt'] = justering_sarskild_loneskatt
-        
-        # Recalculate INK2 with manual overrides
-        ink2_data = parser.parse_ink2_data_with_overrides(
-            current_accounts, 
-            fiscal_year, 
-            rr_data, 
-            br_data, 
-            manual_amounts
+        snapshot_version = parser.snapshot.version if parser.snapshot else None
+        key = hashlib.sha256(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        # Own gate, so recalculations don't queue behind uploads
+        ink2_data = await recalc_flights.do(
+            f"{key}:{snapshot_version}",
+            lambda: admission.run("recalc", request,
+                                  lambda: run_in_threadpool(compute_ink2_recalculation, parser, data))
         )
         
-        return {
+        if layout == "compact":
+            return negotiated_response(request, {
+                "success": True,
+                **compact_rows(get_row_skeleton(parser), ink2_data=ink2_data)
+            })
+        
+        return negotiated_response(request, {
             "success": True,
             "ink2_data": ink2_data
-        }
+        })
         
+    except (AdmissionRejected, HTTPException):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fel vid omberäkning: {str(e)}")
 
+def compute_ink2_recalculation(parser: DatabaseParser, data: dict) -> List[dict]:
+    """
+    INK2 rows for a recalculation request (manual overrides applied)
+    """
+    session = find_upload_session(parser, data.get('upload_id'))
+    if session is None and not data.get('current_accounts'):
+        # Calculating against no accounts would return all-zero INK2 as a success
+        raise HTTPException(status_code=404, detail="Uppladdningen hittades inte, skicka med current_accounts eller ladda upp SE-filen igen")
+    current_accounts = data.get('current_accounts') or session.current_accounts
+    fiscal_year = data.get('fiscal_year')
+    rr_data = data.get('rr_data', [])
+    br_data = data.get('br_data', [])
+    manual_amounts = dict(data.get('manual_amounts') or {})
+    justering_sarskild_loneskatt = data.get('justering_sarskild_loneskatt', 0)
+    
+    # Re-register an expired session from the request so SHOW details stay available
+    if session is None and data.get('upload_id') and current_accounts:
+        session = session_from_accounts(parser, data['upload_id'], current_accounts)
+    account_details = get_session_account_details(parser, session)
+    
+    # Add pension tax adjustment to manual amounts if provided
+    if justering_sarskild_loneskatt != 0:
+        manual_amounts['justering_sarskild_loneskatt'] = justering_sarskild_loneskatt
+    
+    # Recalculate INK2 with manual overrides
+    return parser.parse_ink2_data_with_overrides(
+        current_accounts, 
+        fiscal_year, 
+        rr_data, 
+        br_data, 
+        manual_amounts,
+        account_details=account_details
+    )
+
+def find_upload_session(parser: DatabaseParser, upload_id: Optional[str]) -> Optional[UploadSession]:
+    """
+    The upload's session. After a restart, or on another worker, it is rebuilt from the
+    result cache (the shared SQLite cache outlives the process)
+    """
+    session = upload_sessions.get(upload_id)
+    if session is None and upload_id:
+        result = result_cache.get(upload_id, parser.snapshot.version if parser.snapshot else None)
+        if result is not None:
+            session = register_upload_session(result)
+    return session
+
+def session_from_accounts(parser: DatabaseParser, upload_id: str, current_accounts: dict) -> UploadSession:
+    """Session rebuilt from the accounts the client kept from the upload response"""
+    return upload_sessions.put(UploadSession(
+        upload_id=upload_id,
+        snapshot_version=parser.snapshot.version if parser.snapshot else None,
+        current_accounts=current_accounts,
+        previous_accounts={},
+        company_info={},
+        account_details=parser.build_account_detail_index(current_accounts)
+    ))
+
+def get_session_account_details(parser: DatabaseParser, session: Optional[UploadSession]):
+    """
+    Account-detail index for an upload session, rebuilt if the mappings have changed since upload
+    """
+    if session is None:
+        return None
+    version = parser.snapshot.version if parser.snapshot else None
+    if session.snapshot_version != version:
+        session.account_details = parser.build_account_detail_index(session.current_accounts)
+        session.snapshot_version = version
+    return session.account_details
+
+class AccountDetailsRequest(BaseModel):
+    current_accounts: dict
+
+@app.get("/api/account-details/{upload_id}/{variable_name}")
+async def get_account_details(upload_id: str, variable_name: str):
+    """
+    Account details behind a SHOW row, served from the upload's precomputed index.
+    404 if the upload is unknown here - then POST the upload's current_accounts instead
+    """
+    parser = DatabaseParser()
+    session = await run_in_threadpool(find_upload_session, parser, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Uppladdningen hittades inte, ladda upp SE-filen igen")
+    # May rebuild the index (and look up account texts) after a mapping change
+    return await run_in_threadpool(account_details_response, parser, session, variable_name)
+
+@app.post("/api/account-details/{upload_id}/{variable_name}")
+async def post_account_details(upload_id: str, variable_name: str, body: AccountDetailsRequest):
+    """
+    Som GET, men återskapar uppladdningen från klientens current_accounts om servern
+    inte längre har den (omstart, annan instans)
+    """
+    parser = DatabaseParser()
+    session = await run_in_threadpool(find_upload_session, parser, upload_id)
+    if session is None:
+        session = await run_in_threadpool(session_from_accounts, parser, upload_id, body.current_accounts)
+    # May rebuild the index (and look up account texts) after a mapping change
+    return await run_in_threadpool(account_details_response, parser, session, variable_name)
+
+def account_details_response(parser: DatabaseParser, session: UploadSession, variable_name: str) -> dict:
+    account_details = get_session_account_details(parser, session)
+    if variable_name not in account_details:
+        raise HTTPException(status_code=404, detail=f"Inga kontodetaljer för {variable_name}")
+    
+    return {
+        "success": True,
+        "upload_id": session.upload_id,
+        "variable_name": variable_name,
+        "account_details": account_details[variable_name]
+    }
+
 @app.get("/api/database/tables/{table_name}")
-async def read_database_table(table_name: str, columns: str = "*", order_by: str = None):
+async def read_database_table(request: Request, table_name: str, columns: str = "*", order_by: str = None):
     """
     Read data from a database table
     """
     try:
         data = db.read_table(table_name, columns=columns, order_by=order_by)
-        return {
+        return negotiated_response(request, {
             "success": True,
             "table": table_name,
             "count": len(data),
             "data": data
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading table {table_name}: {str(e)}")
 
@@ -479,6 +893,8 @@ async def add_sarskild_loneskatt_mapping():
             block='INK4',
             header='FALSE'
         )
+        if success:
+            mapping_refresher.poke()
         
         return {
             "success": success,
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
 class CompanyData(BaseModel):
@@ -34,6 +34,28 @@ class ReportResponse(BaseModel):
     message: str
     generated_at: datetime = Field(default_factory=datetime.now)
 
+class ReportJobResponse(BaseModel):
+    """Svar när en rapport har köats för generering"""
+    success: bool
+    job_id: str
+    status: str
+    status_url: str
+    progress_url: str
+    message: str
+
+class ReportJobStatus(BaseModel):
+    """Status för ett rapportjobb"""
+    job_id: str
+    status: str  # queued | running | done | failed
+    stage: Optional[str] = None
+    progress: float = 0.0
+    report_id: Optional[str] = None
+    download_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class UserReport(BaseModel):
     """Användarens sparade rapport"""
     id: str
@@ -52,4 +74,90 @@ class CompanyInfo(BaseModel):
     location: str
     board_members: List[str]
     employee_count: Optional[int]
-    key_figures: Dict[str, Any] 
\ No newline at end of file
+    key_figures: Dict[str, Any] 
+
+# --- Beräkningsresultat (RR/BR/INK2) ---
+# Fält som kommer direkt från mappningstabellerna kan vara bool eller 'TRUE'/'FALSE'-strängar
+
+class RRRow(BaseModel):
+    """Rad i resultaträkningen"""
+    id: int
+    label: str
+    current_amount: Optional[float] = None
+    previous_amount: Optional[float] = None
+    level: int
+    section: str
+    bold: bool
+    style: Optional[str] = None
+    variable_name: Optional[str] = None
+    is_calculated: Optional[Union[bool, str]] = None
+    calculation_formula: Optional[str] = None
+    show_amount: Optional[Union[bool, str]] = None
+    block_group: Optional[str] = None
+    always_show: Optional[bool] = None
+
+class BRRow(RRRow):
+    """Rad i balansräkningen"""
+    type: str
+
+class INK2Row(BaseModel):
+    """Rad i skatteberäkningen (INK2)"""
+    row_id: Optional[int] = None
+    row_title: str
+    amount: float
+    variable_name: str
+    show_tag: Optional[Union[bool, str]] = None
+    accounts_included: Optional[str] = None
+    show_amount: bool
+    is_calculated: bool
+    always_show: Optional[bool] = None
+    style: Optional[str] = None
+    explainer: Optional[str] = None
+    block: Optional[str] = None
+    header: Optional[Union[bool, str]] = None
+    has_account_details: bool = False
+
+class CompactAmounts(BaseModel):
+    """Belopp i skelettets ordning (layout=compact)"""
+    current_amount: Optional[List[Optional[float]]] = None
+    previous_amount: Optional[List[Optional[float]]] = None
+    amount: Optional[List[Optional[float]]] = None
+    has_account_details: Optional[List[Optional[bool]]] = None
+
+class UploadSeFileData(BaseModel):
+    """Resultat av uppladdad .SE-fil"""
+    upload_id: str
+    company_info: Dict[str, Any]
+    current_accounts_count: int
+    previous_accounts_count: int
+    current_accounts_sample: Dict[str, float]
+    previous_accounts_sample: Dict[str, float]
+    current_accounts: Dict[str, float]
+    rr_data: Optional[List[RRRow]] = None
+    br_data: Optional[List[BRRow]] = None
+    ink2_data: Optional[List[INK2Row]] = None
+    rr_count: int
+    br_count: int
+    ink2_count: int
+    pension_premier: float
+    sarskild_loneskatt_pension: float
+    sarskild_loneskatt_pension_calculated: float
+    # layout=compact
+    skeleton_version: Optional[str] = None
+    rr: Optional[CompactAmounts] = None
+    br: Optional[CompactAmounts] = None
+    ink2: Optional[CompactAmounts] = None
+
+class UploadSeFileResponse(BaseModel):
+    """Response för /upload-se-file"""
+    success: bool
+    data: UploadSeFileData
+    message: str
+
+class RecalculateInk2Response(BaseModel):
+    """Response för /api/recalculate-ink2"""
+    success: bool
+    ink2_data: Optional[List[INK2Row]] = None
+    # layout=compact
+    skeleton_version: Optional[str] = None
+    ink2: Optional[CompactAmounts] = None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Process many SE files offline: parse and calculate RR/BR/INK2 on all cores
+
+Usage:
+    python scripts/batch_process.py sie/ --output results.jsonl
+    python scripts/batch_process.py bokslut.zip --snapshot mappings.json --output results.parquet
+    python scripts/batch_process.py sie/ --format ixbrl --output ixbrl/
+
+Mappings are read from --snapshot (a file written with --save-snapshot) or
+loaded once from the database. Nothing is written to the database.
+JSONL gets one line per file (same data as the upload route); Parquet gets one
+row per report row (needs pyarrow); ixbrl writes one .xhtml document per file
+into the --output directory.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+# Parquet rows are written in row groups of this many report rows
+PARQUET_BATCH_ROWS = 50000
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+def load_snapshot(args):
+    from services.mapping_snapshot import load_mapping_snapshot, read_snapshot_file, write_snapshot_file
+    if args.snapshot:
+        snapshot = read_snapshot_file(args.snapshot)
+    else:
+        from supabase import create_client
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+        if not url or not key:
+            print("❌ Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY/ANON_KEY (or use --snapshot)")
+            sys.exit(1)
+        snapshot = load_mapping_snapshot(create_client(url, key))
+    if args.save_snapshot:
+        write_snapshot_file(snapshot, args.save_snapshot)
+        print(f"💾 Mappningar sparade i {args.save_snapshot} (version {snapshot.version})")
+    return snapshot
+
+
+class JsonlOutput:
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.write(b'\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("❌ Parquet kräver pyarrow (pip install pyarrow)")
+            sys.exit(1)
+        from services.batch_pipeline import AMOUNT_COLUMNS
+        self.pa = pa
+        types = {'fiscal_year': pa.int32(), 'row_id': pa.int64(),
+                 'current_amount': pa.float64(), 'previous_amount': pa.float64()}
+        self.schema = pa.schema([(name, types.get(name, pa.string())) for name in AMOUNT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.pending = []
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= PARQUET_BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        columns = list(zip(*self.pending))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(values, type=column.type) for values, column in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+        self.pending = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class IxbrlOutput:
+    """The workers write the documents themselves; only the directory is set up here"""
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def iter_results(sources, snapshot, output: str, processes: int, chunksize: int, output_dir: str = None):
+    from services.batch_pipeline import create_pool, process_source
+    if processes <= 1:
+        from services.database_parser import DatabaseParser
+        parser = DatabaseParser(snapshot)
+        for source in sources:
+            yield process_source(source, output, parser, output_dir)
+        return
+    from functools import partial
+    with create_pool(snapshot, processes) as executor:
+        # Files are handed out chunksize at a time; results come back in input order
+        yield from executor.map(partial(process_source, output=output, output_dir=output_dir), sources,
+                                chunksize=chunksize)
+
+
+def main():
+    load_dotenv()
+    arg_parser = argparse.ArgumentParser(description="Beräkna RR/BR/INK2 för många SE-filer")
+    arg_parser.add_argument('inputs', nargs='+', help="SE-filer, kataloger eller zip-arkiv med SE-filer")
+    arg_parser.add_argument('--output', required=True,
+                            help="Resultatfil (.jsonl eller .parquet), eller katalog för ixbrl")
+    arg_parser.add_argument('--format', choices=['jsonl', 'parquet', 'ixbrl'], help="Standard: från filändelsen")
+    arg_parser.add_argument('--snapshot', help="Mappningar från fil i stället för databasen")
+    arg_parser.add_argument('--save-snapshot', help="Spara de använda mappningarna i en fil")
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Antal processer (standard: alla kärnor)")
+    arg_parser.add_argument('--chunksize', type=int, default=None,
+                            help="Filer per arbetsuppgift (standard: efter antal filer och processer)")
+    args = arg_parser.parse_args()
+
+    from services.batch_pipeline import collect_se_sources
+
+    output_format = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'jsonl')
+    sources = collect_se_sources(args.inputs)
+    if not sources:
+        print("❌ Inga SE-filer hittades")
+        sys.exit(1)
+    snapshot = load_snapshot(args)
+    processes = max(1, args.processes)
+    # Large enough chunks to keep IPC overhead low, small enough to balance the load at the end
+    chunksize = args.chunksize or max(1, min(64, len(sources) // (processes * 4)))
+    outputs = {'parquet': (ParquetOutput, 'rows'), 'ixbrl': (IxbrlOutput, 'ixbrl'), 'jsonl': (JsonlOutput, 'json')}
+    output_class, output = outputs[output_format]
+    out = output_class(args.output)
+    print(f"🚀 {len(sources)} filer, {processes} processer, {chunksize} filer per uppgift, "
+          f"mappningar {snapshot.version}")
+    started = time.perf_counter()
+    last_report = started
+    done = 0
+    failures = []
+    try:
+        for result in iter_results(sources, snapshot, output, processes, chunksize,
+                                   args.output if output_format == 'ixbrl' else None):
+            done += 1
+            if result["ok"]:
+                out.write(result["data"])
+            else:
+                failures.append(result)
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"   {done}/{len(sources)} filer, {done / (now - started):.1f} filer/s, "
+                      f"{len(failures)} misslyckade")
+    finally:
+        out.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {done - len(failures)} filer klara på {elapsed:.1f} s "
+          f"({done / elapsed if elapsed else 0.0:.1f} filer/s) -> {args.output}")
+    if failures:
+        print(f"❌ {len(failures)} filer misslyckades:")
+        for failure in failures:
+            print(f"   {failure['file']}: {failure['error']}")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
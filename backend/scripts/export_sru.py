@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Export INK2 for a batch of companies as SRU files (INFO.SRU + BLANKETTER.SRU)
+
+Usage:
+    python scripts/export_sru.py sie/ --output sru/ --orgnr 556610-3643 \
+        --name "Byrån AB" --postnr "111 22" --postort Stockholm
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+
+def main():
+    load_dotenv()
+    arg_parser = argparse.ArgumentParser(description="SRU-export av INK2 för många bolag")
+    arg_parser.add_argument('inputs', nargs='+', help="SE-filer, kataloger eller zip-arkiv med SE-filer")
+    arg_parser.add_argument('--output', default='sru', help="Katalog för INFO.SRU och BLANKETTER.SRU")
+    arg_parser.add_argument('--orgnr', required=True, help="Uppgiftslämnarens organisationsnummer")
+    arg_parser.add_argument('--name', required=True, help="Uppgiftslämnarens namn")
+    arg_parser.add_argument('--postnr', required=True)
+    arg_parser.add_argument('--postort', required=True)
+    arg_parser.add_argument('--adress')
+    arg_parser.add_argument('--kontakt')
+    arg_parser.add_argument('--email')
+    arg_parser.add_argument('--telefon')
+    arg_parser.add_argument('--snapshot', help="Mappningar från fil (se batch_process.py --save-snapshot)")
+    arg_parser.add_argument('--processes', type=int, default=None, help="Antal processer (standard: alla kärnor)")
+    arg_parser.add_argument('--chunksize', type=int, default=8, help="Filer per arbetsuppgift")
+    args = arg_parser.parse_args()
+
+    from services.mapping_snapshot import load_mapping_snapshot, read_snapshot_file
+    from services.batch_pipeline import collect_se_sources
+    from services.sru_export import SruSender, export_sru_batch
+
+    sources = collect_se_sources(args.inputs)
+    if not sources:
+        print("❌ Inga SE-filer hittades")
+        sys.exit(1)
+
+    # Mappings are loaded once; every file in the batch is calculated with the same snapshot
+    if args.snapshot:
+        snapshot = read_snapshot_file(args.snapshot)
+    else:
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+        if not url or not key:
+            print("❌ Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY/ANON_KEY (or use --snapshot)")
+            sys.exit(1)
+        from supabase import create_client
+        snapshot = load_mapping_snapshot(create_client(url, key))
+
+    sender = SruSender(
+        organization_number=args.orgnr, name=args.name, postal_code=args.postnr, city=args.postort,
+        address=args.adress, contact=args.kontakt, email=args.email, phone=args.telefon
+    )
+    result = export_sru_batch(sources, args.output, sender, snapshot,
+                              processes=args.processes, chunksize=args.chunksize)
+
+    print(f"✅ {result.exported} blanketter skrivna till {result.output_dir} "
+          f"({result.seconds:.1f} s, {result.files_per_second:.1f} filer/s)")
+    if result.failures:
+        print(f"❌ {len(result.failures)} filer misslyckades:")
+        for failure in result.failures:
+            print(f"   {failure['file']}: {failure['error']}")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
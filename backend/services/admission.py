@@ -0,0 +1,229 @@
+"""
+Admission control for CPU-bound endpoints
+Each kind of work (upload, bulk upload, recalculation, export) has its own gate:
+at most `concurrency` requests run at once, at most `per_user` of them (running
+or queued) belong to one client, and up to `queue` more wait in line for at most
+`max_wait` seconds. Anything beyond that is rejected right away with a Retry-After
+estimate (429), so a burst of large uploads is throttled instead of exhausting
+memory, and interactive recalculations never wait behind uploads.
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Iterator, Deque, Tuple, Union
+
+from starlette.concurrency import iterate_in_threadpool
+
+# name -> "concurrency,per_user,queue,max_wait" (override with ADMISSION_<NAME>)
+# Together they stay well below the threadpool's 40 threads, so throttled work can't starve other routes
+DEFAULT_GATES = {
+    "upload": "4,2,16,15",
+    "bulk_upload": "1,1,2,5",
+    "recalc": "16,8,64,2",
+    "export": "2,1,8,10",
+}
+# Retry-After bounds in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 120
+
+
+class AdmissionRejected(Exception):
+    """The gate is saturated (or the client is over its quota); retry after retry_after seconds"""
+
+    def __init__(self, gate: str, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.gate = gate
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's slot; release() is idempotent (`with ticket:` releases on exit)"""
+
+    __slots__ = ('gate', 'user', 'admitted_at', 'released')
+
+    def __init__(self, gate: "AdmissionGate", user: str):
+        self.gate = gate
+        self.user = user
+        self.admitted_at = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.gate._release(self.user, time.perf_counter() - self.admitted_at)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionGate:
+    """Concurrency limit with per-user quota and a bounded FIFO queue with deadlines (event loop only)"""
+
+    def __init__(self, name: str, concurrency: int, per_user: int, queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.per_user = max(1, per_user)
+        self.queue_limit = max(0, queue)
+        self.max_wait = max_wait
+        self.running = 0
+        self._waiters: Deque[Tuple[asyncio.Future, str]] = deque()
+        # Running + queued requests per client
+        self._users: Dict[str, int] = {}
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._avg_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_env(cls, name: str, default: str) -> "AdmissionGate":
+        concurrency, per_user, queue, max_wait = os.getenv(f'ADMISSION_{name.upper()}', default).split(',')
+        return cls(name, int(concurrency), int(per_user), int(queue), float(max_wait))
+
+    def retry_after(self, ahead: Optional[int] = None) -> int:
+        """Seconds until a slot is likely free with `ahead` requests in front (default: the queue)"""
+        ahead = len(self._waiters) if ahead is None else ahead
+        seconds = self._avg_seconds * (ahead + 1) / self.concurrency
+        return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(seconds)))
+
+    def _reject(self, reason: str, retry_after: int) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(self.name, reason, retry_after)
+
+    async def acquire(self, user: str) -> Ticket:
+        """Wait for a slot (at most max_wait seconds); raises AdmissionRejected"""
+        if self._users.get(user, 0) >= self.per_user:
+            raise self._reject(f"För många samtidiga förfrågningar (max {self.per_user} per användare)",
+                               self.retry_after(0))
+        if self.running < self.concurrency and not self._waiters:
+            self._enter(user)
+            self.running += 1
+            return self._admit(user)
+        if len(self._waiters) >= self.queue_limit:
+            raise self._reject("Servern är upptagen, försök igen senare", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, user)
+        self._waiters.append(entry)
+        self._enter(user)
+        granted = False
+        try:
+            # asyncio.wait leaves the waiter alone, so a slot handed over at the deadline isn't lost
+            await asyncio.wait((waiter,), timeout=self.max_wait)
+            granted = waiter.done()
+        finally:
+            if not granted:
+                if waiter.done():
+                    # Got the slot while being cancelled (client went away) - pass it on
+                    self._release(user, 0.0)
+                else:
+                    waiter.cancel()
+                    self._waiters.remove(entry)
+                    self._leave(user)
+        if not granted:
+            self.timed_out += 1
+            raise self._reject(f"Ingen ledig plats inom {self.max_wait:g} s, försök igen senare",
+                               self.retry_after())
+        return self._admit(user)
+
+    def _admit(self, user: str) -> Ticket:
+        self.admitted += 1
+        return Ticket(self, user)
+
+    def _enter(self, user: str):
+        self._users[user] = self._users.get(user, 0) + 1
+
+    def _leave(self, user: str):
+        count = self._users.get(user, 0) - 1
+        if count > 0:
+            self._users[user] = count
+        else:
+            self._users.pop(user, None)
+
+    def _release(self, user: str, seconds: float):
+        self._leave(user)
+        if seconds:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+        # Hand the slot straight to the next waiter so nobody can cut in line
+        while self._waiters:
+            waiter, _ = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "per_user": self.per_user,
+            "running": self.running,
+            "queued": len(self._waiters),
+            "max_queue": self.queue_limit,
+            "max_wait": self.max_wait,
+            "avg_seconds": round(self._avg_seconds, 3),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+def client_key(request) -> str:
+    """The client a request counts against: X-User-Id if sent, otherwise the caller's address"""
+    user_id = request.headers.get('x-user-id')
+    if user_id:
+        return f"user:{user_id}"
+    # Behind the proxy the first X-Forwarded-For entry is the real client
+    forwarded = request.headers.get('x-forwarded-for')
+    if forwarded:
+        return f"ip:{forwarded.split(',')[0].strip()}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class AdmissionController:
+    """The gates by name"""
+
+    def __init__(self, gates: Dict[str, AdmissionGate]):
+        self.gates = gates
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls({name: AdmissionGate.from_env(name, default) for name, default in DEFAULT_GATES.items()})
+
+    async def acquire(self, gate: str, request) -> Ticket:
+        return await self.gates[gate].acquire(client_key(request))
+
+    async def run(self, gate: str, request, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        await fn() holding a slot. Use it as the computation of a SingleFlight so only
+        the request doing the work is admitted; coalesced duplicates just wait for it.
+        """
+        with await self.acquire(gate, request):
+            return await fn()
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: gate.stats() for name, gate in self.gates.items()}
+
+
+async def release_after(ticket: Ticket, body: Union[AsyncIterator, Iterator]) -> AsyncIterator:
+    """
+    Streaming response body that keeps the slot until the stream ends or the client disconnects.
+    Also pass BackgroundTask(ticket.release) to the response: a body that is never started has no finally.
+    """
+    if not hasattr(body, '__aiter__'):
+        # Plain generators run in the threadpool, as StreamingResponse would run them
+        body = iterate_in_threadpool(body)
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        ticket.release()
+
+
+# Global instance shared by the API routes
+admission = AdmissionController.from_env()
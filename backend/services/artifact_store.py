@@ -0,0 +1,243 @@
+"""
+Content-addressed store for generated reports
+PDFs are stored once per SHA-256 of their content under reports/objects/, and
+report ids point at them. Reports are also indexed by a hash of their inputs
+(SE file, mapping version, user input), so an identical request can reuse an
+existing PDF instead of regenerating it. Rendered report sections are stored
+the same way, keyed by their inputs, so only changed sections are re-rendered.
+The store is kept under a disk quota by deleting the least recently
+downloaded/generated artifacts.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access);
+CREATE TABLE IF NOT EXISTS report_artifacts (
+    report_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    input_key TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS report_artifacts_sha256 ON report_artifacts (sha256);
+CREATE INDEX IF NOT EXISTS report_artifacts_input_key ON report_artifacts (input_key);
+CREATE TABLE IF NOT EXISTS section_artifacts (
+    section_key TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS section_artifacts_sha256 ON section_artifacts (sha256);
+"""
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class Artifact:
+    """A stored report: where its content lives and the content hash (used as ETag)"""
+    report_id: str
+    sha256: Optional[str]  # None for reports written before the store existed
+    path: str
+    size: int
+
+
+class ArtifactStore:
+    """Report PDFs on disk, deduplicated by content hash and bounded by REPORT_STORE_MAX_BYTES"""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.getenv('REPORTS_DIR', 'reports')
+        self.max_bytes = max_bytes or int(os.getenv('REPORT_STORE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.index_path = os.path.join(self.root, 'artifacts.sqlite3')
+        self._local = threading.local()
+        self.deduplicated = 0
+        self.evicted = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}.pdf")
+
+    def _store_blob(self, conn: sqlite3.Connection, path: str, keep_source: bool) -> Tuple[str, int, str, float]:
+        """Add a file's content to objects/ (once per content hash); returns (sha256, size, blob path, now)"""
+        sha256 = file_sha256(path)
+        size = os.path.getsize(path)
+        target = self.blob_path(sha256)
+        if os.path.exists(target):
+            if not keep_source:
+                os.remove(path)
+            self.deduplicated += 1
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Write next to the target first so the final rename is atomic
+            staging = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if keep_source:
+                shutil.copyfile(path, staging)
+            else:
+                shutil.move(path, staging)
+            os.replace(staging, target)
+
+        now = time.time()
+        conn.execute(
+            'INSERT INTO artifacts (sha256, size, created_at, last_access) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(sha256) DO UPDATE SET last_access = excluded.last_access',
+            (sha256, size, now, now)
+        )
+        return sha256, size, target, now
+
+    def put_file(self, path: str, report_id: str, input_key: Optional[str] = None) -> Artifact:
+        """Move a generated file into the store (dropping it if identical content is already stored)"""
+        conn = self._connect()
+        sha256, size, target, now = self._store_blob(conn, path, keep_source=False)
+        self._link(conn, report_id, sha256, input_key, now)
+        self._evict(conn, keep=sha256)
+        return Artifact(report_id, sha256, target, size)
+
+    def put_section(self, path: str, section_key: str) -> str:
+        """Store a copy of a rendered section under its input key; the file itself stays in place"""
+        conn = self._connect()
+        sha256, _, _, now = self._store_blob(conn, path, keep_source=True)
+        conn.execute(
+            'INSERT OR REPLACE INTO section_artifacts (section_key, sha256, created_at) VALUES (?, ?, ?)',
+            (section_key, sha256, now)
+        )
+        self._evict(conn, keep=sha256)
+        return sha256
+
+    def copy_section(self, section_key: str, destination: str) -> bool:
+        """Copy the stored section rendered from the same inputs to destination; False if there is none"""
+        conn = self._connect()
+        row = conn.execute('SELECT sha256 FROM section_artifacts WHERE section_key = ?', (section_key,)).fetchone()
+        if row is None:
+            return False
+        try:
+            shutil.copyfile(self.blob_path(row[0]), destination)
+        except FileNotFoundError:
+            self._delete(conn, row[0])
+            return False
+        conn.execute('UPDATE artifacts SET last_access = ? WHERE sha256 = ?', (time.time(), row[0]))
+        return True
+
+    def link(self, report_id: str, artifact: Artifact, input_key: Optional[str] = None) -> Artifact:
+        """Give an already stored artifact another report id"""
+        now = time.time()
+        conn = self._connect()
+        self._link(conn, report_id, artifact.sha256, input_key, now)
+        conn.execute('UPDATE artifacts SET last_access = ? WHERE sha256 = ?', (now, artifact.sha256))
+        return Artifact(report_id, artifact.sha256, artifact.path, artifact.size)
+
+    def _link(self, conn: sqlite3.Connection, report_id: str, sha256: str, input_key: Optional[str], now: float):
+        conn.execute(
+            'INSERT OR REPLACE INTO report_artifacts (report_id, sha256, input_key, created_at) VALUES (?, ?, ?, ?)',
+            (report_id, sha256, input_key, now)
+        )
+
+    def find_by_input(self, input_key: str) -> Optional[Artifact]:
+        """Most recent report generated from the same inputs, if its file is still stored"""
+        row = self._connect().execute(
+            'SELECT r.report_id, a.sha256, a.size FROM report_artifacts r JOIN artifacts a ON a.sha256 = r.sha256 '
+            'WHERE r.input_key = ? ORDER BY r.created_at DESC LIMIT 1',
+            (input_key,)
+        ).fetchone()
+        return self._existing(row)
+
+    def resolve(self, report_id: str) -> Optional[Artifact]:
+        """Stored artifact for a report id; counts as an access for the LRU"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT r.report_id, a.sha256, a.size FROM report_artifacts r JOIN artifacts a ON a.sha256 = r.sha256 '
+            'WHERE r.report_id = ?',
+            (report_id,)
+        ).fetchone()
+        artifact = self._existing(row)
+        if artifact is not None:
+            conn.execute('UPDATE artifacts SET last_access = ? WHERE sha256 = ?', (time.time(), artifact.sha256))
+        return artifact
+
+    def _existing(self, row) -> Optional[Artifact]:
+        if row is None:
+            return None
+        report_id, sha256, size = row
+        path = self.blob_path(sha256)
+        if not os.path.exists(path):
+            # Removed behind our back (or by another worker's eviction) - forget it
+            self._delete(self._connect(), sha256)
+            return None
+        return Artifact(report_id, sha256, path, size)
+
+    def _delete(self, conn: sqlite3.Connection, sha256: str):
+        conn.execute('DELETE FROM report_artifacts WHERE sha256 = ?', (sha256,))
+        conn.execute('DELETE FROM section_artifacts WHERE sha256 = ?', (sha256,))
+        conn.execute('DELETE FROM artifacts WHERE sha256 = ?', (sha256,))
+        try:
+            os.remove(self.blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, conn: sqlite3.Connection, keep: Optional[str] = None):
+        """Delete least recently used artifacts until the store fits the disk quota"""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for sha256, size in conn.execute('SELECT sha256, size FROM artifacts ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            # Downloads already in progress keep reading from their open file handle
+            self._delete(conn, sha256)
+            total -= size
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Store info for the health endpoint"""
+        try:
+            artifacts, total = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts'
+            ).fetchone()
+            reports = self._connect().execute('SELECT COUNT(*) FROM report_artifacts').fetchone()[0]
+            sections = self._connect().execute('SELECT COUNT(*) FROM section_artifacts').fetchone()[0]
+        except Exception as e:
+            return {"root": self.root, "error": str(e)}
+        return {
+            "root": self.root,
+            "artifacts": artifacts,
+            "reports": reports,
+            "sections": sections,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "deduplicated": self.deduplicated,
+            "evicted": self.evicted,
+        }
+
+
+# Global instance shared by the report generator and the download route
+artifact_store = ArtifactStore()
@@ -0,0 +1,268 @@
+"""
+Batch processing of SE files outside the API
+Many SE files are parsed and evaluated (RR/BR/INK2) in a process pool. Each
+worker builds its own DatabaseParser once from a plain-data copy of the mapping
+snapshot, so the workers never talk to the database and every file in a batch
+is calculated with the same mappings. Results are JSONL lines, long-format amount
+rows or one iXBRL document per file (see process_source).
+"""
+
+import os
+import glob
+import time
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Iterable
+
+import orjson
+
+from services.mapping_snapshot import MappingSnapshot
+from services.parsed_se import ParsedSE
+from services.report_rows import ReportRow, Ink2Row, rows_to_dicts
+
+# Set in each worker process by init_worker
+_worker_parser = None
+# Zip archives opened by this process, kept open for the next member
+_open_archives: Dict[str, zipfile.ZipFile] = {}
+
+
+def init_worker(snapshot_payload: Dict[str, Any]):
+    """Process pool initializer: build the worker's parser from MappingSnapshot.to_payload()"""
+    global _worker_parser
+    # Archives opened by the parent share their file offset with a forked worker; open our own
+    _open_archives.clear()
+    # Imported here so the parent only pays for the parser module if it evaluates files itself
+    from services.database_parser import DatabaseParser
+    _worker_parser = DatabaseParser(MappingSnapshot.from_payload(snapshot_payload))
+
+
+def worker_parser():
+    if _worker_parser is None:
+        raise RuntimeError("Batch worker not initialized (init_worker was not called)")
+    return _worker_parser
+
+
+def create_pool(snapshot: MappingSnapshot, processes: Optional[int] = None) -> ProcessPoolExecutor:
+    """Process pool whose workers all evaluate with the given snapshot"""
+    # Loaded before the workers start so forked workers inherit it instead of importing it each
+    import services.database_parser  # noqa: F401
+    return ProcessPoolExecutor(
+        max_workers=processes or os.cpu_count() or 1,
+        initializer=init_worker,
+        initargs=(snapshot.to_payload(),)
+    )
+
+
+class SnapshotPool:
+    """
+    Lazily started pool for long-running processes (the API). The workers hold the
+    mappings they were started with, so a new pool is started when the snapshot
+    version changes; tasks already running on the old pool finish there.
+    """
+
+    def __init__(self, processes: Optional[int] = None):
+        self.processes = processes if processes is not None else min(4, os.cpu_count() or 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def executor(self, snapshot: MappingSnapshot) -> ProcessPoolExecutor:
+        with self._lock:
+            old = None
+            if self._executor is None or self._version != snapshot.version:
+                old = self._executor
+                self._executor = create_pool(snapshot, self.processes)
+                self._version = snapshot.version
+            executor = self._executor
+        if old is not None:
+            old.shutdown(wait=False)
+        return executor
+
+    def reset(self, executor: ProcessPoolExecutor):
+        """Drop a broken pool so the next call starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+@dataclass(slots=True)
+class EvaluatedSE:
+    """A parsed SE file with its RR, BR and INK2 rows"""
+    parsed: ParsedSE
+    rr_rows: List[ReportRow]
+    br_rows: List[ReportRow]
+    ink2_rows: List[Ink2Row]
+
+
+def evaluate_se_bytes(raw: bytes, parser=None) -> EvaluatedSE:
+    """Parse one SE file and calculate RR/BR/INK2 the same way as the upload route (nothing is stored)"""
+    parser = parser or worker_parser()
+    parsed = ParsedSE.from_bytes(raw, parser)
+    rr_rows = parser.evaluate_rr_rows(parsed.current_accounts, parsed.previous_accounts)
+    br_rows = parser.evaluate_br_rows(parsed.current_accounts, parsed.previous_accounts, rr_rows)
+    # INK2 formulas read RR as dicts. Account details only drive the UI's SHOW popups;
+    # skipping them keeps workers off the database
+    ink2_rows = parser.evaluate_ink2_rows(parsed.current_accounts, parsed.fiscal_year, rows_to_dicts(rr_rows), br_rows,
+                                          account_details={})
+    return EvaluatedSE(parsed, rr_rows, br_rows, ink2_rows)
+
+
+def evaluate_se_file(path: str, parser=None) -> EvaluatedSE:
+    with open(path, 'rb') as f:
+        return evaluate_se_bytes(f.read(), parser)
+
+
+@dataclass(frozen=True, slots=True)
+class SeSource:
+    """An SE file on disk, or a member of a zip archive"""
+    path: str
+    member: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.path}!{self.member}" if self.member else self.path
+
+    def read(self) -> bytes:
+        if self.member is None:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        archive = _open_archives.get(self.path)
+        if archive is None:
+            archive = _open_archives[self.path] = zipfile.ZipFile(self.path)
+        return archive.read(self.member)
+
+
+def is_se_filename(name: str) -> bool:
+    return name.lower().endswith('.se') and not os.path.basename(name).startswith('.')
+
+
+def collect_se_sources(inputs: Iterable[str]) -> List[SeSource]:
+    """SE files given directly, found in directories or contained in zip archives, in sorted order"""
+    sources: List[SeSource] = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = glob.glob(os.path.join(item, '**', '*'), recursive=True)
+            for path in sorted(found):
+                if is_se_filename(path):
+                    sources.append(SeSource(path))
+                elif zipfile.is_zipfile(path):
+                    sources.extend(zip_sources(path))
+        elif zipfile.is_zipfile(item):
+            sources.extend(zip_sources(item))
+        else:
+            sources.append(SeSource(item))
+    return sources
+
+
+def zip_sources(path: str) -> List[SeSource]:
+    with zipfile.ZipFile(path) as archive:
+        return [SeSource(path, info.filename) for info in archive.infolist()
+                if not info.is_dir() and is_se_filename(info.filename)]
+
+
+def result_record(source_name: str, evaluated: EvaluatedSE, seconds: float) -> Dict[str, Any]:
+    """Result for one file as plain data (one JSONL line)"""
+    parsed = evaluated.parsed
+    return {
+        "file": source_name,
+        "ok": True,
+        "upload_id": parsed.upload_id,
+        "company_info": parsed.company_info,
+        "periods": {str(index): {"start": period.start, "end": period.end} for index, period in parsed.periods.items()},
+        "rr_data": rows_to_dicts(evaluated.rr_rows),
+        "br_data": rows_to_dicts(evaluated.br_rows),
+        "ink2_data": rows_to_dicts(evaluated.ink2_rows),
+        "seconds": round(seconds, 4),
+    }
+
+
+def amount_rows(source_name: str, evaluated: EvaluatedSE) -> List[tuple]:
+    """Result for one file in long format: one tuple per report row (see AMOUNT_COLUMNS)"""
+    info = evaluated.parsed.company_info
+    prefix = (source_name, info.get('organization_number'), info.get('company_name'), info.get('fiscal_year'))
+    rows = []
+    for report, items in (('RR', evaluated.rr_rows), ('BR', evaluated.br_rows)):
+        for row in items:
+            rows.append(prefix + (report, row.meta.get('id'), row.variable_name, row.meta.get('label'),
+                                  row.current_amount, row.previous_amount))
+    for row in evaluated.ink2_rows:
+        rows.append(prefix + ('INK2', row.meta.get('row_id'), row.meta.get('variable_name'),
+                              row.meta.get('row_title'), row.amount, None))
+    return rows
+
+
+AMOUNT_COLUMNS = ('file', 'organization_number', 'company_name', 'fiscal_year',
+                  'report', 'row_id', 'variable_name', 'label', 'current_amount', 'previous_amount')
+
+
+def ixbrl_filename(source: SeSource, evaluated: EvaluatedSE) -> str:
+    """<file name>_<start of content hash>.xhtml, unique even for equally named files in different folders"""
+    base = os.path.splitext(os.path.basename(source.member or source.path))[0]
+    return f"{base}_{evaluated.parsed.upload_id[:12]}.xhtml"
+
+
+def write_ixbrl(source: SeSource, evaluated: EvaluatedSE, output_dir: str, parser=None) -> str:
+    """Write the iXBRL document for one evaluated file to output_dir and return its path"""
+    from services.ixbrl_export import export_ixbrl_file, xbrl_concepts
+    parsed = evaluated.parsed
+    if parsed.current_period is None:
+        raise ValueError("Räkenskapsår (#RAR 0) saknas i SE-filen")
+    snapshot = (parser or worker_parser()).snapshot
+    return export_ixbrl_file(
+        os.path.join(output_dir, ixbrl_filename(source, evaluated)),
+        evaluated.rr_rows, evaluated.br_rows,
+        xbrl_concepts(snapshot.rr_compiled), xbrl_concepts(snapshot.br_compiled),
+        parsed.company_info, parsed.periods
+    )
+
+
+def process_source(source: SeSource, output: str = 'json', parser=None,
+                   output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Evaluate one source in a worker. The result is returned ready to write:
+    'json' gives the JSONL line as bytes, 'rows' the long-format tuples and
+    'ixbrl' the path of the document the worker wrote to output_dir.
+    Errors are returned, not raised, so one bad file doesn't stop the batch.
+    """
+    started = time.perf_counter()
+    try:
+        evaluated = evaluate_se_bytes(source.read(), parser)
+        if output == 'rows':
+            data = amount_rows(source.name, evaluated)
+        elif output == 'ixbrl':
+            data = write_ixbrl(source, evaluated, output_dir, parser)
+        else:
+            # Serialized in the worker so the parent only writes bytes
+            data = orjson.dumps(result_record(source.name, evaluated, time.perf_counter() - started))
+        return {"file": source.name, "ok": True, "data": data}
+    except Exception as e:
+        return {"file": source.name, "ok": False, "error": str(e)}
+
+
+def evaluate_upload(name: str, raw: bytes, parser=None) -> Dict[str, Any]:
+    """
+    Upload-style result for one file (bulk upload): result_record plus the accounts
+    needed for recalculation. Errors are returned, not raised.
+    """
+    started = time.perf_counter()
+    try:
+        evaluated = evaluate_se_bytes(raw, parser)
+        record = result_record(name, evaluated, time.perf_counter() - started)
+        record.update({
+            "current_accounts": evaluated.parsed.current_accounts,
+            "rr_count": len(record["rr_data"]),
+            "br_count": len(record["br_data"]),
+            "ink2_count": len(record["ink2_data"]),
+        })
+        return record
+    except Exception as e:
+        return {"file": name, "ok": False, "error": str(e)}
@@ -0,0 +1,132 @@
+"""
+Bulk upload of SE files
+Many .se files, or zip archives of them, are evaluated in a process pool and the
+per-file results are streamed back as NDJSON lines as soon as each file is done,
+so the first results arrive while the rest of the batch is still running. Zip
+entries are read one at a time from the uploaded archive; nothing is extracted.
+"""
+
+import os
+import time
+import asyncio
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Optional, Iterator, AsyncIterator, Callable, Tuple
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+
+from services.batch_pipeline import SnapshotPool, evaluate_upload, is_se_filename
+
+BULK_UPLOAD_MAX_FILES = int(os.getenv('BULK_UPLOAD_MAX_FILES', '500'))
+# Larger zip entries are rejected before they are read (guards against zip bombs)
+BULK_UPLOAD_MAX_ENTRY_BYTES = int(os.getenv('BULK_UPLOAD_MAX_ENTRY_BYTES', str(50 * 1024 * 1024)))
+
+# Worker processes shared by all bulk uploads (0/1 evaluates in the threadpool instead)
+bulk_upload_pool = SnapshotPool(int(os.getenv('BULK_UPLOAD_PROCESSES', str(min(4, os.cpu_count() or 1)))))
+
+# (name, raw bytes, error) - raw is None when the entry could not be read
+UploadEntry = Tuple[str, Optional[bytes], Optional[str]]
+
+
+def iter_upload_entries(files: List[Any]) -> Iterator[UploadEntry]:
+    """SE files from the uploaded files and zip archives, read one at a time (blocking)"""
+    for upload in files:
+        name = upload.filename or 'upload'
+        if is_se_filename(name):
+            upload.file.seek(0)
+            yield name, upload.file.read(), None
+            continue
+        if not name.lower().endswith('.zip'):
+            yield name, None, "Endast .SE-filer och zip-arkiv accepteras"
+            continue
+        try:
+            upload.file.seek(0)
+            archive = zipfile.ZipFile(upload.file)
+        except zipfile.BadZipFile:
+            yield name, None, "Ogiltigt zip-arkiv"
+            continue
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_se_filename(info.filename):
+                    continue
+                entry_name = f"{name}!{info.filename}"
+                if info.file_size > BULK_UPLOAD_MAX_ENTRY_BYTES:
+                    yield entry_name, None, f"Filen är för stor (max {BULK_UPLOAD_MAX_ENTRY_BYTES} byte)"
+                    continue
+                try:
+                    yield entry_name, archive.read(info), None
+                except Exception as e:
+                    yield entry_name, None, f"Kunde inte läsa filen ur arkivet: {e}"
+
+
+def _line(data: Dict[str, Any]) -> bytes:
+    return orjson.dumps(data) + b'\n'
+
+
+async def stream_bulk_upload(files: List[Any], parser, pool: SnapshotPool,
+                             store: Optional[Callable[[Dict[str, Any]], Any]] = None) -> AsyncIterator[bytes]:
+    """
+    NDJSON lines, one per SE file in completion order ({"index", "file", "ok", ...}),
+    followed by a summary line ({"done": true, ...}).
+    At most two files per worker are read and in flight at a time. store(record)
+    is called in the threadpool for each successful file before its line is sent.
+    """
+    started = time.perf_counter()
+    entries = iter_upload_entries(files)
+    inline = pool.processes <= 1 or parser.snapshot is None
+    executor = None if inline else pool.executor(parser.snapshot)
+    window = max(1, pool.processes) * 2
+    pending: Dict[asyncio.Future, Tuple[int, str]] = {}
+    count = ok = 0
+    exhausted = False
+
+    def submit(name: str, raw: bytes) -> asyncio.Future:
+        if inline:
+            # BULK_UPLOAD_PROCESSES=0/1: evaluate in the threadpool with the request's parser
+            return asyncio.ensure_future(run_in_threadpool(evaluate_upload, name, raw, parser))
+        return asyncio.wrap_future(executor.submit(evaluate_upload, name, raw))
+
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                entry = await run_in_threadpool(next, entries, None)
+                if entry is None:
+                    exhausted = True
+                    break
+                name, raw, error = entry
+                if count >= BULK_UPLOAD_MAX_FILES:
+                    yield _line({"index": count, "file": name, "ok": False,
+                                 "error": f"För många filer (max {BULK_UPLOAD_MAX_FILES})"})
+                    exhausted = True
+                    break
+                count += 1
+                if error is not None:
+                    yield _line({"index": count - 1, "file": name, "ok": False, "error": error})
+                    continue
+                pending[submit(name, raw)] = (count - 1, name)
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index, name = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. out of memory); the next request gets a fresh pool
+                    pool.reset(executor)
+                    result = {"file": name, "ok": False, "error": "Beräkningen avbröts (arbetsprocessen avslutades)"}
+                if result["ok"]:
+                    ok += 1
+                    if store is not None:
+                        await run_in_threadpool(store, result)
+                yield _line({"index": index, **result})
+
+        yield _line({"done": True, "files": count, "succeeded": ok, "failed": count - ok,
+                     "seconds": round(time.perf_counter() - started, 3)})
+    finally:
+        # Client disconnected or the stream failed - don't keep calculating for nobody
+        for future in pending:
+            future.cancel()
+        entries.close()
@@ -0,0 +1,350 @@
+"""
+Compiled mapping rows
+Everything the calculation engine derives from a mapping row (levels, normalized
+flags, parsed account specs, sign handling) is computed once per mapping snapshot,
+so the per-request work is only summing balances and evaluating formulas.
+"""
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+# Style -> hierarchy level (S1-S3 were replaced by H4 and share its level)
+STYLE_LEVELS = {
+    'H0': 0,
+    'H1': 1,
+    'H2': 2,
+    'H3': 3,
+    'H4': 4,
+    'NORMAL': 4,
+    'S1': 4,
+    'S2': 4,
+    'S3': 4
+}
+BOLD_STYLES = {'H0', 'H1', 'H2', 'H4'}
+
+# INK2 variables summed from accounts that are always reported as positive amounts
+POSITIVE_ONLY_INK2_VARIABLES = frozenset({
+    'INK4.3c', 'INK4.4a', 'INK4.5b', 'INK4.5c',
+    'INK4.6a', 'INK4.6c', 'INK4.21'
+})
+
+# Account range whose SE balances have the opposite sign of the report
+REVERSED_ACCOUNT_RANGE = (2000, 8989)
+
+# An account term is either a single account id or an inclusive (start, end) range
+AccountTerm = Union[str, Tuple[int, int]]
+
+
+def level_from_style(style: str) -> int:
+    """Get hierarchy level from style"""
+    return STYLE_LEVELS.get(style, 4)
+
+
+def normalize_flag(value: Any) -> bool:
+    """Normalize a boolean column. Handles string 'TRUE'/'FALSE' from database."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.upper() == 'TRUE'
+    return bool(value)
+
+
+def normalize_always_show(value: Any) -> Any:
+    """Normalize always_show to boolean or null values."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        normalized = value.strip().upper()
+        if normalized == 'TRUE':
+            return True
+        elif normalized == 'FALSE':
+            return False
+        else:
+            return None  # Empty/null means conditional (show if amount != 0)
+    return None  # Default to conditional
+
+
+def balance_type(mapping: Dict[str, Any]) -> str:
+    """Get balance type (asset/liability/equity) from mapping"""
+    value = mapping.get('balance_type', 'DEBIT')
+
+    # Simple mapping - you might need to refine this based on your BR structure
+    if value == 'DEBIT':
+        return 'asset'
+    elif value == 'CREDIT':
+        # Determine if it's liability or equity based on account ranges
+        start = mapping.get('accounts_included_start', 0)
+        if start and start >= 2000:  # Equity accounts typically start at 2000+
+            return 'equity'
+        else:
+            return 'liability'
+    else:
+        return 'asset'  # Default
+
+
+def row_metadata(mapping: Dict[str, Any], section: str) -> Dict[str, Any]:
+    """Static RR/BR row fields that only depend on the mapping"""
+    style = mapping.get('style')
+    metadata = {
+        'id': mapping.get('row_id'),
+        'label': mapping.get('row_title'),
+        'level': level_from_style(style),
+        'section': section,
+        'bold': style in BOLD_STYLES,
+        'style': style,
+        'variable_name': mapping.get('variable_name'),
+        'is_calculated': mapping.get('is_calculated'),
+        'calculation_formula': mapping.get('calculation_formula'),
+        'show_amount': mapping.get('show_amount'),
+        'block_group': mapping.get('block_group'),
+        'always_show': normalize_always_show(mapping.get('always_show', False))
+    }
+    if section == 'BR':
+        metadata['type'] = balance_type(mapping)
+    return metadata
+
+
+def ink2_row_metadata(mapping: Dict[str, Any]) -> Dict[str, Any]:
+    """Static INK2 row fields that only depend on the mapping"""
+    return {
+        'row_id': mapping.get('row_id'),
+        'row_title': mapping.get('row_title', ''),
+        'variable_name': mapping.get('variable_name', ''),
+        'show_tag': mapping.get('show_tag', False),
+        'accounts_included': mapping.get('accounts_included', ''),
+        'show_amount': normalize_flag(mapping.get('show_amount', True)),
+        'is_calculated': normalize_flag(mapping.get('is_calculated', True)),
+        'always_show': normalize_always_show(mapping.get('always_show', False)),
+        'style': mapping.get('style'),
+        'explainer': mapping.get('explainer', ''),
+        'block': mapping.get('block', ''),
+        'header': mapping.get('header', False)
+    }
+
+
+def parse_account_terms(specs: Optional[str]) -> Tuple[AccountTerm, ...]:
+    """
+    Parse an account list like "6072;6992-6993;7632" into terms, in listed order.
+    Malformed ranges are skipped.
+    """
+    terms: List[AccountTerm] = []
+    for spec in (specs or '').split(';'):
+        spec = spec.strip()
+        if '-' in spec:
+            try:
+                start, end = map(int, spec.split('-'))
+            except ValueError:
+                print(f"Invalid range format: {spec}")
+                continue
+            terms.append((start, end))
+        elif spec:
+            terms.append(spec)
+    return tuple(terms)
+
+
+def _column_range(mapping: Dict[str, Any], start_key: str, end_key: str) -> Tuple[AccountTerm, ...]:
+    start = mapping.get(start_key)
+    end = mapping.get(end_key)
+    return ((start, end),) if start and end else ()
+
+
+@dataclass(frozen=True, slots=True)
+class AccountRule:
+    """Which accounts an RR/BR row sums and how the sign is applied"""
+    included: Tuple[AccountTerm, ...]
+    excluded: Tuple[AccountTerm, ...]
+    should_reverse: bool
+    sign_override: Optional[str]
+
+
+def compile_account_rule(mapping: Dict[str, Any]) -> AccountRule:
+    """Parse the account columns of an RR/BR mapping"""
+    included = _column_range(mapping, 'accounts_included_start', 'accounts_included_end') + parse_account_terms(mapping.get('accounts_included'))
+    excluded = _column_range(mapping, 'accounts_excluded_start', 'accounts_excluded_end') + parse_account_terms(mapping.get('accounts_excluded'))
+
+    # All account balances from 2000-8989 need to be reversed regardless of balance_type;
+    # decided by the first included range/account that falls in that interval
+    low, high = REVERSED_ACCOUNT_RANGE
+    should_reverse = False
+    for term in included:
+        if isinstance(term, tuple):
+            first = term[0]
+        else:
+            try:
+                first = int(term)
+            except ValueError:
+                continue
+        if low <= first <= high:
+            should_reverse = True
+            break
+
+    # Optional explicit sign override from mapping column (e.g., '+/-' or 'sign')
+    sign_override = mapping.get('+/-') or mapping.get('sign') or mapping.get('plus_minus')
+    sign_override = str(sign_override).strip() if sign_override else None
+
+    return AccountRule(included, excluded, should_reverse, sign_override if sign_override in ('+', '-') else None)
+
+
+@dataclass(frozen=True, slots=True)
+class XbrlConcept:
+    """Bolagsverket taxonomy element an RR/BR row is tagged with in iXBRL"""
+    name: str
+    data_type: Optional[str]
+    balance_type: Optional[str]
+    period_type: Optional[str]
+    is_abstract: bool
+
+    @property
+    def is_monetary(self) -> bool:
+        return 'monetary' in (self.data_type or 'monetary').lower()
+
+    @property
+    def is_instant(self) -> bool:
+        return (self.period_type or '').upper() == 'INSTANT'
+
+
+def xbrl_concept(mapping: Dict[str, Any]) -> Optional[XbrlConcept]:
+    """Taxonomy element of a mapping row, if it has one"""
+    name = (mapping.get('element_name') or '').strip()
+    if not name:
+        return None
+    return XbrlConcept(
+        name=name,
+        data_type=mapping.get('data_type'),
+        balance_type=mapping.get('balance_type'),
+        period_type=mapping.get('period_type'),
+        is_abstract=normalize_flag(mapping.get('is_abstract', False))
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledMapping:
+    """A mapping row with everything the engine needs precomputed"""
+    mapping: Dict[str, Any]
+    meta: Dict[str, Any]
+    variable_name: Optional[str]
+    row_id: Any
+    show_amount: bool
+    is_calculated: bool
+    rule: Optional[AccountRule] = None
+    terms: Tuple[AccountTerm, ...] = ()
+    concept: Optional[XbrlConcept] = None
+
+
+def compile_report_mappings(mappings: List[Dict[str, Any]], section: str) -> List[CompiledMapping]:
+    """Compile RR/BR mappings, keeping their order"""
+    return [
+        CompiledMapping(
+            mapping=mapping,
+            meta=row_metadata(mapping, section),
+            variable_name=mapping.get('variable_name'),
+            row_id=mapping.get('row_id'),
+            # The engine uses the raw column truthiness for RR/BR
+            show_amount=bool(mapping.get('show_amount')),
+            is_calculated=bool(mapping.get('is_calculated')),
+            rule=compile_account_rule(mapping),
+            concept=xbrl_concept(mapping)
+        )
+        for mapping in mappings
+    ]
+
+
+def compile_ink2_mappings(mappings: List[Dict[str, Any]]) -> List[CompiledMapping]:
+    """Compile INK2 mappings, sorted by row_id"""
+    return [
+        CompiledMapping(
+            mapping=mapping,
+            meta=ink2_row_metadata(mapping),
+            variable_name=mapping.get('variable_name', ''),
+            row_id=mapping.get('row_id'),
+            show_amount=normalize_flag(mapping.get('show_amount', True)),
+            is_calculated=normalize_flag(mapping.get('is_calculated', True)),
+            terms=parse_account_terms(mapping.get('accounts_included'))
+        )
+        for mapping in sorted(mappings, key=lambda x: x.get('row_id', 0))
+    ]
+
+
+def first_by_variable(mappings: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """variable_name -> first mapping with that name"""
+    index: Dict[str, Dict[str, Any]] = {}
+    for mapping in mappings:
+        variable_name = mapping.get('variable_name')
+        if variable_name is not None and variable_name not in index:
+            index[variable_name] = mapping
+    return index
+
+
+class AccountLedger:
+    """
+    Account balances sorted by account number, so range terms are summed by
+    slicing instead of probing every number in the range. Built once per request.
+    """
+
+    def __init__(self, accounts: Dict[str, float]):
+        self.accounts = accounts
+        entries = []
+        for position, (account_id, balance) in enumerate(accounts.items()):
+            try:
+                number = int(account_id)
+            except (TypeError, ValueError):
+                continue
+            entries.append((number, position, account_id, balance))
+        entries.sort()
+        self._entries = entries
+        self._numbers = [entry[0] for entry in entries]
+        # RR/BR ranges look accounts up by number, so only canonical ids ("1930", not "01930") count there
+        canonical = [(number, balance) for number, _, account_id, balance in entries if account_id == str(number)]
+        self._canonical_numbers = [number for number, _ in canonical]
+        self._canonical_balances = [balance for _, balance in canonical]
+
+    def range_balances(self, start: int, end: int) -> List[float]:
+        """Balances of accounts start..end in account order (canonical account ids only)"""
+        numbers = self._canonical_numbers
+        return self._canonical_balances[bisect_left(numbers, start):bisect_right(numbers, end)]
+
+    def range_balances_in_file_order(self, start: int, end: int) -> List[float]:
+        """Balances of all numeric account ids in the range, in the order they were parsed"""
+        matches = self._entries[bisect_left(self._numbers, start):bisect_right(self._numbers, end)]
+        return [balance for _, _, _, balance in sorted(matches, key=lambda entry: entry[1])]
+
+
+def apply_account_rule(rule: AccountRule, ledger: AccountLedger) -> float:
+    """Sum the included accounts, subtract the excluded ones and apply the sign"""
+    accounts = ledger.accounts
+    total = 0.0
+
+    for term in rule.included:
+        if isinstance(term, tuple):
+            for balance in ledger.range_balances(*term):
+                total += balance
+        elif term in accounts:
+            total += accounts[term]
+
+    for term in rule.excluded:
+        if isinstance(term, tuple):
+            for balance in ledger.range_balances(*term):
+                total -= balance
+        elif term in accounts:
+            total -= accounts[term]
+
+    if rule.sign_override == '+':
+        total = abs(total)
+    elif rule.sign_override == '-':
+        total = -abs(total)
+
+    return -total if rule.should_reverse else total
+
+
+def sum_account_terms(terms: Tuple[AccountTerm, ...], ledger: AccountLedger) -> float:
+    """Sum INK2 account terms (ranges include every numeric account id in the range)"""
+    accounts = ledger.accounts
+    total = 0.0
+    for term in terms:
+        if isinstance(term, tuple):
+            for balance in ledger.range_balances_in_file_order(*term):
+                total += balance
+        else:
+            total += accounts.get(term, 0.0)
+    return total
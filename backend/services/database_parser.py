@@ -4,9 +4,18 @@ Replaces hardcoded BR_STRUCTURE and RR_STRUCTURE with database queries
 """
 
 import os
-from typing import Dict, List, Any, Optional
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Any, Optional, Tuple
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from services.mapping_snapshot import MappingSnapshot, MappingRefresher, AccountTextIndex
+from services.report_rows import ReportRow, Ink2Row, rows_to_dicts, index_by_variable, row_amount
+from services.compiled_mappings import (
+    CompiledMapping, AccountLedger, POSITIVE_ONLY_INK2_VARIABLES,
+    row_metadata, ink2_row_metadata, compile_account_rule, compile_ink2_mappings,
+    apply_account_rule, parse_account_terms, sum_account_terms
+)
 
 # Load environment variables
 load_dotenv()
@@ -14,85 +23,70 @@ load_dotenv()
 # Initialize Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_ANON_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+# Left unset without database settings, so batch runs from a snapshot file work offline
+supabase: Optional[Client] = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
+
+# Background refresher keeps the mapping snapshot up to date (started from main.py lifespan)
+mapping_refresher = MappingRefresher(supabase)
+
+# Variable references in RR/BR formulas (complete names starting with an uppercase letter)
+FORMULA_VARIABLE_PATTERN = re.compile(r'\b([A-Z][a-zA-Z0-9_]*)\b')
 
 class DatabaseParser:
     """Database-driven parser for financial data"""
     
-    def __init__(self):
+    def __init__(self, snapshot: Optional[MappingSnapshot] = None):
+        self.snapshot = None
         self.rr_mappings = None
         self.br_mappings = None
         self.ink2_mappings = None
         self.global_variables = None
-        self.accounts_lookup = None
-        self._load_mappings()
+        self.account_texts = None
+        self.rr_compiled = None
+        self.br_compiled = None
+        self.ink2_compiled = None
+        self.ink2_by_variable = None
+        if snapshot is not None:
+            self._apply_snapshot(snapshot)
+        else:
+            self._use_current_snapshot()
     
-    def _load_mappings(self):
-        """Load variable mappings from database"""
+    def _apply_snapshot(self, snapshot: MappingSnapshot):
+        """Use the mappings from a loaded snapshot"""
+        self.snapshot = snapshot
+        self.rr_mappings = snapshot.rr_mappings
+        self.br_mappings = snapshot.br_mappings
+        self.ink2_mappings = snapshot.ink2_mappings
+        self.global_variables = snapshot.global_variables
+        self.account_texts = snapshot.account_texts
+        self.rr_compiled = snapshot.rr_compiled
+        self.br_compiled = snapshot.br_compiled
+        self.ink2_compiled = snapshot.ink2_compiled
+        self.ink2_by_variable = snapshot.ink2_by_variable
+    
+    def _use_current_snapshot(self):
+        """Use the refresher's current snapshot (only loads if none exists yet)"""
         try:
-            # Load RR mappings
-            rr_response = supabase.table('variable_mapping_rr').select('*').execute()
-            self.rr_mappings = rr_response.data
-            
-            # Load BR mappings
-            br_response = supabase.table('variable_mapping_br').select('*').execute()
-            self.br_mappings = br_response.data
-            
-            # Load INK2 mappings
-            ink2_response = supabase.table('variable_mapping_ink2').select('*').execute()
-            self.ink2_mappings = ink2_response.data
-            
-            # Debug logging for specific problematic variables
-            for mapping in self.ink2_mappings:
-                var_name = mapping.get('variable_name', '')
-                if var_name in ['INK4.15', 'INK4.16', 'INK_bokford_skatt']:
-                    print(f"DEBUG BACKEND MAPPING {var_name}: always_show={mapping.get('always_show')} (type: {type(mapping.get('always_show'))})")
-            
-            # Load global variables (normalize values to floats; treat % values as decimals)
-            global_vars_response = supabase.table('global_variables').select('*').execute()
-            self.global_variables = {}
-            for var in global_vars_response.data:
-                name = var.get('variable_name')
-                raw = var.get('value')
-                had_percent = False
-                if isinstance(raw, str) and '%' in raw:
-                    had_percent = True
-                if isinstance(raw, (int, float)):
-                    value = float(raw)
-                else:
-                    text = str(raw or '').strip().replace('%', '').replace(' ', '').replace(',', '.')
-                    try:
-                        value = float(text)
-                    except ValueError:
-                        value = 0.0
-                if had_percent or name.lower().startswith('skattesats'):
-                    # Convert percent like 20.6 to 0.206
-                    value = value / 100.0
-                self.global_variables[name] = value
-            
-            # Load accounts lookup (map by both int and string id for robustness)
-            accounts_response = supabase.table('accounts_table').select('*').execute()
-            self.accounts_lookup = {}
-            for acc in accounts_response.data:
-                acc_id = acc.get('account_id')
-                text = acc.get('account_text') or f"Konto {acc_id}"
-                # int key
-                try:
-                    self.accounts_lookup[int(acc_id)] = text
-                except Exception:
-                    pass
-                # string key
-                self.accounts_lookup[str(acc_id)] = text
-            
-            print(f"Loaded {len(self.rr_mappings)} RR mappings, {len(self.br_mappings)} BR mappings, and {len(self.ink2_mappings)} INK2 mappings")
-            
+            self._apply_snapshot(mapping_refresher.get())
         except Exception as e:
             print(f"Error loading mappings: {e}")
             self.rr_mappings = []
             self.br_mappings = []
             self.ink2_mappings = []
             self.global_variables = {}
-            self.accounts_lookup = {}
+            self.account_texts = AccountTextIndex([])
+            self.rr_compiled = []
+            self.br_compiled = []
+            self.ink2_compiled = []
+            self.ink2_by_variable = {}
+    
+    def _load_mappings(self):
+        """Force reload of variable mappings from database"""
+        try:
+            self._apply_snapshot(mapping_refresher.refresh())
+        except Exception as e:
+            print(f"Error loading mappings: {e}")
+            self._use_current_snapshot()
     
     def parse_account_balances(self, se_content: str) -> Dict[str, float]:
         """Parse account balances from SE file content using the correct format"""
@@ -158,136 +152,28 @@ class DatabaseParser:
     
     def calculate_variable_value(self, mapping: Dict[str, Any], accounts: Dict[str, float]) -> float:
         """Calculate value for a specific variable based on its mapping"""
-        total = 0.0
-        
-        # Get account ranges to include
-        start = mapping.get('accounts_included_start')
-        end = mapping.get('accounts_included_end')
-        
-        # Include accounts in range
-        if start and end:
-            for account_id in range(start, end + 1):
-                account_str = str(account_id)
-                if account_str in accounts:
-                    total += accounts[account_str]
-        
-        # Include additional specific accounts
-        additional_accounts = mapping.get('accounts_included')
-        if additional_accounts:
-            for account_spec in additional_accounts.split(';'):
-                account_spec = account_spec.strip()
-                if '-' in account_spec:
-                    # Range specification (e.g., "4910-4931")
-                    range_start, range_end = map(int, account_spec.split('-'))
-                    for account_id in range(range_start, range_end + 1):
-                        account_str = str(account_id)
-                        if account_str in accounts:
-                            total += accounts[account_str]
-                else:
-                    # Single account
-                    if account_spec in accounts:
-                        total += accounts[account_spec]
-        
-        # Exclude accounts in range
-        exclude_start = mapping.get('accounts_excluded_start')
-        exclude_end = mapping.get('accounts_excluded_end')
-        
-        if exclude_start and exclude_end:
-            for account_id in range(exclude_start, exclude_end + 1):
-                account_str = str(account_id)
-                if account_str in accounts:
-                    total -= accounts[account_str]
-        
-        # Exclude additional specific accounts
-        excluded_accounts = mapping.get('accounts_excluded')
-        if excluded_accounts:
-            for account_spec in excluded_accounts.split(';'):
-                account_spec = account_spec.strip()
-                if '-' in account_spec:
-                    # Range specification
-                    range_start, range_end = map(int, account_spec.split('-'))
-                    for account_id in range(range_start, range_end + 1):
-                        account_str = str(account_id)
-                        if account_str in accounts:
-                            total -= accounts[account_str]
-                else:
-                    # Single account
-                    if account_spec in accounts:
-                        total -= accounts[account_str]
-        
-        # Apply sign based on SE file data structure
-        # All account balances from 2000-8989 need to be reversed regardless of balance_type
-        
-        # Check if any accounts in the 2000-8989 range are being used
-        should_reverse = False
-        
-        # Check account range
-        start = mapping.get('accounts_included_start')
-        end = mapping.get('accounts_included_end')
-        if start and end and 2000 <= start <= 8989:
-            should_reverse = True
-        
-        # Check additional specific accounts
-        additional_accounts = mapping.get('accounts_included')
-        if additional_accounts:
-            for account_spec in additional_accounts.split(';'):
-                account_spec = account_spec.strip()
-                if '-' in account_spec:
-                    # Range specification
-                    range_start, range_end = map(int, account_spec.split('-'))
-                    if 2000 <= range_start <= 8989:
-                        should_reverse = True
-                        break
-                else:
-                    # Single account
-                    try:
-                        account_id = int(account_spec)
-                        if 2000 <= account_id <= 8989:
-                            should_reverse = True
-                            break
-                    except ValueError:
-                        continue
-        
-        # Optional explicit sign override from mapping column (e.g., '+/-' or 'sign')
-        sign_override = mapping.get('+/-') or mapping.get('sign') or mapping.get('plus_minus')
-        if sign_override:
-            s = str(sign_override).strip()
-            if s == '+':
-                total = abs(total)
-            elif s == '-':
-                total = -abs(total)
-
-        if should_reverse:
-            return -total
-        else:
-            return total
+        return apply_account_rule(compile_account_rule(mapping), AccountLedger(accounts))
     
     def calculate_formula_value(self, mapping: Dict[str, Any], accounts: Dict[str, float], existing_results: List[Dict[str, Any]], use_previous_year: bool = False, rr_data: List[Dict[str, Any]] = None) -> float:
         """Calculate value using a formula that references variable names"""
+        return self._evaluate_formula(mapping, index_by_variable(existing_results), index_by_variable(rr_data), use_previous_year)
+    
+    def _evaluate_formula(self, mapping: Dict[str, Any], results_index: Dict[str, Any], rr_index: Dict[str, Any], use_previous_year: bool = False) -> float:
+        """calculate_formula_value against prebuilt variable_name indexes"""
         formula = mapping.get('calculation_formula', '')
         if not formula:
             return 0.0
         
-
-        
         # Parse formula like "NETTOOMSATTNING + OVRIGA_INTEKNINGAR"
         # Use variable names instead of row references
-        import re
-        
-        # Replace variable references with their calculated values
         # Formula format: variable names like SumRorelseintakter, SumRorelsekostnader, etc.
-        # Use word boundaries to match complete variable names
-        pattern = r'\b([A-Z][a-zA-Z0-9_]*)\b'
-        
         def replace_variable(match):
             var_name = match.group(1)
-            # Use the new helper method to get calculated values
-            value = self._get_calculated_value(var_name, existing_results, use_previous_year, rr_data)
-
+            value = self._lookup_calculated_value(var_name, results_index, rr_index, use_previous_year)
             return str(value)
         
         # Replace all variable references
-        formula_with_values = re.sub(pattern, replace_variable, formula)
+        formula_with_values = FORMULA_VARIABLE_PATTERN.sub(replace_variable, formula)
         
         try:
             # Evaluate the formula
@@ -299,89 +185,70 @@ class DatabaseParser:
     
     def parse_rr_data(self, current_accounts: Dict[str, float], previous_accounts: Dict[str, float] = None) -> List[Dict[str, Any]]:
         """Parse RR (Resultaträkning) data using database mappings"""
-        if not self.rr_mappings:
-            return []
+        results = rows_to_dicts(self.evaluate_rr_rows(current_accounts, previous_accounts))
         
-        results = []
+        # Store calculated values in database for future use
+        self.store_calculated_values(results, 'RR')
         
-
+        return results
+    
+    def evaluate_rr_rows(self, current_accounts: Dict[str, float], previous_accounts: Dict[str, float] = None) -> List[ReportRow]:
+        """RR rows as row objects, sorted by id"""
+        return self._evaluate_report_rows(self.rr_compiled, current_accounts, previous_accounts)
+    
+    def _evaluate_report_rows(self, compiled_mappings: List[CompiledMapping], current_accounts: Dict[str, float],
+                              previous_accounts: Dict[str, float] = None, rr_data: List[Dict[str, Any]] = None) -> List[ReportRow]:
+        """
+        Calculate RR/BR rows in two passes: account sums first, then formulas in row_id order.
+        Rows share the static fields of the snapshot and only hold their amounts.
+        """
+        if not compiled_mappings:
+            return []
+        
+        # Sorted views of both ledgers, shared by all rows of this request
+        current_ledger = AccountLedger(current_accounts)
+        previous_ledger = AccountLedger(previous_accounts or {})
+        results: List[ReportRow] = []
         
         # First pass: Create all rows with direct calculations
-        for mapping in self.rr_mappings:
-            if not mapping.get('show_amount'):
+        for compiled in compiled_mappings:
+            if not compiled.show_amount:
                 # Header row - no calculation needed
-                results.append({
-                    'id': mapping['row_id'],
-                    'label': mapping['row_title'],
-                    'current_amount': None,
-                    'previous_amount': None,
-                    'level': self._get_level_from_style(mapping['style']),
-                    'section': 'RR',
-                    'bold': mapping['style'] in ['H0', 'H1', 'H2', 'H4'],
-                    'style': mapping['style'],
-                    'variable_name': mapping['variable_name'],
-                    'is_calculated': mapping['is_calculated'],
-                    'calculation_formula': mapping['calculation_formula'],
-                    'show_amount': mapping['show_amount'],
-                    'block_group': mapping.get('block_group'),
-                    'always_show': self._normalize_always_show(mapping.get('always_show', False))
-                })
+                results.append(ReportRow(compiled.meta))
+            elif compiled.is_calculated:
+                # For calculated items, set to 0 initially, will be updated in second pass
+                results.append(ReportRow(compiled.meta, 0.0, 0.0))
             else:
-                # Data row - calculate amounts for both years
-                if mapping.get('is_calculated'):
-                    # For calculated items, set to 0 initially, will be updated in second pass
-                    current_amount = 0.0
-                    previous_amount = 0.0
-                else:
-                    # Direct account calculation
-                    current_amount = self.calculate_variable_value(mapping, current_accounts)
-                    previous_amount = self.calculate_variable_value(mapping, previous_accounts or {})
-                
-
-                
-                results.append({
-                    'id': mapping['row_id'],
-                    'label': mapping['row_title'],
-                    'current_amount': current_amount,
-                    'previous_amount': previous_amount,
-                    'level': self._get_level_from_style(mapping['style']),
-                    'section': 'RR',
-                    'bold': mapping['style'] in ['H0', 'H1', 'H2', 'H4'],
-                    'style': mapping['style'],
-                    'variable_name': mapping['variable_name'],
-                    'is_calculated': mapping['is_calculated'],
-                    'calculation_formula': mapping['calculation_formula'],
-                    'show_amount': mapping['show_amount'],
-                    'block_group': mapping.get('block_group'),
-                    'always_show': self._normalize_always_show(mapping.get('always_show', False))
-                })
+                # Direct account calculation
+                results.append(ReportRow(
+                    compiled.meta,
+                    apply_account_rule(compiled.rule, current_ledger),
+                    apply_account_rule(compiled.rule, previous_ledger)
+                ))
         
         # Second pass: Calculate formulas using all available data
+        # Rows are looked up by variable_name/row_id instead of scanning the results
+        results_index = index_by_variable(results)
+        rr_index = index_by_variable(rr_data)
+        rows_by_id: Dict[Any, ReportRow] = {}
+        for row in results:
+            rows_by_id.setdefault(row.meta['id'], row)
         
         # Sort calculated mappings by row_id to ensure dependencies are calculated first
-        calculated_mappings = [(i, mapping) for i, mapping in enumerate(self.rr_mappings) 
-                              if mapping.get('is_calculated')]
-        calculated_mappings.sort(key=lambda x: int(x[1]['row_id']))
+        calculated_mappings = [compiled for compiled in compiled_mappings if compiled.is_calculated]
+        calculated_mappings.sort(key=lambda x: int(x.row_id))
         
-        for i, mapping in calculated_mappings:
-
-                
-                current_amount = self.calculate_formula_value(mapping, current_accounts, results, use_previous_year=False)
-                previous_amount = self.calculate_formula_value(mapping, previous_accounts or {}, results, use_previous_year=True)
-
-                
-                # Find and update the correct result by row_id
-                for result in results:
-                    if result['id'] == mapping['row_id']:
-                        result['current_amount'] = current_amount
-                        result['previous_amount'] = previous_amount
-                        break
-        
-        # Store calculated values in database for future use
-        self.store_calculated_values(results, 'RR')
+        for compiled in calculated_mappings:
+            current_amount = self._evaluate_formula(compiled.mapping, results_index, rr_index, use_previous_year=False)
+            previous_amount = self._evaluate_formula(compiled.mapping, results_index, rr_index, use_previous_year=True)
+            
+            row = rows_by_id.get(compiled.row_id)
+            if row is not None:
+                row.current_amount = current_amount
+                row.previous_amount = previous_amount
         
         # Sort results by ID to ensure correct order
-        results.sort(key=lambda x: int(x['id']))
+        results.sort(key=lambda row: int(row.meta['id']))
         
         return results
     
@@ -410,136 +277,34 @@ class DatabaseParser:
     
     def _get_calculated_value(self, variable_name: str, results: List[Dict[str, Any]], use_previous_year: bool = False, rr_data: List[Dict[str, Any]] = None) -> float:
         """Get calculated value for a variable from results or RR data"""
-        # First check in the current results (BR data)
-        for item in results:
-            if item.get('variable_name') == variable_name:
-                value = item.get('previous_amount' if use_previous_year else 'current_amount', 0)
-                return value if value is not None else 0
-        
-        # If not found in current results, check in RR data
-        if rr_data:
-            for item in rr_data:
-                if item.get('variable_name') == variable_name:
-                    value = item.get('previous_amount' if use_previous_year else 'current_amount', 0)
-                    return value if value is not None else 0
-        
-        return 0
+        return self._lookup_calculated_value(variable_name, index_by_variable(results), index_by_variable(rr_data), use_previous_year)
+    
+    def _lookup_calculated_value(self, variable_name: str, results_index: Dict[str, Any], rr_index: Dict[str, Any], use_previous_year: bool = False) -> float:
+        """Value for a variable from the current results (BR data) first, then RR data"""
+        row = results_index.get(variable_name)
+        if row is None:
+            row = rr_index.get(variable_name)
+        if row is None:
+            return 0
+        value = row_amount(row, use_previous_year)
+        return value if value is not None else 0
     
     def parse_br_data(self, current_accounts: Dict[str, float], previous_accounts: Dict[str, float] = None, rr_data: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Parse BR (Balansräkning) data using database mappings"""
-        if not self.br_mappings:
-            return []
-        
-        results = []
-        
-        # First pass: Create all rows with direct calculations
-        for mapping in self.br_mappings:
-            if not mapping.get('show_amount'):
-                # Header row - no calculation needed
-                results.append({
-                    'id': mapping['row_id'],
-                    'label': mapping['row_title'],
-                    'current_amount': None,
-                    'previous_amount': None,
-                    'level': self._get_level_from_style(mapping['style']),
-                    'section': 'BR',
-                    'type': self._get_balance_type(mapping),
-                    'bold': mapping['style'] in ['H0', 'H1', 'H2', 'H4'],
-                    'style': mapping['style'],
-                    'variable_name': mapping['variable_name'],
-                    'is_calculated': mapping['is_calculated'],
-                    'calculation_formula': mapping['calculation_formula'],
-                    'show_amount': mapping['show_amount'],
-                    'block_group': mapping.get('block_group'),
-                    'always_show': self._normalize_always_show(mapping.get('always_show', False))
-                })
-            else:
-                # Data row - calculate amounts for both years
-                if mapping.get('is_calculated'):
-                    # For calculated items, set to 0 initially, will be updated in second pass
-                    current_amount = 0.0
-                    previous_amount = 0.0
-                else:
-                    # Direct account calculation
-                    current_amount = self.calculate_variable_value(mapping, current_accounts)
-                    previous_amount = self.calculate_variable_value(mapping, previous_accounts or {})
-                
-                results.append({
-                    'id': mapping['row_id'],
-                    'label': mapping['row_title'],
-                    'current_amount': current_amount,
-                    'previous_amount': previous_amount,
-                    'level': self._get_level_from_style(mapping['style']),
-                    'section': 'BR',
-                    'type': self._get_balance_type(mapping),
-                    'bold': mapping['style'] in ['H0', 'H1', 'H2', 'H4'],
-                    'style': mapping['style'],
-                    'variable_name': mapping['variable_name'],
-                    'is_calculated': mapping['is_calculated'],
-                    'calculation_formula': mapping['calculation_formula'],
-                    'show_amount': mapping['show_amount'],
-                    'block_group': mapping.get('block_group'),
-                    'always_show': self._normalize_always_show(mapping.get('always_show', False))
-                })
-        
-        # Second pass: Calculate formulas using all available data
-        # Sort calculated mappings by row_id to ensure dependencies are calculated first
-        calculated_mappings = [(i, mapping) for i, mapping in enumerate(self.br_mappings) 
-                              if mapping.get('is_calculated')]
-        calculated_mappings.sort(key=lambda x: int(x[1]['row_id']))
-        
-        for i, mapping in calculated_mappings:
-                current_amount = self.calculate_formula_value(mapping, current_accounts, results, use_previous_year=False, rr_data=rr_data)
-                previous_amount = self.calculate_formula_value(mapping, previous_accounts or {}, results, use_previous_year=True, rr_data=rr_data)
-                
-                # Find and update the correct result by row_id
-                for result in results:
-                    if result['id'] == mapping['row_id']:
-                        result['current_amount'] = current_amount
-                        result['previous_amount'] = previous_amount
-                        break
+        results = rows_to_dicts(self.evaluate_br_rows(current_accounts, previous_accounts, rr_data))
         
         # Store calculated values in database for future use
         self.store_calculated_values(results, 'BR')
         
-        # Sort results by ID to ensure correct order
-        results.sort(key=lambda x: int(x['id']))
-        
-
-        
         return results
     
-    def _get_level_from_style(self, style: str) -> int:
-        """Get hierarchy level from style"""
-        style_map = {
-            'H0': 0,
-            'H1': 1,
-            'H2': 2,
-            'H3': 3,
-            'H4': 4,  # Replace S1, S2, S3 with H4
-            'NORMAL': 4,
-            'S1': 4,  # Map S1 to H4 level
-            'S2': 4,  # Map S2 to H4 level
-            'S3': 4   # Map S3 to H4 level
-        }
-        return style_map.get(style, 4)
+    def evaluate_br_rows(self, current_accounts: Dict[str, float], previous_accounts: Dict[str, float] = None, rr_data: List[Dict[str, Any]] = None) -> List[ReportRow]:
+        """BR rows as row objects, sorted by id; formulas may reference RR variables"""
+        return self._evaluate_report_rows(self.br_compiled, current_accounts, previous_accounts, rr_data)
     
-    def _get_balance_type(self, mapping: Dict[str, Any]) -> str:
-        """Get balance type (asset/liability/equity) from mapping"""
-        balance_type = mapping.get('balance_type', 'DEBIT')
-        
-        # Simple mapping - you might need to refine this based on your BR structure
-        if balance_type == 'DEBIT':
-            return 'asset'
-        elif balance_type == 'CREDIT':
-            # Determine if it's liability or equity based on account ranges
-            start = mapping.get('accounts_included_start', 0)
-            if start and start >= 2000:  # Equity accounts typically start at 2000+
-                return 'equity'
-            else:
-                return 'liability'
-        else:
-            return 'asset'  # Default
+    def build_row_metadata(self, mapping: Dict[str, Any], section: str) -> Dict[str, Any]:
+        """Static RR/BR row fields that only depend on the mapping"""
+        return row_metadata(mapping, section)
     
     def ensure_financial_data_columns(self, rr_data: List[Dict[str, Any]], br_data: List[Dict[str, Any]]) -> None:
         """Ensure that the financial_data table has columns for all variables"""
@@ -653,27 +418,39 @@ class DatabaseParser:
             print(f"Error updating formula for row {row_id}: {e}")
             return False
     
-    def parse_ink2_data(self, current_accounts: Dict[str, float], fiscal_year: int = None, rr_data: List[Dict[str, Any]] = None, br_data: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    def parse_ink2_data(self, current_accounts: Dict[str, float], fiscal_year: int = None, rr_data: List[Dict[str, Any]] = None, br_data: List[Dict[str, Any]] = None,
+                        account_details: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
         """
         Parse INK2 tax calculation data using database mappings.
         Returns simplified structure: row_title and amount only.
+        account_details is the precomputed index from build_account_detail_index (built here if not given);
+        rows only carry a has_account_details flag.
         """
-        # Force reload mappings to get fresh data from database
-        self._load_mappings()
+        return rows_to_dicts(self.evaluate_ink2_rows(current_accounts, fiscal_year, rr_data, br_data, account_details=account_details))
+    
+    def evaluate_ink2_rows(self, current_accounts: Dict[str, float], fiscal_year: int = None, rr_data: List[Dict[str, Any]] = None, br_data: List[Dict[str, Any]] = None,
+                           account_details: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Ink2Row]:
+        """INK2 rows as row objects (see parse_ink2_data)"""
+        # Mappings come from the snapshot kept fresh by the background refresher
         if not self.ink2_mappings:
             print("No INK2 mappings available")
             return []
         
         results = []
         
-        # Sort mappings by row_id to maintain correct order
-        sorted_mappings = sorted(self.ink2_mappings, key=lambda x: x.get('row_id', 0))
+        if account_details is None:
+            account_details = self.build_account_detail_index(current_accounts)
         
+        ledger = AccountLedger(current_accounts)
+        rr_index = index_by_variable(rr_data)
+        br_index = index_by_variable(br_data)
         ink_values: Dict[str, float] = {}
-        for mapping in sorted_mappings:
+        # Compiled mappings are sorted by row_id
+        for compiled in self.ink2_compiled:
+            mapping = compiled.mapping
             try:
                 # Always calculate (or default to 0) so rows can be shown with blank amount if needed
-                amount = self.calculate_ink2_variable_value(mapping, current_accounts, fiscal_year, rr_data, ink_values, br_data)
+                amount = self._calculate_ink2_value(compiled, ledger, fiscal_year, rr_data, ink_values, rr_index, br_index)
                 
                 # Special handling: hide INK4_header (duplicate "Skatteberäkning")
                 variable_name = mapping.get('variable_name', '')
@@ -681,23 +458,9 @@ class DatabaseParser:
                     continue  # Skip this row entirely
                 
                 # Return all rows - let frontend handle visibility logic
-                result = {
-                        'row_id': mapping.get('row_id'),
-                        'row_title': mapping.get('row_title', ''),
-                        'amount': amount,
-                        'variable_name': mapping.get('variable_name', ''),
-                        'show_tag': mapping.get('show_tag', False),
-                        'accounts_included': mapping.get('accounts_included', ''),
-                        'account_details': self._get_account_details(mapping.get('accounts_included', ''), current_accounts) if mapping.get('show_tag', False) else None,
-                        'show_amount': self._normalize_show_amount(mapping.get('show_amount', True)),
-                        'is_calculated': self._normalize_is_calculated(mapping.get('is_calculated', True)),
-                        'always_show': self._normalize_always_show(mapping.get('always_show', False)),
-                        'style': mapping.get('style'),
-                        'explainer': mapping.get('explainer', ''),
-                        'block': mapping.get('block', ''),
-                        'header': mapping.get('header', False)
-                    }
-                results.append(result)
+                # Details are fetched on demand via /api/account-details
+                has_account_details = bool(account_details.get(variable_name)) if mapping.get('show_tag', False) else False
+                results.append(Ink2Row(compiled.meta, amount, has_account_details))
                 # store for later formula dependencies
                 var_name = mapping.get('variable_name')
                 if var_name:
@@ -711,12 +474,23 @@ class DatabaseParser:
     
     def parse_ink2_data_with_overrides(self, current_accounts: Dict[str, float], fiscal_year: int = None, 
                                        rr_data: List[Dict[str, Any]] = None, br_data: List[Dict[str, Any]] = None,
-                                       manual_amounts: Dict[str, float] = None) -> List[Dict[str, Any]]:
+                                       manual_amounts: Dict[str, float] = None,
+                                       account_details: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
         """
         Parse INK2 tax calculation data with manual amount overrides for dynamic recalculation.
+        account_details is the precomputed index from build_account_detail_index (built here if not given);
+        rows only carry a has_account_details flag.
         """
-        # Force reload mappings to get fresh data from database
-        self._load_mappings()
+        return rows_to_dicts(self.evaluate_ink2_rows_with_overrides(
+            current_accounts, fiscal_year, rr_data, br_data, manual_amounts, account_details=account_details
+        ))
+    
+    def evaluate_ink2_rows_with_overrides(self, current_accounts: Dict[str, float], fiscal_year: int = None, 
+                                          rr_data: List[Dict[str, Any]] = None, br_data: List[Dict[str, Any]] = None,
+                                          manual_amounts: Dict[str, float] = None,
+                                          account_details: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Ink2Row]:
+        """INK2 rows with manual overrides as row objects (see parse_ink2_data_with_overrides)"""
+        # Mappings come from the snapshot kept fresh by the background refresher
         if not self.ink2_mappings:
             print("No INK2 mappings available")
             return []
@@ -724,9 +498,12 @@ class DatabaseParser:
         manual_amounts = manual_amounts or {}
         results = []
         
-        # Sort mappings by row_id to maintain correct order
-        sorted_mappings = sorted(self.ink2_mappings, key=lambda x: x.get('row_id', 0))
+        if account_details is None:
+            account_details = self.build_account_detail_index(current_accounts)
         
+        ledger = AccountLedger(current_accounts)
+        rr_index = index_by_variable(rr_data)
+        br_index = index_by_variable(br_data)
         ink_values: Dict[str, float] = {}
         
         # Inject justering_sarskild_loneskatt into ink_values if provided
@@ -734,9 +511,11 @@ class DatabaseParser:
             ink_values['justering_sarskild_loneskatt'] = manual_amounts['justering_sarskild_loneskatt']
             print(f"Injected justering_sarskild_loneskatt: {manual_amounts['justering_sarskild_loneskatt']}")
         
-        for mapping in sorted_mappings:
+        # Compiled mappings are sorted by row_id
+        for compiled in self.ink2_compiled:
+            mapping = compiled.mapping
             try:
-                variable_name = mapping.get('variable_name', '')
+                variable_name = compiled.variable_name
                 
                 # Force recalculation of dependent summary values even if not manually edited
                 force_recalculate = variable_name in ['INK_skattemassigt_resultat', 'INK_beraknad_skatt']
@@ -748,7 +527,7 @@ class DatabaseParser:
                     print(f"Using manual override for {variable_name}: {amount}")
                 else:
                     # Calculate normally (or force recalculate for dependent values)
-                    amount = self.calculate_ink2_variable_value(mapping, current_accounts, fiscal_year, rr_data, ink_values, br_data)
+                    amount = self._calculate_ink2_value(compiled, ledger, fiscal_year, rr_data, ink_values, rr_index, br_index)
                     # IMPORTANT: Store calculated values for later formulas
                     ink_values[variable_name] = amount
                     if variable_name in ['INK_skattemassigt_resultat', 'INK_beraknad_skatt']:
@@ -759,80 +538,45 @@ class DatabaseParser:
                     continue  # Skip this row entirely
                 
                 # Return all rows - let frontend handle visibility logic
-                # Get account details for SHOW button if needed
-                account_details = []
+                # Flag for the SHOW button; details are fetched on demand via /api/account-details
+                has_account_details = False
                 if mapping.get('show_tag') and mapping.get('accounts_included'):
-                    account_details = self._get_account_details(mapping['accounts_included'], current_accounts)
+                    has_account_details = bool(account_details.get(variable_name))
                 
-                results.append({
-                        'row_id': mapping.get('row_id', 0),
-                        'row_title': mapping['row_title'],
-                        'amount': amount,
-                        'variable_name': variable_name,
-                        'show_tag': mapping.get('show_tag', False),
-                        'accounts_included': mapping.get('accounts_included', ''),
-                        'show_amount': self._normalize_show_amount(mapping.get('show_amount')),
-                        'style': mapping.get('style', 'NORMAL'),
-                        'is_calculated': self._normalize_is_calculated(mapping.get('is_calculated')),
-                        'always_show': self._normalize_always_show(mapping.get('always_show', False)),
-                        'explainer': mapping.get('explainer', ''),
-                        'block': mapping.get('block', ''),
-                        'header': mapping.get('header', False),
-                        'account_details': account_details
-                    })
+                results.append(Ink2Row(compiled.meta, amount, has_account_details))
                 
             except Exception as e:
                 print(f"Error processing INK2 mapping {mapping.get('variable_name', 'unknown')}: {e}")
                 continue
         
         return results
-
-
-    def _normalize_show_amount(self, value: Any) -> bool:
-        """Normalize show_amount to boolean. Handles string 'TRUE'/'FALSE' from database."""
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, str):
-            return value.upper() == 'TRUE'
-        return bool(value)
-    
-    def _normalize_is_calculated(self, value: Any) -> bool:
-        """Normalize is_calculated to boolean. Handles string 'TRUE'/'FALSE' from database."""
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, str):
-            return value.upper() == 'TRUE'
-        return bool(value)
     
-    def _normalize_always_show(self, value: Any) -> Any:
-        """Normalize always_show to boolean or null values."""
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, str):
-            normalized = value.strip().upper()
-            if normalized == 'TRUE':
-                return True
-            elif normalized == 'FALSE':
-                return False
-            else:
-                return None  # Empty/null means conditional (show if amount != 0)
-        return None  # Default to conditional
+    def build_ink2_row_metadata(self, mapping: Dict[str, Any]) -> Dict[str, Any]:
+        """Static INK2 row fields that only depend on the mapping"""
+        return ink2_row_metadata(mapping)
     
     def calculate_ink2_variable_value(self, mapping: Dict[str, Any], accounts: Dict[str, float], fiscal_year: int = None, rr_data: List[Dict[str, Any]] = None, ink_values: Optional[Dict[str, float]] = None, br_data: Optional[List[Dict[str, Any]]] = None) -> float:
         """
         Calculate the value for an INK2 variable using accounts and formulas.
         """
-        variable_name = mapping.get('variable_name', '')
+        compiled = compile_ink2_mappings([mapping])[0]
+        return self._calculate_ink2_value(compiled, AccountLedger(accounts), fiscal_year, rr_data, ink_values,
+                                          index_by_variable(rr_data), index_by_variable(br_data))
+    
+    def _calculate_ink2_value(self, compiled: CompiledMapping, ledger: AccountLedger, fiscal_year: Optional[int], rr_data: Optional[List[Dict[str, Any]]],
+                              ink_values: Dict[str, float], rr_index: Dict[str, Any], br_index: Dict[str, Any]) -> float:
+        """calculate_ink2_variable_value for a compiled mapping, with the ledger and variable indexes built once per request"""
+        mapping = compiled.mapping
+        accounts = ledger.accounts
+        variable_name = compiled.variable_name
 
         # Helper to fetch RR variables
         def rr(var: str) -> float:
-            if not rr_data:
+            item = rr_index.get(var)
+            if item is None:
                 return 0.0
-            for item in rr_data:
-                if item.get('variable_name') == var:
-                    value = item.get('current_amount')
-                    return float(value) if value is not None else 0.0
-            return 0.0
+            value = row_amount(item)
+            return float(value) if value is not None else 0.0
 
         # Explicit logic for key variables
         if variable_name == 'INK4.1':
@@ -847,12 +591,10 @@ class DatabaseParser:
             # Periodiseringsfonder previous_year * statslaneranta
             rate = float(self.global_variables.get('statslaneranta', 0.0))
             prev = 0.0
-            if br_data:
-                for item in br_data:
-                    if item.get('variable_name') == 'Periodiseringsfonder':
-                        val = item.get('previous_amount')
-                        prev = float(val) if val is not None else 0.0
-                        break
+            item = br_index.get('Periodiseringsfonder')
+            if item is not None:
+                val = row_amount(item, use_previous_year=True)
+                prev = float(val) if val is not None else 0.0
             return prev * rate
         
         # New pension tax variables
@@ -963,13 +705,8 @@ class DatabaseParser:
             return self.calculate_ink2_formula_value(mapping, accounts, fiscal_year, rr_data, ink_values)
         
         # Otherwise, sum the included accounts (use absolute values for positive-only variables)
-        account_sum = self.sum_included_accounts(mapping.get('accounts_included', ''), accounts)
-        # Variables that should always be positive (account-based calculations)
-        positive_only_variables = [
-            'INK4.3c', 'INK4.4a', 'INK4.5b', 'INK4.5c', 
-            'INK4.6a', 'INK4.6c', 'INK4.21'
-        ]
-        if variable_name in positive_only_variables:
+        account_sum = sum_account_terms(compiled.terms, ledger)
+        if variable_name in POSITIVE_ONLY_INK2_VARIABLES:
             return abs(account_sum)
         return account_sum
     
@@ -1003,7 +740,7 @@ class DatabaseParser:
                 for var_name, var_value in ink_values.items():
                     if var_name in formula_with_values:
                         # Get the sign from the mapping for this variable
-                        var_mapping = next((m for m in self.ink2_mappings if m.get('variable_name') == var_name), None)
+                        var_mapping = self.ink2_by_variable.get(var_name)
                         if var_mapping:
                             sign_column = var_mapping.get('*/+/-', '+')
                             if sign_column == '-':
@@ -1100,127 +837,71 @@ class DatabaseParser:
         Sum the values of included accounts.
         accounts_included format: "6072;6992;7632" or "6000-6999"
         """
-        if not accounts_included:
-            return 0.0
-        
-        total = 0.0
-        
-        # Split by semicolon for multiple accounts/ranges
-        account_specs = accounts_included.split(';')
-        
-        for spec in account_specs:
-            spec = spec.strip()
-            if not spec:
-                continue
-                
-            if '-' in spec:
-                # Range format: "6000-6999"
-                try:
-                    start, end = spec.split('-')
-                    start_num = int(start.strip())
-                    end_num = int(end.strip())
-                    
-                    for account_id, balance in accounts.items():
-                        try:
-                            account_num = int(account_id)
-                            if start_num <= account_num <= end_num:
-                                total += balance
-                        except ValueError:
-                            continue
-                            
-                except ValueError:
-                    print(f"Invalid range format: {spec}")
-                    continue
-            else:
-                # Single account
-                try:
-                    account_id = spec.strip()
-                    total += accounts.get(account_id, 0.0)
-                except Exception:
-                    print(f"Invalid account format: {spec}")
-                    continue
-        
-        return total
+        return sum_account_terms(parse_account_terms(accounts_included), AccountLedger(accounts))
     
-    def _get_account_details(self, accounts_included: str, accounts: Dict[str, float]) -> List[Dict[str, Any]]:
+    def build_account_detail_index(self, accounts: Dict[str, float]) -> Dict[str, List[Dict[str, Any]]]:
         """
-        Get detailed account information for popup display.
-        Returns list with account_id, account_text, and balance.
+        Precompute account details for every show_tag INK2 row.
+        Returns variable_name -> sorted list with account_id, account_text, and balance.
+        The ledger doesn't change between recalculations, so this is built once per upload.
         """
-        if not accounts_included:
-            return []
-        
-        details = []
-        
-        # Split by semicolon for multiple accounts/ranges
-        account_specs = accounts_included.split(';')
+        # Non-zero accounts sorted by account number for range lookups
+        ledger = []
+        for account_id, balance in accounts.items():
+            if balance == 0:
+                continue
+            try:
+                ledger.append((int(account_id), account_id, balance))
+            except ValueError:
+                continue
+        ledger.sort(key=lambda x: x[0])
+        numbers = [number for number, _, _ in ledger]
         
-        for spec in account_specs:
-            spec = spec.strip()
-            if not spec:
+        matches_by_variable: Dict[str, List[Tuple[str, float]]] = {}
+        for mapping in self.ink2_mappings or []:
+            if not mapping.get('show_tag'):
                 continue
-                
-            if '-' in spec:
-                # Range format: "6000-6999"
-                try:
-                    start, end = spec.split('-')
-                    start_num = int(start.strip())
-                    end_num = int(end.strip())
-                    
-                    for account_id, balance in accounts.items():
-                        try:
-                            account_num = int(account_id)
-                            if start_num <= account_num <= end_num and balance != 0:
-                                details.append({
-                                    'account_id': account_id,
-                                    'account_text': self._get_account_text(account_num),
-                                    'balance': balance
-                                })
-                        except ValueError:
-                            continue
-                            
-                except ValueError:
+            matches = []
+            for spec in (mapping.get('accounts_included') or '').split(';'):
+                spec = spec.strip()
+                if not spec:
                     continue
-            else:
-                # Single account
-                try:
-                    account_id = spec.strip()
-                    balance = accounts.get(account_id, 0.0)
+                if '-' in spec:
+                    # Range format: "6000-6999"
+                    try:
+                        start, end = spec.split('-')
+                        start_num = int(start.strip())
+                        end_num = int(end.strip())
+                    except ValueError:
+                        continue
+                    lo = bisect_left(numbers, start_num)
+                    hi = bisect_right(numbers, end_num)
+                    matches.extend((account_id, balance) for _, account_id, balance in ledger[lo:hi])
+                elif spec.isdigit():
+                    # Single account
+                    balance = accounts.get(spec, 0.0)
                     if balance != 0:  # Only include accounts with non-zero balance
-                        details.append({
-                            'account_id': account_id,
-                            'account_text': self._get_account_text(account_id),
-                            'balance': balance
-                        })
-                except Exception:
-                    continue
-        
-        # Sort by account_id
-        details.sort(key=lambda x: int(x['account_id']))
-        return details
+                        matches.append((spec, balance))
+            matches_by_variable[mapping.get('variable_name', '')] = matches
+        
+        # Resolve all unknown account texts with one query
+        self.account_texts.prefetch(supabase, [account_id for matches in matches_by_variable.values() for account_id, _ in matches])
+        
+        index = {}
+        for variable_name, matches in matches_by_variable.items():
+            details = [
+                {
+                    'account_id': account_id,
+                    'account_text': self.account_texts.text(account_id),
+                    'balance': balance
+                }
+                for account_id, balance in matches
+            ]
+            details.sort(key=lambda x: int(x['account_id']))
+            index[variable_name] = details
+        return index
 
     def _get_account_text(self, account_id: Any) -> str:
         """Return kontotext for given account id using cache and DB fallback."""
-        # Try int key
-        try:
-            acc_int = int(account_id)
-            if acc_int in self.accounts_lookup:
-                return self.accounts_lookup[acc_int]
-        except Exception:
-            acc_int = None
-        # Try string key
-        key_str = str(account_id)
-        if key_str in self.accounts_lookup:
-            return self.accounts_lookup[key_str]
-        # Fallback: query Supabase directly and update cache
-        try:
-            resp = supabase.table('accounts_table').select('account_text,account_id').eq('account_id', key_str).limit(1).execute()
-            if resp.data:
-                text = resp.data[0].get('account_text') or f'Konto {key_str}'
-                if acc_int is not None:
-                    self.accounts_lookup[acc_int] = text
-                self.accounts_lookup[key_str] = text
-                return text
-        except Exception:
-            pass
-        return f'Konto {key_str}'
+        self.account_texts.prefetch(supabase, [account_id])
+        return self.account_texts.text(account_id)
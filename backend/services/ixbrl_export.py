@@ -0,0 +1,255 @@
+"""
+iXBRL export of the annual report (RR/BR)
+Streams an Inline XBRL (XHTML) document from the evaluated RR/BR rows with an
+incremental XML writer, tagging amounts with the Bolagsverket element names from
+variable_mapping_rr/br (element_name, data_type, balance_type, period_type).
+Nothing is built as a DOM; the document is written row by row. All inputs are
+plain data, so exports can also run in a batch worker (see batch_pipeline).
+
+Fact signs follow the concept's balance_type rather than the presentation
+(see fact_value).
+"""
+
+import os
+import re
+from typing import Dict, List, Any, Optional, Iterator
+from xml.sax.saxutils import XMLGenerator
+
+from services.compiled_mappings import CompiledMapping, XbrlConcept, normalize_flag
+from services.parsed_se import FiscalPeriod
+from services.report_rows import row_amount, row_fields, visible_rows
+from utils.helpers import format_currency
+
+NAMESPACES = {
+    'xmlns': 'http://www.w3.org/1999/xhtml',
+    'xmlns:ix': 'http://www.xbrl.org/2013/inlineXBRL',
+    'xmlns:ixt': 'http://www.xbrl.org/inlineXBRL/transformation/2020-02-12',
+    'xmlns:xbrli': 'http://www.xbrl.org/2003/instance',
+    'xmlns:link': 'http://www.xbrl.org/2003/linkbase',
+    'xmlns:xlink': 'http://www.w3.org/1999/xlink',
+    'xmlns:iso4217': 'http://www.xbrl.org/2003/iso4217',
+    'xmlns:se-gen-base': 'http://www.taxonomier.se/se/fr/gen-base/2021-10-31',
+    'xmlns:se-cd-base': 'http://www.taxonomier.se/se/fr/cd-base/2021-10-31',
+}
+# Entry point for K2 annual reports (aktiebolag, resultaträkning kostnadsslagsindelad)
+SCHEMA_REF = 'http://www.taxonomier.se/se/fr/gaap/k2/2021-10-31/se-k2-ab-risbs-2021-10-31.xsd'
+DEFAULT_PREFIX = 'se-gen-base'
+ENTITY_SCHEME = 'http://www.bolagsverket.se'
+UNIT_ID = 'SEK'
+
+# Context ids: duration contexts for RR, instant contexts for BR (0 = current year, 1 = previous year)
+DURATION_CONTEXTS = ('period0', 'period1')
+INSTANT_CONTEXTS = ('balans0', 'balans1')
+
+# Flush the stream after this many buffered bytes
+CHUNK_SIZE = 64 * 1024
+
+
+def fact_value(concept: XbrlConcept, shown: float, result_signed: bool) -> float:
+    """
+    The fact value of a shown amount. Result-signed rows (RR) show credits positive and
+    debits negative, so a DEBIT concept's fact is the negated amount; other rows are
+    shown in the concept's own balance and tagged as shown.
+    """
+    if result_signed and (concept.balance_type or '').upper() == 'DEBIT':
+        return -shown
+    return shown
+
+
+def xbrl_concepts(compiled: List[CompiledMapping]) -> Dict[Any, XbrlConcept]:
+    """row_id -> taxonomy element for the rows that have one"""
+    return {item.row_id: item.concept for item in compiled if item.concept is not None}
+
+
+def _element_name(concept: XbrlConcept) -> str:
+    return concept.name if ':' in concept.name else f"{DEFAULT_PREFIX}:{concept.name}"
+
+
+class _ChunkBuffer:
+    """Write target that collects output until the generator hands it on"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._parts.append(data)
+        self.size += len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        self.size = 0
+        return data
+
+
+class IxbrlWriter:
+    """Incremental writer for one iXBRL document"""
+
+    def __init__(self, out, company_info: Dict[str, Any], periods: Dict[int, FiscalPeriod]):
+        if periods.get(0) is None:
+            raise ValueError("Räkenskapsår (#RAR 0) saknas i SE-filen")
+        self.xml = XMLGenerator(out, encoding='utf-8', short_empty_elements=True)
+        self.company_info = company_info
+        self.periods = [periods.get(0), periods.get(-1)]
+        self.identifier = re.sub(r'\D', '', company_info.get('organization_number') or '')
+
+    def _element(self, name: str, attrs: Optional[Dict[str, str]] = None, text: Optional[str] = None):
+        self.xml.startElement(name, attrs or {})
+        if text is not None:
+            self.xml.characters(text)
+        self.xml.endElement(name)
+
+    def start_document(self):
+        xml = self.xml
+        xml.startDocument()
+        xml.startElement('html', NAMESPACES)
+        xml.startElement('head', {})
+        self._element('meta', {'http-equiv': 'Content-Type', 'content': 'text/html; charset=UTF-8'})
+        self._element('title', text=f"Årsredovisning {self.company_info.get('company_name', '')}".strip())
+        xml.endElement('head')
+        xml.startElement('body', {})
+        self._write_header()
+        self._element('h1', text=self.company_info.get('company_name') or '')
+        if self.company_info.get('organization_number'):
+            self._element('p', text=f"Org.nr {self.company_info['organization_number']}")
+
+    def _write_header(self):
+        xml = self.xml
+        xml.startElement('div', {'style': 'display:none'})
+        xml.startElement('ix:header', {})
+        xml.startElement('ix:references', {})
+        self._element('link:schemaRef', {'xlink:type': 'simple', 'xlink:href': SCHEMA_REF})
+        xml.endElement('ix:references')
+        xml.startElement('ix:resources', {})
+        for index, period in enumerate(self.periods):
+            if period is None:
+                continue
+            self._write_context(DURATION_CONTEXTS[index], start=period.start_iso, end=period.end_iso)
+            self._write_context(INSTANT_CONTEXTS[index], instant=period.end_iso)
+        xml.startElement('xbrli:unit', {'id': UNIT_ID})
+        self._element('xbrli:measure', text=f"iso4217:{UNIT_ID}")
+        xml.endElement('xbrli:unit')
+        xml.endElement('ix:resources')
+        xml.endElement('ix:header')
+        xml.endElement('div')
+
+    def _write_context(self, context_id: str, start: str = None, end: str = None, instant: str = None):
+        xml = self.xml
+        xml.startElement('xbrli:context', {'id': context_id})
+        xml.startElement('xbrli:entity', {})
+        self._element('xbrli:identifier', {'scheme': ENTITY_SCHEME}, self.identifier)
+        xml.endElement('xbrli:entity')
+        xml.startElement('xbrli:period', {})
+        if instant is not None:
+            self._element('xbrli:instant', text=instant)
+        else:
+            self._element('xbrli:startDate', text=start)
+            self._element('xbrli:endDate', text=end)
+        xml.endElement('xbrli:period')
+        xml.endElement('xbrli:context')
+
+    def start_section(self, title: str, instant: bool):
+        xml = self.xml
+        self._element('h2', text=title)
+        xml.startElement('table', {})
+        xml.startElement('tr', {})
+        self._element('th', text='')
+        for period in self.periods:
+            if period is not None:
+                self._element('th', text=period.end_iso if instant else period.label)
+        xml.endElement('tr')
+
+    def write_row(self, row: Any, concept: Optional[XbrlConcept], default_instant: bool,
+                  result_signed: bool = False):
+        xml = self.xml
+        fields = row_fields(row)
+        xml.startElement('tr', {})
+        self._element('td', text=fields.get('label') or '')
+        show_amount = normalize_flag(fields.get('show_amount'))
+        instant = concept.is_instant if concept is not None and concept.period_type else default_instant
+        contexts = INSTANT_CONTEXTS if instant else DURATION_CONTEXTS
+        for index, period in enumerate(self.periods):
+            if period is None:
+                continue
+            amount = row_amount(row, use_previous_year=index == 1) if show_amount else None
+            xml.startElement('td', {})
+            if amount is not None:
+                if concept is not None and concept.is_monetary and not concept.is_abstract:
+                    self._write_fact(concept, contexts[index], amount, result_signed)
+                else:
+                    xml.characters(format_currency(amount))
+            xml.endElement('td')
+        xml.endElement('tr')
+
+    def _write_fact(self, concept: XbrlConcept, context_id: str, amount: float, result_signed: bool):
+        # Whole kronor are shown, so the fact is accurate to 0 decimals
+        attrs = {
+            'name': _element_name(concept),
+            'contextRef': context_id,
+            'unitRef': UNIT_ID,
+            'decimals': '0',
+            'scale': '0',
+            'format': 'ixt:num-dot-decimal',
+        }
+        shown = round(amount)
+        value = fact_value(concept, shown, result_signed)
+        if value < 0:
+            attrs['sign'] = '-'
+        # The tag holds the magnitude; a presentation minus that isn't the fact's sign stays outside it
+        if shown < 0:
+            self.xml.characters('-')
+        self._element('ix:nonFraction', attrs, format_currency(abs(shown)))
+
+    def end_section(self):
+        self.xml.endElement('table')
+
+    def end_document(self):
+        self.xml.endElement('body')
+        self.xml.endElement('html')
+        self.xml.endDocument()
+
+
+def _write_sections(writer: IxbrlWriter, rr_rows: List[Any], br_rows: List[Any],
+                    rr_concepts: Dict[Any, XbrlConcept], br_concepts: Dict[Any, XbrlConcept]) -> Iterator[None]:
+    """Write the document, yielding after each row so callers can flush"""
+    writer.start_document()
+    for title, rows, concepts, instant, result_signed in (
+        ('Resultaträkning', rr_rows, rr_concepts, False, True),
+        ('Balansräkning', br_rows, br_concepts, True, False),
+    ):
+        writer.start_section(title, instant)
+        for row in visible_rows(rows):
+            writer.write_row(row, concepts.get(row_fields(row).get('id')), instant, result_signed)
+            yield
+        writer.end_section()
+    writer.end_document()
+    yield
+
+
+def iter_ixbrl(rr_rows: List[Any], br_rows: List[Any], rr_concepts: Dict[Any, XbrlConcept],
+               br_concepts: Dict[Any, XbrlConcept], company_info: Dict[str, Any],
+               periods: Dict[int, FiscalPeriod]) -> Iterator[bytes]:
+    """The iXBRL document as a stream of byte chunks (for StreamingResponse)"""
+    buffer = _ChunkBuffer()
+    writer = IxbrlWriter(buffer, company_info, periods)
+    for _ in _write_sections(writer, rr_rows, br_rows, rr_concepts, br_concepts):
+        if buffer.size >= CHUNK_SIZE:
+            yield buffer.drain()
+    if buffer.size:
+        yield buffer.drain()
+
+
+def export_ixbrl_file(path: str, rr_rows: List[Any], br_rows: List[Any], rr_concepts: Dict[Any, XbrlConcept],
+                      br_concepts: Dict[Any, XbrlConcept], company_info: Dict[str, Any],
+                      periods: Dict[int, FiscalPeriod]) -> str:
+    """Write the iXBRL document to path, chunk by chunk"""
+    # Written under a temporary name so an interrupted export never leaves a half document behind
+    staging = f"{path}.tmp"
+    with open(staging, 'wb') as out:
+        for chunk in iter_ixbrl(rr_rows, br_rows, rr_concepts, br_concepts, company_info, periods):
+            out.write(chunk)
+    os.replace(staging, path)
+    return path
@@ -0,0 +1,343 @@
+"""
+In-memory snapshot of the mapping configuration
+Loads variable_mapping_rr/br/ink2, global_variables and accounts_table once and
+hot-swaps a fresh snapshot from a background task when the tables change
+"""
+
+import os
+import time
+import json
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional
+from services.compiled_mappings import CompiledMapping, compile_report_mappings, compile_ink2_mappings, first_by_variable
+
+# Tables that make up the mapping configuration
+MAPPING_TABLES = [
+    'variable_mapping_rr',
+    'variable_mapping_br',
+    'variable_mapping_ink2',
+    'global_variables',
+    'accounts_table',
+]
+
+
+def _normalize_global_variables(rows: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Normalize global variable values to floats; treat % values as decimals"""
+    global_variables = {}
+    for var in rows:
+        name = var.get('variable_name')
+        raw = var.get('value')
+        had_percent = False
+        if isinstance(raw, str) and '%' in raw:
+            had_percent = True
+        if isinstance(raw, (int, float)):
+            value = float(raw)
+        else:
+            text = str(raw or '').strip().replace('%', '').replace(' ', '').replace(',', '.')
+            try:
+                value = float(text)
+            except ValueError:
+                value = 0.0
+        if had_percent or name.lower().startswith('skattesats'):
+            # Convert percent like 20.6 to 0.206
+            value = value / 100.0
+        global_variables[name] = value
+    return global_variables
+
+
+class AccountTextIndex:
+    """
+    Account texts indexed by account number.
+    BAS accounts are four digits, so texts live in a flat list indexed by the
+    account number; anything outside that range goes to a small overflow dict.
+    Accounts looked up in the database but not found are cached as missing.
+    """
+
+    SIZE = 10000
+    _MISSING = object()
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self._texts: List[Any] = [None] * self.SIZE
+        self._overflow: Dict[str, Any] = {}
+        for acc in rows:
+            acc_id = acc.get('account_id')
+            self._set(acc_id, acc.get('account_text') or f"Konto {acc_id}")
+
+    def _slot(self, account_id: Any) -> Optional[int]:
+        try:
+            number = int(account_id)
+        except (TypeError, ValueError):
+            return None
+        return number if 0 <= number < self.SIZE else None
+
+    def _set(self, account_id: Any, value: Any):
+        slot = self._slot(account_id)
+        if slot is not None:
+            self._texts[slot] = value
+        else:
+            self._overflow[str(account_id)] = value
+
+    def _lookup(self, account_id: Any) -> Any:
+        slot = self._slot(account_id)
+        if slot is not None:
+            return self._texts[slot]
+        return self._overflow.get(str(account_id))
+
+    def get(self, account_id: Any) -> Optional[str]:
+        """Account text, or None if unknown"""
+        value = self._lookup(account_id)
+        return None if value is None or value is self._MISSING else value
+
+    def text(self, account_id: Any) -> str:
+        """Account text with 'Konto XXXX' fallback"""
+        return self.get(account_id) or f'Konto {account_id}'
+
+    def unresolved(self, account_ids) -> List[str]:
+        """Account ids that have never been looked up"""
+        return sorted({str(acc_id) for acc_id in account_ids if self._lookup(acc_id) is None})
+
+    def prefetch(self, client, account_ids):
+        """Resolve all unknown account ids with a single batched query"""
+        pending = self.unresolved(account_ids)
+        if not pending:
+            return
+        try:
+            resp = client.table('accounts_table').select('account_id,account_text').in_('account_id', pending).execute()
+        except Exception as e:
+            print(f"Error fetching account texts: {e}")
+            return
+        for acc in resp.data or []:
+            acc_id = acc.get('account_id')
+            self._set(acc_id, acc.get('account_text') or f'Konto {acc_id}')
+        # Negative cache for accounts the table doesn't have
+        for acc_id in pending:
+            if self._lookup(acc_id) is None:
+                self._set(acc_id, self._MISSING)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Known account texts as accounts_table rows (for rebuilding the index elsewhere)"""
+        rows = [{'account_id': number, 'account_text': value}
+                for number, value in enumerate(self._texts)
+                if value is not None and value is not self._MISSING]
+        rows.extend({'account_id': account_id, 'account_text': value}
+                    for account_id, value in self._overflow.items() if value is not self._MISSING)
+        return rows
+
+    def __len__(self) -> int:
+        values = self._texts + list(self._overflow.values())
+        return sum(1 for value in values if value is not None and value is not self._MISSING)
+
+
+@dataclass(frozen=True)
+class MappingSnapshot:
+    """Immutable copy of all mapping tables, shared by every request"""
+    version: str
+    change_token: str
+    loaded_at: float
+    rr_mappings: List[Dict[str, Any]]
+    br_mappings: List[Dict[str, Any]]
+    ink2_mappings: List[Dict[str, Any]]
+    global_variables: Dict[str, float]
+    account_texts: AccountTextIndex
+    # Derived once per snapshot in __post_init__
+    rr_compiled: List[CompiledMapping] = field(init=False, compare=False, repr=False)
+    br_compiled: List[CompiledMapping] = field(init=False, compare=False, repr=False)
+    ink2_compiled: List[CompiledMapping] = field(init=False, compare=False, repr=False)
+    ink2_by_variable: Dict[str, Dict[str, Any]] = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'rr_compiled', compile_report_mappings(self.rr_mappings, 'RR'))
+        object.__setattr__(self, 'br_compiled', compile_report_mappings(self.br_mappings, 'BR'))
+        object.__setattr__(self, 'ink2_compiled', compile_ink2_mappings(self.ink2_mappings))
+        object.__setattr__(self, 'ink2_by_variable', first_by_variable(self.ink2_mappings))
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.loaded_at
+
+    def to_payload(self) -> Dict[str, Any]:
+        """Plain-data copy of the snapshot (for worker processes and snapshot files)"""
+        return {
+            'version': self.version,
+            'change_token': self.change_token,
+            'loaded_at': self.loaded_at,
+            'rr_mappings': self.rr_mappings,
+            'br_mappings': self.br_mappings,
+            'ink2_mappings': self.ink2_mappings,
+            'global_variables': self.global_variables,
+            'account_texts': self.account_texts.rows(),
+        }
+
+    @classmethod
+    def from_payload(cls, data: Dict[str, Any]) -> "MappingSnapshot":
+        """Rebuild a snapshot (and its compiled mappings) from to_payload()"""
+        return cls(
+            version=data['version'],
+            change_token=data.get('change_token', ''),
+            loaded_at=data.get('loaded_at', time.time()),
+            rr_mappings=data['rr_mappings'],
+            br_mappings=data['br_mappings'],
+            ink2_mappings=data['ink2_mappings'],
+            global_variables=data['global_variables'],
+            account_texts=AccountTextIndex(data.get('account_texts', [])),
+        )
+
+
+# PostgREST/Postgres error codes for a column the table doesn't have
+MISSING_COLUMN_CODES = {'42703', 'PGRST204'}
+
+
+def _is_missing_column(error: Exception) -> bool:
+    return getattr(error, 'code', None) in MISSING_COLUMN_CODES
+
+
+def fetch_change_token(client) -> str:
+    """
+    Cheap change indicator for the mapping tables: one single-row query per table.
+    Uses row count plus the latest updated_at (see the updated_at migration); a table
+    without the column falls back to row count plus the highest id, which misses
+    in-place edits. Any other error (network, auth) is raised to the caller.
+    """
+    parts = []
+    for table in MAPPING_TABLES:
+        try:
+            response = client.table(table).select('updated_at', count='exact').order('updated_at', desc=True).limit(1).execute()
+            latest = response.data[0].get('updated_at') if response.data else None
+            parts.append(f"{table}:{response.count}:{latest}")
+        except Exception as e:
+            if not _is_missing_column(e):
+                raise
+            response = client.table(table).select('id', count='exact').order('id', desc=True).limit(1).execute()
+            latest_id = response.data[0].get('id') if response.data else None
+            parts.append(f"{table}:{response.count}:id{latest_id}")
+    return '|'.join(parts)
+
+
+def load_mapping_snapshot(client, change_token: Optional[str] = None) -> MappingSnapshot:
+    """Load all mapping tables from the database into a new snapshot"""
+    if change_token is None:
+        change_token = fetch_change_token(client)
+
+    rr_mappings = client.table('variable_mapping_rr').select('*').execute().data
+    br_mappings = client.table('variable_mapping_br').select('*').execute().data
+    ink2_mappings = client.table('variable_mapping_ink2').select('*').execute().data
+    global_rows = client.table('global_variables').select('*').execute().data
+    account_rows = client.table('accounts_table').select('*').execute().data
+
+    # Version is derived from the content so identical configurations share a version
+    content = json.dumps([rr_mappings, br_mappings, ink2_mappings, global_rows, account_rows], sort_keys=True, default=str)
+    version = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+    return MappingSnapshot(
+        version=version,
+        change_token=change_token,
+        loaded_at=time.time(),
+        rr_mappings=rr_mappings,
+        br_mappings=br_mappings,
+        ink2_mappings=ink2_mappings,
+        global_variables=_normalize_global_variables(global_rows),
+        account_texts=AccountTextIndex(account_rows),
+    )
+
+
+def write_snapshot_file(snapshot: MappingSnapshot, path: str):
+    """Save a snapshot as JSON, so batch runs can be repeated with exactly the same mappings"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot.to_payload(), f, ensure_ascii=False, default=str)
+
+
+def read_snapshot_file(path: str) -> MappingSnapshot:
+    """Load a snapshot saved with write_snapshot_file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return MappingSnapshot.from_payload(json.load(f))
+
+
+class MappingRefresher:
+    """Background task that polls for mapping changes and hot-swaps the snapshot"""
+
+    def __init__(self, client, poll_interval: Optional[float] = None):
+        self.client = client
+        self.poll_interval = poll_interval or float(os.getenv('MAPPING_POLL_INTERVAL', '30'))
+        self._snapshot: Optional[MappingSnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.last_checked_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[MappingSnapshot]:
+        return self._snapshot
+
+    def refresh(self, change_token: Optional[str] = None) -> MappingSnapshot:
+        """Load a new snapshot and swap it in (blocking)"""
+        snapshot = load_mapping_snapshot(self.client, change_token)
+        previous = self._snapshot
+        self._snapshot = snapshot
+        self.last_checked_at = time.time()
+        self.last_error = None
+        if previous is None or previous.version != snapshot.version:
+            print(f"Loaded mapping snapshot {snapshot.version}: {len(snapshot.rr_mappings)} RR mappings, {len(snapshot.br_mappings)} BR mappings, and {len(snapshot.ink2_mappings)} INK2 mappings")
+        return snapshot
+
+    def get(self) -> MappingSnapshot:
+        """Current snapshot, loading synchronously only if none exists yet"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def poke(self):
+        """Ask the background task to check for changes right away"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """Load the initial snapshot and start polling"""
+        self._wakeup = asyncio.Event()
+        try:
+            await asyncio.to_thread(self.refresh)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error loading mappings: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                token = await asyncio.to_thread(fetch_change_token, self.client)
+                self.last_checked_at = time.time()
+                if self._snapshot is None or token != self._snapshot.change_token:
+                    await asyncio.to_thread(self.refresh, token)
+                self.last_error = None
+            except Exception as e:
+                # Keep serving the previous snapshot
+                self.last_error = str(e)
+                print(f"Error refreshing mappings: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot info for the health endpoint"""
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "age_seconds": round(snapshot.age_seconds, 1) if snapshot else None,
+            "last_checked_at": self.last_checked_at,
+            "poll_interval": self.poll_interval,
+            "last_error": self.last_error,
+        }
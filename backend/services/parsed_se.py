@@ -0,0 +1,109 @@
+"""
+Parsed SE file
+An SE file is read, decoded and parsed once into a ParsedSE, which carries the
+accounts, fiscal periods and company info that the upload and report pipelines
+need. The upload, RR/BR/INK2 and iXBRL paths use it and don't read the file again.
+Two legacy report renderers still do: create_management_report_from_rows and
+create_notes_pdf (see report_generator.build_report) get se_file_path and
+re-read and re-parse it in the render pool worker.
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Tuple
+
+# Encodings tried in order when decoding an SE file
+SE_ENCODINGS = ['iso-8859-1', 'windows-1252', 'utf-8', 'cp1252']
+
+
+def decode_se_content(raw: bytes) -> Tuple[str, str]:
+    """Decode SE file bytes, returning (text, encoding)"""
+    for encoding in SE_ENCODINGS:
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Kunde inte läsa SE-filen med någon av de försökta kodningarna")
+
+
+@dataclass(frozen=True)
+class FiscalPeriod:
+    """Räkenskapsår from a #RAR line (dates as YYYYMMDD)"""
+    start: str
+    end: str
+
+    @property
+    def year(self) -> int:
+        return int(self.start[:4])
+
+    @property
+    def start_iso(self) -> str:
+        return f"{self.start[:4]}-{self.start[4:6]}-{self.start[6:8]}"
+
+    @property
+    def end_iso(self) -> str:
+        return f"{self.end[:4]}-{self.end[4:6]}-{self.end[6:8]}"
+
+    @property
+    def label(self) -> str:
+        """Column heading for the year, e.g. '2024-01-01 – 2024-12-31'"""
+        return f"{self.start_iso} – {self.end_iso}"
+
+
+def parse_fiscal_periods(se_content: str) -> Dict[int, FiscalPeriod]:
+    """#RAR lines by year index (0 = current year, -1 = previous year)"""
+    periods: Dict[int, FiscalPeriod] = {}
+    for line in se_content.split('\n'):
+        line = line.strip()
+        if line.startswith('#RAR'):
+            parts = line.split()
+            if len(parts) >= 4:
+                try:
+                    periods[int(parts[1])] = FiscalPeriod(parts[2], parts[3])
+                except ValueError:
+                    continue
+    return periods
+
+
+@dataclass
+class ParsedSE:
+    """Everything parsed from one SE file, identified by the SHA-256 of its bytes"""
+    upload_id: str
+    encoding: str
+    content: str
+    current_accounts: Dict[str, float]
+    previous_accounts: Dict[str, float]
+    company_info: Dict[str, Any]
+    periods: Dict[int, FiscalPeriod] = field(default_factory=dict)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, parser, upload_id: Optional[str] = None) -> "ParsedSE":
+        """Decode and parse SE file bytes with the given DatabaseParser"""
+        content, encoding = decode_se_content(raw)
+        current_accounts, previous_accounts = parser.parse_account_balances(content)
+        return cls(
+            upload_id=upload_id or hashlib.sha256(raw).hexdigest(),
+            encoding=encoding,
+            content=content,
+            current_accounts=current_accounts,
+            previous_accounts=previous_accounts,
+            company_info=parser.extract_company_info(content),
+            periods=parse_fiscal_periods(content)
+        )
+
+    @classmethod
+    def from_file(cls, path: str, parser) -> "ParsedSE":
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read(), parser)
+
+    @property
+    def current_period(self) -> Optional[FiscalPeriod]:
+        return self.periods.get(0)
+
+    @property
+    def previous_period(self) -> Optional[FiscalPeriod]:
+        return self.periods.get(-1)
+
+    @property
+    def fiscal_year(self) -> Optional[int]:
+        return self.company_info.get('fiscal_year')
@@ -0,0 +1,123 @@
+"""
+ReportLab rendering of RR and BR
+Renders the calculation engine's rows (both years) straight to PDF. Fonts and
+paragraph styles are set up once per process and reused by every report.
+"""
+
+import os
+from xml.sax.saxutils import escape
+from typing import Dict, List, Any, Optional, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+from services.compiled_mappings import normalize_flag
+from services.report_rows import HEADING_STYLES, row_amount, row_fields, visible_rows
+from utils.helpers import format_currency
+
+LABEL_WIDTH = 110 * mm
+AMOUNT_WIDTH = 30 * mm
+
+
+def _register_fonts() -> Tuple[str, str]:
+    """Use the TTF fonts from REPORT_FONT_REGULAR/REPORT_FONT_BOLD if set, otherwise Helvetica"""
+    regular = os.getenv('REPORT_FONT_REGULAR')
+    bold = os.getenv('REPORT_FONT_BOLD')
+    if regular and bold:
+        try:
+            pdfmetrics.registerFont(TTFont('Report', regular))
+            pdfmetrics.registerFont(TTFont('Report-Bold', bold))
+            return 'Report', 'Report-Bold'
+        except Exception as e:
+            print(f"Kunde inte registrera typsnitt för rapporter: {e}")
+    return 'Helvetica', 'Helvetica-Bold'
+
+
+FONT, FONT_BOLD = _register_fonts()
+
+
+def _build_styles() -> Dict[str, ParagraphStyle]:
+    return {
+        'title': ParagraphStyle('ReportTitle', fontName=FONT_BOLD, fontSize=14, leading=18, spaceAfter=4 * mm),
+        'subtitle': ParagraphStyle('ReportSubtitle', fontName=FONT, fontSize=9, leading=11, spaceAfter=6 * mm),
+        'column': ParagraphStyle('ReportColumn', fontName=FONT_BOLD, fontSize=9, leading=11, alignment=TA_RIGHT),
+        'amount': ParagraphStyle('ReportAmount', fontName=FONT, fontSize=9, leading=11, alignment=TA_RIGHT),
+        'amount_bold': ParagraphStyle('ReportAmountBold', fontName=FONT_BOLD, fontSize=9, leading=11, alignment=TA_RIGHT),
+        'NORMAL': ParagraphStyle('ReportRow', fontName=FONT, fontSize=9, leading=11),
+        'BOLD': ParagraphStyle('ReportRowBold', fontName=FONT_BOLD, fontSize=9, leading=11),
+        'H0': ParagraphStyle('ReportH0', fontName=FONT_BOLD, fontSize=11, leading=14, spaceBefore=3 * mm),
+        'H1': ParagraphStyle('ReportH1', fontName=FONT_BOLD, fontSize=10, leading=13, spaceBefore=2 * mm),
+        'H2': ParagraphStyle('ReportH2', fontName=FONT_BOLD, fontSize=9, leading=12, spaceBefore=1 * mm),
+        'H3': ParagraphStyle('ReportH3', fontName=FONT, fontSize=9, leading=12),
+    }
+
+
+# Built once per process (also in the render pool workers) and shared by all reports
+STYLES = _build_styles()
+
+
+def _amount_cell(row: Any, use_previous_year: bool, bold: bool) -> Any:
+    if not normalize_flag(row_fields(row).get('show_amount')):
+        return ''
+    amount = row_amount(row, use_previous_year)
+    if amount is None:
+        return ''
+    return Paragraph(format_currency(amount), STYLES['amount_bold' if bold else 'amount'])
+
+
+def _row_style(fields: Dict[str, Any]) -> ParagraphStyle:
+    style = fields.get('style')
+    if style in HEADING_STYLES:
+        return STYLES[style]
+    return STYLES['BOLD' if fields.get('bold') else 'NORMAL']
+
+
+def render_report_section(path: str, title: str, rows: List[Any], current_label: str, previous_label: str,
+                          company_name: Optional[str] = None) -> str:
+    """Render RR or BR rows as a table with amounts for both years"""
+    table_rows = [['', Paragraph(escape(str(current_label)), STYLES['column']),
+                   Paragraph(escape(str(previous_label)), STYLES['column'])]]
+    for row in visible_rows(rows):
+        fields = row_fields(row)
+        bold = bool(fields.get('bold'))
+        table_rows.append([
+            Paragraph(escape(fields.get('label') or ''), _row_style(fields)),
+            _amount_cell(row, False, bold),
+            _amount_cell(row, True, bold),
+        ])
+
+    table = Table(table_rows, colWidths=[LABEL_WIDTH, AMOUNT_WIDTH, AMOUNT_WIDTH], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ]))
+
+    story = [Paragraph(escape(title), STYLES['title'])]
+    if company_name:
+        story.append(Paragraph(escape(company_name), STYLES['subtitle']))
+    story.append(table)
+
+    document = SimpleDocTemplate(path, pagesize=A4, title=title,
+                                 leftMargin=20 * mm, rightMargin=20 * mm, topMargin=20 * mm, bottomMargin=20 * mm)
+    document.build(story)
+    return path
+
+
+def render_rr_pdf(path: str, rr_data: List[Any], current_label: str, previous_label: str,
+                  company_name: Optional[str] = None) -> str:
+    """Resultaträkning för båda åren"""
+    return render_report_section(path, 'Resultaträkning', rr_data, current_label, previous_label, company_name)
+
+
+def render_br_pdf(path: str, br_data: List[Any], current_label: str, previous_label: str,
+                  company_name: Optional[str] = None) -> str:
+    """Balansräkning för båda åren"""
+    return render_report_section(path, 'Balansräkning', br_data, current_label, previous_label, company_name)
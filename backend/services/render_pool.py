@@ -0,0 +1,89 @@
+"""
+Process pool for PDF rendering
+Report sections are independent CPU-bound renders, so they run in separate
+processes and a report takes about as long as its slowest section instead of
+the sum of all of them.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Callable, Tuple
+
+# section name -> (renderer function name in services.report_generator, args, kwargs)
+RenderTask = Tuple[str, tuple, Dict[str, Any]]
+
+
+def _call_renderer(name: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+    # Looked up by name in the worker process, so the legacy import path set up
+    # by report_generator also applies there
+    from services import report_generator
+    return getattr(report_generator, name)(*args, **kwargs)
+
+
+class RenderPool:
+    """Lazily started process pool shared by all report jobs"""
+
+    def __init__(self, processes: Optional[int] = None):
+        if processes is None:
+            processes = int(os.getenv('REPORT_RENDER_PROCESSES', str(min(4, os.cpu_count() or 1))))
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+            return self._executor
+
+    def render(self, sections: Dict[str, RenderTask],
+               on_done: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+        """
+        Render all sections, in parallel when processes > 1.
+        on_done(section, completed_count) is called as each section finishes.
+        """
+        results: Dict[str, Any] = {}
+        if self.processes <= 1:
+            # REPORT_RENDER_PROCESSES=0/1 renders in the calling thread, in order
+            for section, (name, args, kwargs) in sections.items():
+                results[section] = _call_renderer(name, args, kwargs)
+                if on_done:
+                    on_done(section, len(results))
+            return results
+
+        executor = self._get_executor()
+        futures = {executor.submit(_call_renderer, name, args, kwargs): section
+                   for section, (name, args, kwargs) in sections.items()}
+        try:
+            for future in as_completed(futures):
+                section = futures[future]
+                results[section] = future.result()
+                if on_done:
+                    on_done(section, len(results))
+        except BrokenProcessPool:
+            # A renderer crashed its process - start a fresh pool for the next report
+            self._reset(executor)
+            raise
+        finally:
+            # One failed section fails the report; don't keep rendering the rest
+            for future in futures:
+                future.cancel()
+        return results
+
+    def _reset(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Global instance shared by the report jobs
+render_pool = RenderPool()
@@ -2,12 +2,22 @@ import os
 import sys
 import uuid
 import shutil
+import hashlib
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 import asyncio
 
+import orjson
+
 # Import the new database-driven parser
 from services.database_parser import DatabaseParser
+from services.render_pool import render_pool
+from services.pdf_renderer import render_rr_pdf, render_br_pdf
+from services.parsed_se import ParsedSE
+from services.artifact_store import Artifact, artifact_store
+
+# Höj när renderingen ändras så att lagrade rapporter inte återanvänds
+REPORT_FORMAT_VERSION = 1
 
 # Lägg till sökväg till original Python-kod
 sys.path.append('/Users/cem/Desktop/ÅR')
@@ -15,16 +25,11 @@ sys.path.append('/Users/cem/Desktop/ÅR')
 # Importera från original kod
 try:
     from merged_rr_br_not import (
-        extract_orgnr_from_se,
-        extract_fiscal_year_robust,
-        extract_account_balances_from_se,
         load_sru_from_se_file,
         create_rr_structure,
         create_br1_structure,
         process_br1_data,
         calculate_rr_sums,
-        export_pdf,
-        export_pdf_br,
         create_management_report_pdf,
         create_notes_pdf,
         merge_all_pdfs,
@@ -33,14 +38,51 @@ try:
 except ImportError as e:
     print(f"Varning: Kunde inte importera från original kod: {e}")
 
+def create_management_report_from_rows(output_path: str, se_file_path: str, rr_data: List[Dict[str, Any]], **kwargs):
+    """
+    Förvaltningsberättelsen renderas fortfarande av originalkoden, som vill ha
+    föregående års RR som DataFrame. Konverteringen sker här, i renderprocessen,
+    så att pandas inte laddas i API-processen.
+    """
+    import pandas as pd
+    
+    df_rr_prev = pd.DataFrame([
+        {
+            'Radrubrik': item['label'],
+            'Belopp': item['previous_amount'] if item['previous_amount'] is not None else 0.0,
+            'Level': item['level'],
+            'Style': item['style'],
+            'Bold': item['bold']
+        }
+        for item in rr_data
+    ])
+    return create_management_report_pdf(output_path, se_file_path, df_rr_prev, **kwargs)
+
+def report_input_key(parsed: ParsedSE, snapshot_version: Optional[str], request: 'ReportRequest') -> str:
+    """Hash of everything that determines a report's content"""
+    inputs = {
+        "format": REPORT_FORMAT_VERSION,
+        "se_file": parsed.upload_id,
+        "mappings": snapshot_version,
+        "input": request.model_dump(mode="json", exclude={"user_id", "se_file_path"})
+    }
+    return hashlib.sha256(orjson.dumps(inputs, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def section_key(section: str, *inputs: Any) -> str:
+    """Hash of the inputs a single report section is rendered from"""
+    return hashlib.sha256(orjson.dumps([REPORT_FORMAT_VERSION, section, inputs], option=orjson.OPT_SORT_KEYS)).hexdigest()
+
 class ReportGenerator:
     def __init__(self):
         self.reports_dir = "reports"
+        self.artifacts = artifact_store
         self.temp_dir = "temp"
         self._ensure_directories()
-        
-        # Initialize the new database-driven parser
-        self.database_parser = DatabaseParser()
+    
+    @property
+    def database_parser(self) -> DatabaseParser:
+        """Database-driven parser bound to the current mapping snapshot"""
+        return DatabaseParser()
     
     def _ensure_directories(self):
         """Skapar nödvändiga mappar"""
@@ -52,73 +94,63 @@ class ReportGenerator:
         Extraherar grundläggande företagsdata från .SE-fil
         """
         try:
-            # Extrahera organisationsnummer
-            organization_number = extract_orgnr_from_se(se_file_path)
-            
-            # Extrahera räkenskapsår
-            current_year, previous_year, current_end_date_raw, previous_end_date_raw, current_year_string, previous_year_string, current_end_date_iso, previous_end_date_iso = extract_fiscal_year_robust(se_file_path)
-            
-            # Extrahera kontosaldo för att få grundläggande info
-            account_balances, prev_year_balances = extract_account_balances_from_se(se_file_path)
+            parsed = ParsedSE.from_file(se_file_path, self.database_parser)
+            organization_number = parsed.company_info.get("organization_number")
+            current_period, previous_period = parsed.current_period, parsed.previous_period
             
             return {
                 "organization_number": organization_number,
-                "company_name": f"Företag {organization_number}",  # Kan förbättras med Allabolag-scraping
-                "fiscal_year": current_year,
-                "previous_year": previous_year,
-                "current_end_date": current_end_date_string,
-                "previous_end_date": previous_end_date_string,
-                "account_count": len(account_balances),
-                "has_data": len(account_balances) > 0
+                "company_name": parsed.company_info.get("company_name") or f"Företag {organization_number}",
+                "fiscal_year": current_period.year if current_period else None,
+                "previous_year": previous_period.year if previous_period else None,
+                "current_end_date": current_period.end_iso if current_period else None,
+                "previous_end_date": previous_period.end_iso if previous_period else None,
+                "account_count": len(parsed.current_accounts),
+                "has_data": len(parsed.current_accounts) > 0
             }
             
         except Exception as e:
             raise Exception(f"Fel vid extrahering av företagsdata: {str(e)}")
     
-    async def generate_full_report(self, request: 'ReportRequest') -> Dict[str, Any]:
+    async def generate_full_report(self, request: 'ReportRequest',
+                                   progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        """
+        Genererar komplett årsredovisning baserat på request (i en tråd, utanför event-loopen)
+        """
+        return await asyncio.to_thread(self.build_report, request, progress)
+    
+    def build_report(self, request: 'ReportRequest',
+                     progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
         """
-        Genererar komplett årsredovisning baserat på request
+        Genererar komplett årsredovisning; progress(stage, fraction) anropas mellan stegen
         """
+        report_progress = progress or (lambda stage, fraction: None)
         try:
             # Generera unikt rapport-ID
             report_id = str(uuid.uuid4())
             
-            # Skapa temporär mapp för denna rapport
-            temp_report_dir = os.path.join(self.temp_dir, report_id)
-            os.makedirs(temp_report_dir, exist_ok=True)
-            
-            # Kopiera .SE-fil till temporär mapp
-            temp_se_path = os.path.join(temp_report_dir, "data.se")
-            shutil.copy2(request.se_file_path, temp_se_path)
-            
-            # Read SE file content for the new parser
-            with open(temp_se_path, 'r', encoding='utf-8') as f:
-                se_content = f.read()
-            
             # Use the new database-driven parser
             print("🔄 Using new database-driven parser...")
+            report_progress("parsing", 0.05)
             
-            # Parse account balances using new parser
-            current_accounts, previous_accounts = self.database_parser.parse_account_balances(se_content)
-            print(f"📊 Parsed {len(current_accounts)} current year accounts, {len(previous_accounts)} previous year accounts")
-            
-            # Parse RR and BR data using new parser
-            rr_data = self.database_parser.parse_rr_data(current_accounts, previous_accounts)
-            br_data = self.database_parser.parse_br_data(current_accounts, previous_accounts)
+            parser = self.database_parser
             
-            # Parse INK2 data (tax calculations)
-            ink2_data = self.database_parser.parse_ink2_data(
-                current_accounts=current_accounts,
-                fiscal_year=company_data.get('fiscal_year')
-            )
+            # Läs och tolka .SE-filen en gång; alla steg nedan använder resultatet
+            parsed = ParsedSE.from_file(request.se_file_path, parser)
+            current_accounts, previous_accounts = parsed.current_accounts, parsed.previous_accounts
+            print(f"📊 Parsed {len(current_accounts)} current year accounts, {len(previous_accounts)} previous year accounts")
             
-            print(f"📈 Parsed {len(rr_data)} RR items, {len(br_data)} BR items, and {len(ink2_data)} INK2 items")
+            # Parse RR and BR data using new parser (BR uses calculated values from RR)
+            rr_data = parser.parse_rr_data(current_accounts, previous_accounts)
+            br_data = parser.parse_br_data(current_accounts, previous_accounts, rr_data)
             
-            # Store financial data in database
+            # Store financial data in database - also when the PDF is reused below, so every
+            # request writes the user's financial_data row
             company_id = request.company_data.organization_number  # Using organization_number as company_id for now
             fiscal_year = request.company_data.fiscal_year
+            report_progress("storing", 0.25)
             
-            stored_ids = self.database_parser.store_financial_data(
+            stored_ids = parser.store_financial_data(
                 company_id, 
                 fiscal_year, 
                 rr_data, 
@@ -126,15 +158,34 @@ class ReportGenerator:
             )
             print(f"💾 Stored financial data: {stored_ids}")
             
-            # Convert new parser data to old format for PDF generation
-            # This is a temporary bridge until PDF generation is updated
-            df_rr = self._convert_rr_data_to_old_format(rr_data)
-            df_rr_prev = self._convert_rr_data_to_old_format([])  # TODO: Extract previous year RR data
-            df_br = self._convert_br_data_to_old_format(br_data)
-            df_br_prev = self._convert_br_data_to_old_format([])  # TODO: Extract previous year BR data
+            # Samma fil, mappningar och användarinput ger samma rapport - återanvänd den lagrade PDF:en
+            input_key = report_input_key(parsed, parser.snapshot.version if parser.snapshot else None, request)
+            existing = self.artifacts.find_by_input(input_key)
+            if existing is not None:
+                print(f"♻️ Reusing stored report {existing.report_id} for identical input")
+                artifact = self.artifacts.link(report_id, existing, input_key)
+                return self._report_result(artifact, request, parsed, reused=True)
             
-            # Extrahera räkenskapsår för PDF-generering
-            current_year, previous_year, current_end_date_raw, previous_end_date_raw, current_year_string, previous_year_string, current_end_date_iso, previous_end_date_iso = extract_fiscal_year_robust(temp_se_path)
+            # Parse INK2 data (tax calculations)
+            ink2_data = parser.parse_ink2_data(
+                current_accounts=current_accounts,
+                fiscal_year=parsed.fiscal_year or request.company_data.fiscal_year,
+                rr_data=rr_data,
+                br_data=br_data
+            )
+            
+            print(f"📈 Parsed {len(rr_data)} RR items, {len(br_data)} BR items, and {len(ink2_data)} INK2 items")
+            
+            # Räkenskapsår för PDF-generering (från #RAR i den tolkade filen)
+            current_period, previous_period = parsed.current_period, parsed.previous_period
+            current_year = current_period.year if current_period else request.company_data.fiscal_year
+            previous_year = previous_period.year if previous_period else request.company_data.previous_year
+            current_year_string = current_period.label if current_period else str(current_year)
+            previous_year_string = previous_period.label if previous_period else str(previous_year)
+            
+            # Skapa temporär mapp för denna rapport
+            temp_report_dir = os.path.join(self.temp_dir, report_id)
+            os.makedirs(temp_report_dir, exist_ok=True)
             
             # Generera PDF:er
             rr_pdf_path = os.path.join(temp_report_dir, "RR_temp.pdf")
@@ -142,95 +193,90 @@ class ReportGenerator:
             forvaltning_pdf_path = os.path.join(temp_report_dir, "Forvaltning_temp.pdf")
             noter_pdf_path = os.path.join(temp_report_dir, "Not_temp.pdf")
             
-            # Skapa förvaltningsberättelse med användarinput
-            create_management_report_pdf(
-                forvaltning_pdf_path,
-                temp_se_path,
-                df_rr_prev,
-                verksamhet_text=request.company_data.get("business_description", "Bolaget skall driva konsultverksamhet..."),
-                sate=request.location,
-                vasentliga_handelser=request.significant_events,
-                ars_resultat_exakt=request.yearly_result,
-                balanserat_resultat_exakt=0  # Kan beräknas från BR
-            )
-            
-            # Exportera RR och BR
-            export_pdf(df_rr, df_rr_prev, rr_pdf_path, current_year_string, previous_year_string)
-            export_pdf_br(df_br, df_br_prev, br_pdf_path, current_end_date_string, previous_end_date_string)
+            # Sektionerna är oberoende - rendera dem parallellt i processpoolen
+            verksamhet_text = getattr(request.company_data, "business_description", None) or "Bolaget skall driva konsultverksamhet..."
+            sections = {
+                "forvaltning": ("create_management_report_from_rows", (forvaltning_pdf_path, request.se_file_path, rr_data), {
+                    "verksamhet_text": verksamhet_text,
+                    "sate": request.location,
+                    "vasentliga_handelser": request.significant_events,
+                    "ars_resultat_exakt": request.yearly_result,
+                    "balanserat_resultat_exakt": 0  # Kan beräknas från BR
+                }),
+                # RR och BR renderas direkt från raderna (båda åren)
+                "rr": ("render_rr_pdf", (rr_pdf_path, rr_data, current_year_string, previous_year_string), {
+                    "company_name": request.company_data.company_name
+                }),
+                "br": ("render_br_pdf", (br_pdf_path, br_data, request.company_data.current_end_date, request.company_data.previous_end_date), {
+                    "company_name": request.company_data.company_name
+                }),
+                "noter": ("create_notes_pdf", (noter_pdf_path, request.se_file_path), {
+                    "current_year": current_year,
+                    "previous_year": previous_year
+                })
+            }
+            # Varje sektion nycklas på det den renderas från; bara ändrade sektioner renderas om
+            section_keys = {
+                "forvaltning": section_key("forvaltning", parsed.upload_id, rr_data, sections["forvaltning"][2]),
+                "rr": section_key("rr", rr_data, current_year_string, previous_year_string, request.company_data.company_name),
+                "br": section_key("br", br_data, request.company_data.current_end_date, request.company_data.previous_end_date, request.company_data.company_name),
+                "noter": section_key("noter", parsed.upload_id, current_year, previous_year)
+            }
+            to_render = {
+                name: task for name, task in sections.items()
+                if not self.artifacts.copy_section(section_keys[name], task[1][0])
+            }
+            cached_sections = [name for name in sections if name not in to_render]
+            if cached_sections:
+                print(f"♻️ Reusing rendered sections: {', '.join(cached_sections)}")
             
-            # Skapa noter
-            create_notes_pdf(
-                noter_pdf_path,
-                temp_se_path,
-                current_year=current_year,
-                previous_year=previous_year
+            report_progress("rendering", 0.35 + 0.5 * len(cached_sections) / len(sections))
+            render_pool.render(
+                to_render,
+                on_done=lambda section, done: report_progress("rendering", 0.35 + 0.5 * (len(cached_sections) + done) / len(sections))
             )
+            for name, task in to_render.items():
+                self.artifacts.put_section(task[1][0], section_keys[name])
+            
+            report_progress("merging", 0.85)
             
-            # Slå samman alla PDF:er
-            final_pdf_path = os.path.join(self.reports_dir, f"arsredovisning_{report_id}.pdf")
-            merge_all_pdfs(forvaltning_pdf_path, rr_pdf_path, br_pdf_path, noter_pdf_path, final_pdf_path)
+            # Slå samman alla PDF:er och lägg resultatet i artefaktlagret
+            merged_pdf_path = os.path.join(temp_report_dir, "arsredovisning.pdf")
+            merge_all_pdfs(forvaltning_pdf_path, rr_pdf_path, br_pdf_path, noter_pdf_path, merged_pdf_path)
+            artifact = self.artifacts.put_file(merged_pdf_path, report_id, input_key)
             
             # Rensa upp temporära filer
             shutil.rmtree(temp_report_dir)
             
-            return {
-                "report_id": report_id,
-                "pdf_path": final_pdf_path,
-                "generated_at": datetime.now().isoformat(),
-                "company_name": request.company_data.company_name,
-                "fiscal_year": request.company_data.fiscal_year,
-                "parsed_accounts": len(current_accounts),
-                "rr_items": len(rr_data),
-                "br_items": len(br_data)
-            }
+            return self._report_result(artifact, request, parsed, rr_items=len(rr_data), br_items=len(br_data),
+                                       cached_sections=cached_sections)
             
         except Exception as e:
             raise Exception(f"Fel vid generering av rapport: {str(e)}")
     
-    def _convert_rr_data_to_old_format(self, rr_data: List[Dict[str, Any]]) -> Any:
-        """Convert new RR data format to old format for PDF generation"""
-        # This is a temporary bridge function
-        # TODO: Update PDF generation to use new format directly
-        import pandas as pd
-        
-        if not rr_data:
-            return pd.DataFrame()
-        
-        # Convert to DataFrame format expected by old PDF generation
-        df_data = []
-        for item in rr_data:
-            df_data.append({
-                'Radrubrik': item['label'],
-                'Belopp': item['current_amount'] if item['current_amount'] is not None else 0.0,
-                'Level': item['level'],
-                'Style': item['style'],
-                'Bold': item['bold']
-            })
-        
-        return pd.DataFrame(df_data)
+    def _report_result(self, artifact: Artifact, request: 'ReportRequest', parsed: ParsedSE,
+                       reused: bool = False, **counts) -> Dict[str, Any]:
+        return {
+            "report_id": artifact.report_id,
+            "pdf_path": artifact.path,
+            "sha256": artifact.sha256,
+            "size": artifact.size,
+            "reused": reused,
+            "generated_at": datetime.now().isoformat(),
+            "company_name": request.company_data.company_name,
+            "fiscal_year": request.company_data.fiscal_year,
+            "parsed_accounts": len(parsed.current_accounts),
+            **counts
+        }
     
-    def _convert_br_data_to_old_format(self, br_data: List[Dict[str, Any]]) -> Any:
-        """Convert new BR data format to old format for PDF generation"""
-        # This is a temporary bridge function
-        # TODO: Update PDF generation to use new format directly
-        import pandas as pd
-        
-        if not br_data:
-            return pd.DataFrame()
-        
-        # Convert to DataFrame format expected by old PDF generation
-        df_data = []
-        for item in br_data:
-            df_data.append({
-                'Radrubrik': item['label'],
-                'Belopp': item['current_amount'] if item['current_amount'] is not None else 0.0,
-                'Level': item['level'],
-                'Style': item['style'],
-                'Bold': item['bold'],
-                'Type': item.get('type', 'asset')
-            })
-        
-        return pd.DataFrame(df_data)
+    def find_report(self, report_id: str) -> Optional[Artifact]:
+        """Lagrad rapport för ett rapport-ID (äldre rapporter ligger direkt i reports/)"""
+        artifact = self.artifacts.resolve(report_id)
+        if artifact is None:
+            legacy_path = self.get_report_path(report_id)
+            if os.path.isfile(legacy_path):
+                return Artifact(report_id, None, legacy_path, os.path.getsize(legacy_path))
+        return artifact
     
     def get_report_path(self, report_id: str) -> str:
         """Hämtar sökväg till genererad rapport"""
@@ -0,0 +1,275 @@
+"""
+Report generation jobs
+/generate-report only submits a job and returns its id; a bounded pool of local
+workers renders the reports. Jobs live in a SQLite table so status and progress
+can be polled from any worker process and survive restarts.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+import orjson
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    request BLOB NOT NULL,
+    result BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS report_jobs_status ON report_jobs (status, updated_at);
+"""
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# progress(stage, fraction) - called from the worker thread while a report renders
+ProgressCallback = Callable[[str, float], None]
+JobRunner = Callable[[str, Dict[str, Any], ProgressCallback], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    """Raised when more jobs are waiting than REPORT_QUEUE_LIMIT allows"""
+
+
+class UserQuotaError(Exception):
+    """Raised when a user already has REPORT_JOBS_PER_USER jobs queued or running"""
+
+
+class ReportJobStore:
+    """SQLite table of report jobs (one connection per thread, WAL for concurrent readers)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect()
+
+    @classmethod
+    def from_env(cls) -> "ReportJobStore":
+        return cls(os.getenv('REPORT_JOBS_DB') or os.path.join('temp', 'report_jobs.sqlite3'))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id: str, user_id: Optional[str], request: Dict[str, Any]):
+        now = time.time()
+        self._connect().execute(
+            'INSERT INTO report_jobs (job_id, user_id, status, stage, progress, request, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, 0, ?, ?, ?)',
+            (job_id, user_id, QUEUED, QUEUED, orjson.dumps(request), now, now)
+        )
+
+    def mark_running(self, job_id: str):
+        now = time.time()
+        self._connect().execute(
+            'UPDATE report_jobs SET status = ?, started_at = ?, updated_at = ? WHERE job_id = ?',
+            (RUNNING, now, now, job_id)
+        )
+
+    def set_progress(self, job_id: str, stage: str, progress: float):
+        self._connect().execute(
+            'UPDATE report_jobs SET stage = ?, progress = ?, updated_at = ? WHERE job_id = ?',
+            (stage, max(0.0, min(progress, 1.0)), time.time(), job_id)
+        )
+
+    def finish(self, job_id: str, result: Dict[str, Any]):
+        now = time.time()
+        self._connect().execute(
+            'UPDATE report_jobs SET status = ?, stage = ?, progress = 1, result = ?, updated_at = ?, finished_at = ? '
+            'WHERE job_id = ?',
+            (DONE, DONE, orjson.dumps(result), now, now, job_id)
+        )
+
+    def fail(self, job_id: str, error: str):
+        now = time.time()
+        self._connect().execute(
+            'UPDATE report_jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE job_id = ?',
+            (FAILED, error, now, now, job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            'SELECT job_id, user_id, status, stage, progress, result, error, created_at, started_at, finished_at '
+            'FROM report_jobs WHERE job_id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = orjson.loads(job['result']) if job['result'] else None
+        return job
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            'SELECT job_id, status, stage, progress, updated_at FROM report_jobs WHERE job_id = ?',
+            (job_id,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def fail_stale(self, max_age: float) -> int:
+        """Fail active jobs that haven't reported progress for max_age seconds (their worker died)"""
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE report_jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? '
+            'WHERE status IN (?, ?) AND updated_at < ?',
+            (FAILED, 'Jobbet avbröts (servern startades om)', now, now, *ACTIVE_STATES, now - max_age)
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute('SELECT status, COUNT(*) FROM report_jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+
+class ReportJobQueue:
+    """Bounded queue of report jobs processed by a fixed number of worker tasks"""
+
+    def __init__(self, store: ReportJobStore, runner: Optional[JobRunner] = None,
+                 workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.store = store
+        self.runner = runner
+        self.workers = workers or int(os.getenv('REPORT_WORKERS', '2'))
+        self.max_pending = max_pending or int(os.getenv('REPORT_QUEUE_LIMIT', '20'))
+        self.stale_after = float(os.getenv('REPORT_JOB_STALE_SECONDS', '900'))
+        # One user can't fill the queue for everybody else
+        self.max_per_user = int(os.getenv('REPORT_JOBS_PER_USER', '3'))
+        self._active_users: Dict[str, int] = {}
+        # Submissions waiting for their job row to be written (they already count against the queue)
+        self._reserved = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.running = 0
+
+    async def start(self, runner: Optional[JobRunner] = None):
+        if runner is not None:
+            self.runner = runner
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        try:
+            failed = await asyncio.to_thread(self.store.fail_stale, self.stale_after)
+            if failed:
+                print(f"Marked {failed} interrupted report job(s) as failed")
+        except Exception as e:
+            print(f"Error checking for interrupted report jobs: {e}")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def submit(self, user_id: Optional[str], request: Dict[str, Any]) -> str:
+        """
+        Register a job and queue it; raises QueueFullError/UserQuotaError instead of waiting.
+        The queue and the per-user counts are only touched on the event loop; just the
+        job row is written in a thread.
+        """
+        if self._queue is None:
+            raise RuntimeError("Report job queue is not started")
+        if self._queue.qsize() + self._reserved >= self.max_pending:
+            raise QueueFullError(f"{self._queue.qsize() + self._reserved} rapporter väntar redan")
+        if user_id and self._active_users.get(user_id, 0) >= self.max_per_user:
+            raise UserQuotaError(f"{self.max_per_user} rapporter genereras redan för användaren")
+        job_id = str(uuid.uuid4())
+        # Reserve the queue slot and the user's quota while the row is written
+        self._reserved += 1
+        self._user_started(user_id)
+        try:
+            await asyncio.to_thread(self.store.create, job_id, user_id, request)
+        except BaseException:
+            self._user_finished(user_id)
+            raise
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait((job_id, user_id, request))
+        return job_id
+
+    def _user_started(self, user_id: Optional[str]):
+        if user_id:
+            self._active_users[user_id] = self._active_users.get(user_id, 0) + 1
+
+    def _user_finished(self, user_id: Optional[str]):
+        if user_id:
+            remaining = self._active_users.get(user_id, 0) - 1
+            if remaining > 0:
+                self._active_users[user_id] = remaining
+            else:
+                self._active_users.pop(user_id, None)
+
+    async def _worker(self):
+        while True:
+            job_id, user_id, request = await self._queue.get()
+            self.running += 1
+            try:
+                await asyncio.to_thread(self.store.mark_running, job_id)
+                progress = lambda stage, fraction: self._report_progress(job_id, stage, fraction)
+                result = await self.runner(job_id, request, progress)
+                await asyncio.to_thread(self.store.finish, job_id, result)
+            except asyncio.CancelledError:
+                await asyncio.to_thread(self.store.fail, job_id, 'Jobbet avbröts')
+                raise
+            except Exception as e:
+                print(f"Report job {job_id} failed: {e}")
+                await asyncio.to_thread(self.store.fail, job_id, str(e))
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+                self._user_finished(user_id)
+
+    def _report_progress(self, job_id: str, stage: str, fraction: float):
+        # Progress is best effort - a failed update must not fail the report
+        try:
+            self.store.set_progress(job_id, stage, fraction)
+        except Exception as e:
+            print(f"Error updating progress for report job {job_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue info for the health endpoint"""
+        try:
+            counts = self.store.counts()
+        except Exception as e:
+            counts = {"error": str(e)}
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "pending": (self._queue.qsize() if self._queue is not None else 0) + self._reserved,
+            "max_pending": self.max_pending,
+            "max_per_user": self.max_per_user,
+            "jobs": counts,
+        }
+
+
+# Global instance; the runner is attached when main.py starts it
+report_jobs = ReportJobQueue(ReportJobStore.from_env())
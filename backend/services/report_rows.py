@@ -0,0 +1,94 @@
+"""
+Row objects used by the calculation engine
+A row holds a reference to the static row fields (shared by every request using
+the same mapping snapshot) plus its own amounts. Dicts are only built at the
+serialization boundary.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional
+
+# Row visibility in rendered reports follows the report preview in the frontend
+HEADING_STYLES = {'H0', 'H1', 'H2', 'H3'}
+BLOCK_HEADING_STYLES = HEADING_STYLES | {'S1', 'S2', 'S3'}
+
+
+@dataclass(slots=True)
+class ReportRow:
+    """RR/BR row: shared static fields plus the amounts for both years"""
+    meta: Dict[str, Any]
+    current_amount: Optional[float] = None
+    previous_amount: Optional[float] = None
+
+    @property
+    def variable_name(self) -> Optional[str]:
+        return self.meta['variable_name']
+
+    def amount(self, use_previous_year: bool = False) -> Optional[float]:
+        return self.previous_amount if use_previous_year else self.current_amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.meta, 'current_amount': self.current_amount, 'previous_amount': self.previous_amount}
+
+
+@dataclass(slots=True)
+class Ink2Row:
+    """INK2 row: shared static fields plus the calculated amount"""
+    meta: Dict[str, Any]
+    amount: float = 0.0
+    has_account_details: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.meta, 'amount': self.amount, 'has_account_details': self.has_account_details}
+
+
+def rows_to_dicts(rows) -> List[Dict[str, Any]]:
+    return [row.to_dict() for row in rows]
+
+
+def index_by_variable(rows) -> Dict[str, Any]:
+    """variable_name -> first row with that name (rows may be row objects or dicts)"""
+    index: Dict[str, Any] = {}
+    for row in rows or []:
+        variable_name = row.variable_name if isinstance(row, ReportRow) else row.get('variable_name')
+        if variable_name is not None and variable_name not in index:
+            index[variable_name] = row
+    return index
+
+
+def row_amount(row: Any, use_previous_year: bool = False) -> Optional[float]:
+    """Amount of a row object or row dict"""
+    if isinstance(row, ReportRow):
+        return row.amount(use_previous_year)
+    return row.get('previous_amount' if use_previous_year else 'current_amount')
+
+
+def row_fields(row: Any) -> Dict[str, Any]:
+    """Static fields of a row object or row dict"""
+    return row.meta if isinstance(row, ReportRow) else row
+
+
+def _has_amount(row: Any) -> bool:
+    return any(amount not in (None, 0) for amount in (row_amount(row), row_amount(row, True)))
+
+
+def visible_rows(rows: List[Any]) -> List[Any]:
+    """Rows shown in the report: non-zero amounts, always_show rows and headings of blocks with content"""
+    blocks_with_content = set()
+    for row in rows:
+        fields = row_fields(row)
+        if fields.get('block_group') and fields.get('style') not in BLOCK_HEADING_STYLES:
+            if _has_amount(row) or fields.get('always_show') is True:
+                blocks_with_content.add(fields['block_group'])
+
+    visible = []
+    for row in rows:
+        fields = row_fields(row)
+        if fields.get('style') in HEADING_STYLES:
+            block_group = fields.get('block_group')
+            show = block_group in blocks_with_content if block_group else fields.get('always_show') is True
+        else:
+            show = _has_amount(row) or fields.get('always_show') is True
+        if show:
+            visible.append(row)
+    return visible
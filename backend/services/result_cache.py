@@ -0,0 +1,139 @@
+"""
+Result cache for SE uploads
+Re-uploading the same file against the same mapping snapshot gives the same result,
+so parsed ledgers and RR/BR/INK2 results are kept keyed by
+(SHA-256 of the file, mapping snapshot version) with LRU and size-bounded eviction.
+Misses fall through to the shared SQLite cache (see shared_cache.py) when enabled.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
+
+import orjson
+
+from services.shared_cache import SharedResultCache
+
+# Fields of UploadResult that are persisted in the shared cache
+PERSISTED_FIELDS = ('upload_id', 'snapshot_version', 'current_accounts', 'previous_accounts',
+                    'company_info', 'account_details', 'response_data', 'stored_ids')
+
+
+@dataclass
+class UploadResult:
+    """Everything an upload produces, shared read-only between cache hits"""
+    upload_id: str
+    snapshot_version: Optional[str]
+    current_accounts: Dict[str, float]
+    previous_accounts: Dict[str, float]
+    company_info: Dict[str, Any]
+    account_details: Dict[str, List[Dict[str, Any]]]
+    # Full-layout response data (rr_data/br_data/ink2_data included)
+    response_data: Dict[str, Any]
+    # IDs from store_financial_data; empty if the write failed (retried on the next hit)
+    stored_ids: Optional[Dict[str, str]] = None
+    size: int = 0
+    created_at: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        if not self.size:
+            self.size = estimate_size(self)
+
+    @property
+    def store_pending(self) -> bool:
+        """The financial_data write hasn't succeeded yet (it only happens with an organization number)"""
+        return bool(self.company_info.get('organization_number')) and not self.stored_ids
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in PERSISTED_FIELDS}
+
+    @classmethod
+    def from_payload(cls, data: Dict[str, Any]) -> "UploadResult":
+        # Entries written before stored_ids was persisted count as not stored
+        return cls(**{name: data[name] for name in PERSISTED_FIELDS if name in data})
+
+
+def estimate_size(result: UploadResult) -> int:
+    """Approximate memory footprint: the serialized size of the cached data"""
+    return len(orjson.dumps([result.response_data, result.previous_accounts, result.account_details]))
+
+
+class ResultCache:
+    """Thread-safe LRU of upload results bounded by entry count and total size"""
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 shared: Optional[SharedResultCache] = None):
+        self.max_entries = max_entries or int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '256'))
+        self.max_bytes = max_bytes or int(os.getenv('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+        self._entries: "OrderedDict[Tuple[str, Optional[str]], UploadResult]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = shared
+
+    def get(self, upload_id: str, snapshot_version: Optional[str]) -> Optional[UploadResult]:
+        key = (upload_id, snapshot_version)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        
+        # Another worker may already have computed it
+        if self.shared is not None:
+            data = self.shared.get(upload_id, snapshot_version)
+            if data is not None:
+                return self._store(UploadResult.from_payload(data))
+        return None
+
+    def put(self, result: UploadResult) -> UploadResult:
+        self._store(result)
+        if self.shared is not None:
+            self.shared.put(result.upload_id, result.snapshot_version, result.to_payload())
+        return result
+
+    def _store(self, result: UploadResult) -> UploadResult:
+        if result.size > self.max_bytes:
+            # Larger than the whole cache - not worth evicting everything for
+            return result
+        key = (result.upload_id, result.snapshot_version)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = result
+            self._bytes += result.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache info for the health endpoint"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared.stats() if self.shared is not None else None,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Global instance shared by the API routes
+result_cache = ResultCache(shared=SharedResultCache.from_env())
@@ -0,0 +1,84 @@
+"""
+Static row skeleton for RR/BR/INK2
+The row metadata (labels, styles, levels, formulas, explainers...) only depends on
+the mapping snapshot, so it is served once per snapshot version and compact
+responses carry just the amounts, in skeleton order
+"""
+
+import threading
+from typing import Dict, List, Any, Optional
+
+# Rows hidden from the INK2 output (see parse_ink2_data)
+HIDDEN_INK2_ROWS = {'INK4_header'}
+
+_cache: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def build_row_skeleton(parser) -> Dict[str, Any]:
+    """Build the static row metadata for all three reports"""
+    version = parser.snapshot.version if parser.snapshot else 'none'
+
+    rr_rows = [parser.build_row_metadata(mapping, 'RR') for mapping in parser.rr_mappings or []]
+    br_rows = [parser.build_row_metadata(mapping, 'BR') for mapping in parser.br_mappings or []]
+    rr_rows.sort(key=lambda x: int(x['id']))
+    br_rows.sort(key=lambda x: int(x['id']))
+
+    ink2_mappings = sorted(parser.ink2_mappings or [], key=lambda x: x.get('row_id', 0))
+    ink2_rows = [
+        parser.build_ink2_row_metadata(mapping)
+        for mapping in ink2_mappings
+        if mapping.get('variable_name', '') not in HIDDEN_INK2_ROWS
+    ]
+
+    return {
+        "version": version,
+        "rr": rr_rows,
+        "br": br_rows,
+        "ink2": ink2_rows,
+    }
+
+
+def get_row_skeleton(parser) -> Dict[str, Any]:
+    """Skeleton for the parser's snapshot, built once per snapshot version"""
+    if parser.snapshot is None:
+        return build_row_skeleton(parser)
+    version = parser.snapshot.version
+    skeleton = _cache.get(version)
+    if skeleton is None:
+        skeleton = build_row_skeleton(parser)
+        with _lock:
+            # Only the latest version is worth keeping
+            _cache.clear()
+            _cache[version] = skeleton
+    return skeleton
+
+
+def _align(rows: List[Dict[str, Any]], skeleton_rows: List[Dict[str, Any]], key: str, field: str) -> List[Any]:
+    """Values of field from rows, ordered like skeleton_rows (None for missing rows)"""
+    values = {row.get(key): row.get(field) for row in rows}
+    return [values.get(row[key]) for row in skeleton_rows]
+
+
+def compact_rows(skeleton: Dict[str, Any], rr_data: Optional[List[Dict[str, Any]]] = None,
+                 br_data: Optional[List[Dict[str, Any]]] = None,
+                 ink2_data: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Amounts-only representation as parallel arrays in skeleton order"""
+    compact: Dict[str, Any] = {"skeleton_version": skeleton["version"]}
+    if rr_data is not None:
+        compact["rr"] = {
+            "current_amount": _align(rr_data, skeleton["rr"], 'id', 'current_amount'),
+            "previous_amount": _align(rr_data, skeleton["rr"], 'id', 'previous_amount'),
+        }
+    if br_data is not None:
+        compact["br"] = {
+            "current_amount": _align(br_data, skeleton["br"], 'id', 'current_amount'),
+            "previous_amount": _align(br_data, skeleton["br"], 'id', 'previous_amount'),
+        }
+    if ink2_data is not None:
+        # By row_id: INK2 variable names may be empty or repeated
+        compact["ink2"] = {
+            "amount": _align(ink2_data, skeleton["ink2"], 'row_id', 'amount'),
+            "has_account_details": _align(ink2_data, skeleton["ink2"], 'row_id', 'has_account_details'),
+        }
+    return compact
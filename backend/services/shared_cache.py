@@ -0,0 +1,219 @@
+"""
+Shared second-level result cache
+A SQLite file that all uvicorn workers on the host read and write, so a result
+computed by one worker is a hit for the others. Entries are checksummed and the
+file is kept under a size budget by evicting the least recently used entries.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows: a corrupt cache file is left alone and L2 is disabled
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_results (
+    upload_id TEXT NOT NULL,
+    snapshot_version TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    checksum TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (upload_id, snapshot_version)
+);
+CREATE INDEX IF NOT EXISTS upload_results_last_access ON upload_results (last_access);
+"""
+
+
+def _checksum(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+class SharedResultCache:
+    """SQLite-backed cache of upload results (as plain dicts) shared between worker processes"""
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes or int(os.getenv('RESULT_CACHE_DB_MAX_BYTES', str(256 * 1024 * 1024)))
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.last_error: Optional[str] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open_checked()
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedResultCache"]:
+        """Cache at RESULT_CACHE_DB (temp/result_cache.sqlite3 by default); empty value disables it"""
+        path = os.getenv('RESULT_CACHE_DB', os.path.join('temp', 'result_cache.sqlite3'))
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            print(f"Shared result cache disabled: {e}")
+            return None
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers in other workers run during writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _quick_check(self) -> Optional[str]:
+        """None if the file is fine, otherwise what is wrong with it.
+        OperationalError (locked, busy, no permission) is raised: the file isn't corrupt."""
+        try:
+            result = self._connect().execute('PRAGMA quick_check').fetchone()
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError as e:
+            return str(e)
+        if result and result[0] == 'ok':
+            return None
+        return str(result)
+
+    def _open_checked(self):
+        """
+        Open the cache file, recreating it only if SQLite reports it as corrupt.
+        Any other error propagates, and from_env disables L2 for this process.
+        """
+        problem = self._quick_check()
+        if problem is None:
+            return
+        if fcntl is None:
+            raise RuntimeError(f"cache file is corrupt ({problem})")
+        # Other workers may hit the same corrupt file; only one of them recreates it
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._close()
+                problem = self._quick_check()
+                if problem is None:
+                    # Recreated by another worker while we waited for the lock
+                    return
+                print(f"Shared result cache is corrupt ({problem}), recreating")
+                self._close()
+                for suffix in ('', '-wal', '-shm'):
+                    try:
+                        os.remove(self.path + suffix)
+                    except FileNotFoundError:
+                        pass
+                self._connect()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, upload_id: str, snapshot_version: Optional[str]) -> Optional[Dict[str, Any]]:
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT payload, checksum FROM upload_results WHERE upload_id = ? AND snapshot_version = ?',
+                (upload_id, snapshot_version or '')
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, checksum = row
+            if _checksum(payload) != checksum:
+                # Torn or corrupted entry - drop it and recompute
+                print(f"Shared result cache checksum mismatch for {upload_id}, discarding")
+                self.delete(upload_id, snapshot_version)
+                self.misses += 1
+                return None
+            conn.execute(
+                'UPDATE upload_results SET last_access = ? WHERE upload_id = ? AND snapshot_version = ?',
+                (time.time(), upload_id, snapshot_version or '')
+            )
+            data = orjson.loads(payload)
+            self.hits += 1
+            return data
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error reading shared result cache: {e}")
+            return None
+
+    def put(self, upload_id: str, snapshot_version: Optional[str], data: Dict[str, Any]):
+        try:
+            payload = orjson.dumps(data)
+            if len(payload) > self.max_bytes:
+                return
+            now = time.time()
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO upload_results '
+                '(upload_id, snapshot_version, payload, checksum, size, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (upload_id, snapshot_version or '', payload, _checksum(payload), len(payload), now, now)
+            )
+            self._evict(conn)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error writing shared result cache: {e}")
+
+    def delete(self, upload_id: str, snapshot_version: Optional[str]):
+        self._connect().execute(
+            'DELETE FROM upload_results WHERE upload_id = ? AND snapshot_version = ?',
+            (upload_id, snapshot_version or '')
+        )
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least recently used entries until the payloads fit the size budget"""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM upload_results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for upload_id, snapshot_version, size in conn.execute(
+                'SELECT upload_id, snapshot_version, size FROM upload_results ORDER BY last_access'
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute(
+                    'DELETE FROM upload_results WHERE upload_id = ? AND snapshot_version = ?',
+                    (upload_id, snapshot_version)
+                )
+                total -= size
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache info for the health endpoint"""
+        try:
+            entries, total = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM upload_results'
+            ).fetchone()
+        except Exception as e:
+            return {"path": self.path, "error": str(e)}
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "last_error": self.last_error,
+        }
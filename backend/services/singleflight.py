@@ -0,0 +1,42 @@
+"""
+Request coalescing
+Concurrent calls with the same key (double clicks, client retries) share one
+computation instead of each doing the full parse/evaluate/store.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; concurrent callers await its result"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            # Own task, so a caller that disconnects doesn't cancel it for the others
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+# Global instances shared by the API routes
+upload_flights = SingleFlight()
+recalc_flights = SingleFlight()
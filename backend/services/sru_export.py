@@ -0,0 +1,223 @@
+"""
+SRU export of INK2 for many companies
+Writes Skatteverket's SRU file pair for a batch of SE files: INFO.SRU describes
+the sender and BLANKETTER.SRU holds one blankett per company. The INK2 rows are
+calculated in a process pool (see batch_pipeline) and each blankett is appended
+to BLANKETTER.SRU as soon as it is ready, in input order, so memory use does
+not grow with the batch size.
+
+SRU field codes come from the sru_code column of variable_mapping_ink2; rows
+without a code are not exported.
+"""
+
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+
+from services.batch_pipeline import SeSource, create_pool, evaluate_se_bytes, worker_parser
+from services.compiled_mappings import CompiledMapping
+from services.mapping_snapshot import MappingSnapshot
+
+SRU_ENCODING = 'iso-8859-1'
+LINE_END = '\r\n'
+INFO_FILENAME = 'INFO.SRU'
+BLANKETTER_FILENAME = 'BLANKETTER.SRU'
+
+# Blankett name is <form>-<year>P<period>, e.g. INK2S-2024P4
+SRU_FORM = os.getenv('SRU_FORM', 'INK2S')
+SRU_PROGRAM = os.getenv('SRU_PROGRAM', 'Arsredovisning')
+
+# Räkenskapsårets början/slut, written on every blankett
+FIELD_PERIOD_START = '7011'
+FIELD_PERIOD_END = '7012'
+
+
+def sru_codes(compiled: List[CompiledMapping]) -> Dict[str, str]:
+    """variable_name -> SRU field code for the INK2 mappings that have one"""
+    codes: Dict[str, str] = {}
+    for item in compiled:
+        code = str(item.mapping.get('sru_code') or '').strip()
+        if code and item.variable_name and item.variable_name not in codes:
+            codes[item.variable_name] = code
+    return codes
+
+
+def sru_identity(organization_number: Optional[str]) -> str:
+    """Organisationsnummer as SRU identity (century prefix 16 + ten digits)"""
+    digits = re.sub(r'\D', '', organization_number or '')
+    if len(digits) == 10:
+        return f"16{digits}"
+    if len(digits) == 12:
+        return digits
+    raise ValueError(f"Ogiltigt organisationsnummer: {organization_number!r}")
+
+
+def declaration_period(end_date: str) -> int:
+    """Skatteverket's deklarationsperiod (1-4) for a fiscal year ending on end_date (YYYYMMDD)"""
+    month = int(end_date[4:6])
+    if month <= 4:
+        return 1
+    if month <= 6:
+        return 2
+    if month <= 8:
+        return 3
+    return 4
+
+
+def _clean(text: Any) -> str:
+    # One record per line; the value may not break it
+    return re.sub(r'[\r\n]+', ' ', str(text or '')).strip()
+
+
+def _timestamp(now: Optional[float] = None) -> str:
+    return time.strftime('%Y%m%d %H%M%S', time.localtime(now))
+
+
+def build_blankett(company_info: Dict[str, Any], period, ink2_rows: Iterable[Any], codes: Dict[str, str],
+                   created: Optional[str] = None) -> str:
+    """One #BLANKETT ... #BLANKETTSLUT block for a company"""
+    if period is None:
+        raise ValueError("Räkenskapsår (#RAR 0) saknas i SE-filen")
+    lines = [
+        f"#BLANKETT {SRU_FORM}-{period.end[:4]}P{declaration_period(period.end)}",
+        f"#IDENTITET {sru_identity(company_info.get('organization_number'))} {created or _timestamp()}",
+    ]
+    if company_info.get('company_name'):
+        lines.append(f"#NAMN {_clean(company_info['company_name'])}")
+    lines.append(f"#UPPGIFT {FIELD_PERIOD_START} {period.start}")
+    lines.append(f"#UPPGIFT {FIELD_PERIOD_END} {period.end}")
+
+    written = set()
+    for row in ink2_rows:
+        code = codes.get(row.meta.get('variable_name'))
+        if code is None or code in written:
+            continue
+        # Whole kronor without sign - the field itself says whether it adds or deducts
+        amount = abs(int(round(row.amount or 0)))
+        if amount == 0:
+            continue
+        written.add(code)
+        lines.append(f"#UPPGIFT {code} {amount}")
+    lines.append("#BLANKETTSLUT")
+    return LINE_END.join(lines) + LINE_END
+
+
+def blankett_for_file(source: SeSource, codes: Dict[str, str], created: str, parser=None) -> Dict[str, Any]:
+    """Calculate INK2 for one SE file and build its blankett; errors are returned, not raised"""
+    try:
+        evaluated = evaluate_se_bytes(source.read(), parser or worker_parser())
+        parsed = evaluated.parsed
+        block = build_blankett(parsed.company_info, parsed.current_period, evaluated.ink2_rows, codes, created)
+        return {"file": source.name, "ok": True, "organization_number": parsed.company_info.get('organization_number'),
+                "block": block}
+    except Exception as e:
+        return {"file": source.name, "ok": False, "error": str(e)}
+
+
+def _blankett_task(args) -> Dict[str, Any]:
+    # Module-level so the process pool can pickle it
+    source, codes, created = args
+    return blankett_for_file(source, codes, created)
+
+
+@dataclass
+class SruSender:
+    """Uppgiftslämnare written to INFO.SRU"""
+    organization_number: str
+    name: str
+    postal_code: str
+    city: str
+    address: Optional[str] = None
+    contact: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+
+
+def build_info(sender: SruSender, created: Optional[str] = None) -> str:
+    """INFO.SRU for the batch"""
+    lines = [
+        "#DATABESKRIVNING_START",
+        "#PRODUKT SRU",
+        f"#SKAPAD {created or _timestamp()}",
+        f"#PROGRAM {_clean(SRU_PROGRAM)}",
+        f"#FILNAMN {BLANKETTER_FILENAME}",
+        "#DATABESKRIVNING_SLUT",
+        "#MEDIELEV_START",
+        f"#ORGNR {sru_identity(sender.organization_number)}",
+        f"#NAMN {_clean(sender.name)}",
+    ]
+    if sender.address:
+        lines.append(f"#ADRESS {_clean(sender.address)}")
+    lines.append(f"#POSTNR {_clean(sender.postal_code).replace(' ', '')}")
+    lines.append(f"#POSTORT {_clean(sender.city)}")
+    for keyword, value in (('KONTAKT', sender.contact), ('EMAIL', sender.email), ('TELEFON', sender.phone)):
+        if value:
+            lines.append(f"#{keyword} {_clean(value)}")
+    lines.append("#MEDIELEV_SLUT")
+    return LINE_END.join(lines) + LINE_END
+
+
+@dataclass
+class SruExportResult:
+    output_dir: str
+    exported: int = 0
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        total = self.exported + len(self.failures)
+        return total / self.seconds if self.seconds else 0.0
+
+
+def _blanketts(sources: List[SeSource], snapshot: MappingSnapshot, codes: Dict[str, str], created: str,
+               processes: int, chunksize: int) -> Iterator[Dict[str, Any]]:
+    if processes <= 1:
+        from services.database_parser import DatabaseParser
+        parser = DatabaseParser(snapshot)
+        for source in sources:
+            yield blankett_for_file(source, codes, created, parser)
+        return
+    with create_pool(snapshot, processes) as executor:
+        # map keeps input order while the workers run ahead by up to chunksize files each
+        yield from executor.map(_blankett_task, ((source, codes, created) for source in sources),
+                                chunksize=chunksize)
+
+
+def export_sru_batch(sources: List[SeSource], output_dir: str, sender: SruSender, snapshot: MappingSnapshot,
+                     processes: Optional[int] = None, chunksize: int = 8) -> SruExportResult:
+    """
+    Write INFO.SRU and BLANKETTER.SRU for all SE files in sources (see collect_se_sources).
+    Files that fail are left out and reported in the result; the rest are exported.
+    """
+    codes = sru_codes(snapshot.ink2_compiled)
+    if not codes:
+        raise ValueError("Inga SRU-koder i variable_mapping_ink2 (kolumnen sru_code)")
+    processes = processes if processes is not None else (os.cpu_count() or 1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    created = _timestamp()
+    info = build_info(sender, created)
+    result = SruExportResult(output_dir)
+
+    # Written under a temporary name so an interrupted run never leaves a half file behind
+    blanketter_path = os.path.join(output_dir, BLANKETTER_FILENAME)
+    staging = f"{blanketter_path}.tmp"
+    with open(staging, 'w', encoding=SRU_ENCODING, errors='replace', newline='') as out:
+        for item in _blanketts(sources, snapshot, codes, created, processes, chunksize):
+            if item["ok"]:
+                out.write(item["block"])
+                result.exported += 1
+            else:
+                print(f"SRU-export misslyckades för {item['file']}: {item['error']}")
+                result.failures.append({"file": item["file"], "error": item["error"]})
+        out.write(f"#FIL_SLUT{LINE_END}")
+    os.replace(staging, blanketter_path)
+    with open(os.path.join(output_dir, INFO_FILENAME), 'w', encoding=SRU_ENCODING, errors='replace', newline='') as f:
+        f.write(info)
+
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,140 @@
+"""
+Declarative stage pipeline
+A pipeline is a list of stages with named inputs and outputs. Running it for a
+set of targets executes only the stages those targets need and starts every
+stage as soon as its inputs exist (independent stages run concurrently in a
+shared thread pool).
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple, Callable, Iterable
+
+# on_stage(stage, data) - called when a stage completes; may raise to stop the run
+StageCallback = Callable[[str, Dict[str, Any]], None]
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One step: fn is called with the inputs as keyword arguments and returns its single
+    output, or a tuple with one value per output. summary(outputs) gives the data
+    reported to on_stage (default: the outputs themselves).
+    """
+    name: str
+    fn: Callable[..., Any]
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    summary: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+
+
+# Threads for concurrently ready stages (a run's first ready stage runs in the caller's thread)
+stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv('PIPELINE_THREADS', '8')),
+                                    thread_name_prefix='stage')
+
+
+class Pipeline:
+    """Stages wired together by their input and output names"""
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: List[Stage] = list(stages)
+        self.producers: Dict[str, Stage] = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"'{output}' produceras av både {self.producers[output].name} och {stage.name}")
+                self.producers[output] = stage
+        self.external_inputs = {name for stage in self.stages for name in stage.inputs if name not in self.producers}
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        state: Dict[str, int] = {}
+
+        def visit(stage: Stage, path: Tuple[str, ...]):
+            if state.get(stage.name) == 2:
+                return
+            if state.get(stage.name) == 1:
+                raise ValueError(f"Cykel i pipelinen: {' -> '.join(path + (stage.name,))}")
+            state[stage.name] = 1
+            for name in stage.inputs:
+                producer = self.producers.get(name)
+                if producer is not None:
+                    visit(producer, path + (stage.name,))
+            state[stage.name] = 2
+
+        for stage in self.stages:
+            visit(stage, ())
+
+    def required_stages(self, targets: Iterable[str], available: Iterable[str] = ()) -> List[Stage]:
+        """Stages needed to produce targets from the available values, in declaration order"""
+        available = set(available)
+        needed = set()
+        todo = [name for name in targets if name not in available]
+        while todo:
+            name = todo.pop()
+            producer = self.producers.get(name)
+            if producer is None:
+                raise ValueError(f"Indata saknas för pipelinen: {name}")
+            if producer.name in needed:
+                continue
+            needed.add(producer.name)
+            todo.extend(item for item in producer.inputs if item not in available)
+        return [stage for stage in self.stages if stage.name in needed]
+
+    def run(self, values: Dict[str, Any], targets: Iterable[str],
+            on_stage: Optional[StageCallback] = None) -> Dict[str, Any]:
+        """
+        Run the stages needed for targets and return all values (inputs included).
+        Raises the first stage error (or on_stage error); stages not started yet are skipped.
+        """
+        values = dict(values)
+        remaining = self.required_stages(targets, values)
+        running: Dict[Future, Tuple[Stage, float]] = {}
+        try:
+            while remaining or running:
+                ready = [stage for stage in remaining if all(name in values for name in stage.inputs)]
+                for stage in ready:
+                    remaining.remove(stage)
+
+                if len(ready) == 1 and not running:
+                    # Nothing else to wait for - run it here instead of handing it to another thread
+                    stage = ready[0]
+                    started = time.perf_counter()
+                    outputs = self._outputs(stage, stage.fn(**{name: values[name] for name in stage.inputs}))
+                    self._complete(stage, outputs, started, values, on_stage)
+                    continue
+
+                for stage in ready:
+                    future = stage_executor.submit(stage.fn, **{name: values[name] for name in stage.inputs})
+                    running[future] = (stage, time.perf_counter())
+                if not running:
+                    if remaining:
+                        raise RuntimeError(f"Pipelinen fastnade före: {', '.join(s.name for s in remaining)}")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, started = running.pop(future)
+                    outputs = self._outputs(stage, future.result())
+                    self._complete(stage, outputs, started, values, on_stage)
+        finally:
+            for future in running:
+                future.cancel()
+        return values
+
+    @staticmethod
+    def _outputs(stage: Stage, result: Any) -> Dict[str, Any]:
+        if len(stage.outputs) == 1:
+            return {stage.outputs[0]: result}
+        return dict(zip(stage.outputs, result))
+
+    @staticmethod
+    def _complete(stage: Stage, outputs: Dict[str, Any], started: float, values: Dict[str, Any],
+                  on_stage: Optional[StageCallback]):
+        values.update(outputs)
+        if on_stage:
+            data = stage.summary(outputs) if stage.summary else dict(outputs)
+            data["seconds"] = round(time.perf_counter() - started, 4)
+            on_stage(stage.name, data)
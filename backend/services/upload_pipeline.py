@@ -0,0 +1,76 @@
+"""
+Upload pipeline
+The stages of processing an uploaded SE file, declared once and shared by
+/upload-se-file, /upload-se-file/stream and /test-parser. Company info is
+extracted alongside the balance parse, and the financial_data write runs
+while INK2 is calculated.
+
+External inputs: parser (DatabaseParser) and raw (the file's bytes).
+"""
+
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from services.parsed_se import decode_se_content
+from services.stage_pipeline import Stage, Pipeline
+
+
+def _decode(raw: bytes):
+    return decode_se_content(raw)
+
+
+def _parse_account_balances(parser, content: str):
+    return parser.parse_account_balances(content)
+
+
+def _extract_company_info(parser, content: str) -> Dict[str, Any]:
+    return parser.extract_company_info(content)
+
+
+def _parse_rr_data(parser, current_accounts, previous_accounts):
+    return parser.parse_rr_data(current_accounts, previous_accounts)
+
+
+def _parse_br_data(parser, current_accounts, previous_accounts, rr_data):
+    # BR formulas can reference calculated RR values
+    return parser.parse_br_data(current_accounts, previous_accounts, rr_data)
+
+
+def _build_account_details(parser, current_accounts):
+    return parser.build_account_detail_index(current_accounts)
+
+
+def _parse_ink2_data(parser, current_accounts, company_info, rr_data, account_details):
+    return parser.parse_ink2_data(current_accounts, company_info.get('fiscal_year'), rr_data,
+                                  account_details=account_details)
+
+
+def _store_financial_data(parser, company_info, rr_data, br_data) -> Optional[Dict[str, str]]:
+    if not company_info.get('organization_number'):
+        return None
+    company_id = company_info['organization_number']
+    fiscal_year = company_info.get('fiscal_year', datetime.now().year)
+    stored_ids = parser.store_financial_data(company_id, fiscal_year, rr_data, br_data)
+    print(f"Stored financial data with IDs: {stored_ids}")
+    return stored_ids
+
+
+UPLOAD_PIPELINE = Pipeline([
+    Stage('decode', _decode, ('raw',), ('content', 'encoding'),
+          summary=lambda out: {"encoding": out['encoding']}),
+    Stage('parse_account_balances', _parse_account_balances, ('parser', 'content'),
+          ('current_accounts', 'previous_accounts'),
+          summary=lambda out: {"current_accounts_count": len(out['current_accounts']),
+                               "previous_accounts_count": len(out['previous_accounts'])}),
+    Stage('extract_company_info', _extract_company_info, ('parser', 'content'), ('company_info',)),
+    Stage('parse_rr_data', _parse_rr_data, ('parser', 'current_accounts', 'previous_accounts'), ('rr_data',)),
+    Stage('parse_br_data', _parse_br_data, ('parser', 'current_accounts', 'previous_accounts', 'rr_data'),
+          ('br_data',)),
+    Stage('build_account_details', _build_account_details, ('parser', 'current_accounts'), ('account_details',),
+          summary=lambda out: {"accounts_with_details": len(out['account_details'])}),
+    Stage('parse_ink2_data', _parse_ink2_data,
+          ('parser', 'current_accounts', 'company_info', 'rr_data', 'account_details'), ('ink2_data',)),
+    Stage('store_financial_data', _store_financial_data, ('parser', 'company_info', 'rr_data', 'br_data'),
+          ('stored_ids',),
+          summary=lambda out: {"stored": bool(out['stored_ids'])}),
+])
@@ -0,0 +1,70 @@
+"""
+Per-upload sessions
+Keeps the parsed ledger and its precomputed INK2 account-detail index in memory,
+so recalculations and SHOW popups don't re-scan the accounts
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional
+
+
+@dataclass
+class UploadSession:
+    """Parsed SE upload, identified by the content hash of the file"""
+    upload_id: str
+    snapshot_version: Optional[str]
+    current_accounts: Dict[str, float]
+    previous_accounts: Dict[str, float]
+    company_info: Dict[str, Any]
+    account_details: Dict[str, List[Dict[str, Any]]]
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+
+
+class UploadSessionStore:
+    """Bounded LRU store of upload sessions with idle expiry"""
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_sessions = max_sessions or int(os.getenv('UPLOAD_SESSION_LIMIT', '500'))
+        self.ttl_seconds = ttl_seconds or float(os.getenv('UPLOAD_SESSION_TTL', str(6 * 3600)))
+        self._sessions: "OrderedDict[str, UploadSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, session: UploadSession) -> UploadSession:
+        with self._lock:
+            self._sessions[session.upload_id] = session
+            self._sessions.move_to_end(session.upload_id)
+            self._evict()
+        return session
+
+    def get(self, upload_id: Optional[str]) -> Optional[UploadSession]:
+        if not upload_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                return None
+            if time.time() - session.last_access > self.ttl_seconds:
+                del self._sessions[upload_id]
+                return None
+            session.last_access = time.time()
+            self._sessions.move_to_end(upload_id)
+            return session
+
+    def _evict(self):
+        now = time.time()
+        for upload_id in [key for key, s in self._sessions.items() if now - s.last_access > self.ttl_seconds]:
+            del self._sessions[upload_id]
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# Global instance shared by the API routes
+upload_sessions = UploadSessionStore()
@@ -0,0 +1,8 @@
+-- Add sru_code to the INK2 mapping table
+-- Skatteverket's SRU field code (e.g. 7650 for INK2S 4.1) used when exporting
+-- INK2 to INFO.SRU/BLANKETTER.SRU. Rows without a code are not exported.
+
+ALTER TABLE variable_mapping_ink2
+ADD COLUMN sru_code TEXT;
+
+CREATE INDEX idx_variable_mapping_ink2_sru_code ON variable_mapping_ink2(sru_code) WHERE sru_code IS NOT NULL;
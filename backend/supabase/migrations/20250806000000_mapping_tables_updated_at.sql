@@ -0,0 +1,43 @@
+-- updated_at on every mapping table, kept current by trigger
+-- The API polls count + max(updated_at) per table to detect mapping changes
+-- (see fetch_change_token). Tables created outside the migrations may lack the
+-- column or trigger; without them the poll falls back to count + max(id), which
+-- misses in-place edits.
+
+ALTER TABLE variable_mapping_rr ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+ALTER TABLE variable_mapping_br ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+ALTER TABLE variable_mapping_ink2 ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+ALTER TABLE global_variables ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+ALTER TABLE accounts_table ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+
+CREATE OR REPLACE TRIGGER update_variable_mapping_rr_updated_at
+BEFORE UPDATE ON variable_mapping_rr
+FOR EACH ROW
+EXECUTE FUNCTION public.update_updated_at_column();
+
+CREATE OR REPLACE TRIGGER update_variable_mapping_br_updated_at
+BEFORE UPDATE ON variable_mapping_br
+FOR EACH ROW
+EXECUTE FUNCTION public.update_updated_at_column();
+
+CREATE OR REPLACE TRIGGER update_variable_mapping_ink2_updated_at
+BEFORE UPDATE ON variable_mapping_ink2
+FOR EACH ROW
+EXECUTE FUNCTION public.update_updated_at_column();
+
+CREATE OR REPLACE TRIGGER update_global_variables_updated_at
+BEFORE UPDATE ON global_variables
+FOR EACH ROW
+EXECUTE FUNCTION public.update_updated_at_column();
+
+CREATE OR REPLACE TRIGGER update_accounts_table_updated_at
+BEFORE UPDATE ON accounts_table
+FOR EACH ROW
+EXECUTE FUNCTION public.update_updated_at_column();
+
+-- The poll reads the newest row per table
+CREATE INDEX IF NOT EXISTS idx_variable_mapping_rr_updated_at ON variable_mapping_rr(updated_at);
+CREATE INDEX IF NOT EXISTS idx_variable_mapping_br_updated_at ON variable_mapping_br(updated_at);
+CREATE INDEX IF NOT EXISTS idx_variable_mapping_ink2_updated_at ON variable_mapping_ink2(updated_at);
+CREATE INDEX IF NOT EXISTS idx_global_variables_updated_at ON global_variables(updated_at);
+CREATE INDEX IF NOT EXISTS idx_accounts_table_updated_at ON accounts_table(updated_at);
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test account details and recalculation for uploads the server no longer knows:
+404 until the client resends current_accounts, then the same results
+Run with pytest or directly: python test_account_details.py
+"""
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import main
+from test_upload_response import client, make_client, upload  # noqa: F401 (client is a fixture)
+
+# Uploads this worker has never seen (each test its own, since sessions are kept)
+UNKNOWN_UPLOAD = '0' * 64
+UNKNOWN_RECALC_UPLOAD = '1' * 64
+
+
+def test_account_details_for_unknown_upload(client):
+    data = upload(client)['data']
+    response = client.get(f"/api/account-details/{data['upload_id']}/INK4.3c")
+    assert response.status_code == 200, response.text
+    known = response.json()['account_details']
+    assert [item['account_id'] for item in known] == ['6072']
+
+    assert client.get(f'/api/account-details/{UNKNOWN_UPLOAD}/INK4.3c').status_code == 404
+    # The client's accounts rebuild the same details
+    response = client.post(f'/api/account-details/{UNKNOWN_UPLOAD}/INK4.3c',
+                           json={'current_accounts': data['current_accounts']})
+    assert response.status_code == 200, response.text
+    assert response.json()['account_details'] == known
+
+
+def test_recalculation_for_unknown_upload(client):
+    data = upload(client)['data']
+    request = {'upload_id': UNKNOWN_RECALC_UPLOAD, 'fiscal_year': 2024,
+               'rr_data': data['rr_data'], 'br_data': data['br_data']}
+    # No session and no accounts: not a silent all-zero result
+    response = client.post('/api/recalculate-ink2', json=request)
+    assert response.status_code == 404, response.text
+
+    response = client.post('/api/recalculate-ink2', json={**request, 'current_accounts': data['current_accounts']})
+    assert response.status_code == 200, response.text
+    amounts = {row['variable_name']: row['amount'] for row in response.json()['ink2_data']}
+    assert amounts['INK4.3c'] == 5000
+    # The recalculation re-registered the upload, so its details are served again
+    assert main.upload_sessions.get(UNKNOWN_RECALC_UPLOAD) is not None
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_client = make_client(monkeypatch)
+        test_account_details_for_unknown_upload(test_client)
+        print("✅ Account details for unknown uploads")
+        test_recalculation_for_unknown_upload(test_client)
+        print("✅ Recalculation for unknown uploads")
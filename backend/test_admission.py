@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test admission control: concurrency and per-user limits, queue deadlines,
+cancellation, coalesced duplicates and the 429 response
+Run with pytest or directly: python test_admission.py
+"""
+import sys
+import os
+import asyncio
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+
+from services.admission import AdmissionGate, AdmissionController, AdmissionRejected
+from services.singleflight import SingleFlight
+
+
+class FakeRequest:
+    def __init__(self, user: str):
+        self.headers = {'x-user-id': user}
+        self.client = None
+
+
+def test_concurrency_queue_and_rejection():
+    async def run():
+        gate = AdmissionGate('t', concurrency=2, per_user=5, queue=1, max_wait=1.0)
+        events = []
+
+        async def job(n: int, hold: float):
+            try:
+                with await gate.acquire(f'user{n}'):
+                    events.append(('run', n, gate.running))
+                    await asyncio.sleep(hold)
+            except AdmissionRejected as e:
+                events.append(('rejected', n, e.retry_after))
+
+        await asyncio.gather(job(1, 0.1), job(2, 0.1), job(3, 0.05), job(4, 0.05))
+        assert [e[1] for e in events if e[0] == 'run'] == [1, 2, 3]
+        assert [e for e in events if e[0] == 'rejected'][0][1] == 4
+        assert max(e[2] for e in events if e[0] == 'run') <= 2
+        assert gate.running == 0 and gate._users == {}
+    asyncio.run(run())
+
+
+def test_per_user_quota():
+    async def run():
+        gate = AdmissionGate('t', concurrency=5, per_user=1, queue=5, max_wait=1.0)
+        ticket = await gate.acquire('a')
+        try:
+            await gate.acquire('a')
+            assert False, "per-user quota not enforced"
+        except AdmissionRejected:
+            pass
+        # Other users are not affected
+        with await gate.acquire('b'):
+            pass
+        ticket.release()
+        ticket.release()
+        assert gate.running == 0
+    asyncio.run(run())
+
+
+def test_queue_deadline_and_cancellation():
+    async def run():
+        gate = AdmissionGate('t', concurrency=1, per_user=5, queue=5, max_wait=0.05)
+        ticket = await gate.acquire('a')
+        try:
+            await gate.acquire('b')
+            assert False, "queue deadline not enforced"
+        except AdmissionRejected as e:
+            assert e.retry_after >= 1
+        waiting = asyncio.ensure_future(gate.acquire('c'))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        ticket.release()
+        assert gate.running == 0 and not gate._waiters and gate._users == {}
+        assert gate.stats()["timed_out"] == 1
+    asyncio.run(run())
+
+
+def test_coalesced_duplicates_take_one_slot():
+    async def run():
+        admission = AdmissionController({'upload': AdmissionGate('upload', 4, 1, 4, 1.0)})
+        flights = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        request = FakeRequest('triple-clicker')
+        results = await asyncio.gather(*(
+            flights.do('same-file', lambda: admission.run('upload', request, compute)) for _ in range(3)
+        ))
+        assert results == ['result'] * 3
+        assert len(calls) == 1
+        assert admission.gates['upload'].admitted == 1
+        assert admission.gates['upload'].rejected == 0
+    asyncio.run(run())
+
+
+def test_rejection_is_429_with_retry_after():
+    admission = AdmissionController({'recalc': AdmissionGate('recalc', 1, 1, 0, 0.1)})
+    app = FastAPI()
+
+    @app.exception_handler(AdmissionRejected)
+    async def admission_rejected(request: Request, exc: AdmissionRejected):
+        return ORJSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
+    @app.get("/busy")
+    async def busy(request: Request):
+        # Holds a slot of the one-slot gate while a second request comes in
+        with await admission.acquire('recalc', request):
+            await admission.acquire('recalc', FakeRequest('someone-else'))
+
+    with TestClient(app) as client:
+        response = client.get("/busy")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+if __name__ == "__main__":
+    test_concurrency_queue_and_rejection()
+    print("✅ Concurrency limit, queue and rejection")
+    test_per_user_quota()
+    print("✅ Per-user quota")
+    test_queue_deadline_and_cancellation()
+    print("✅ Queue deadline and cancellation")
+    test_coalesced_duplicates_take_one_slot()
+    print("✅ Coalesced duplicates take one slot")
+    test_rejection_is_429_with_retry_after()
+    print("✅ 429 with Retry-After")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test the iXBRL export: well-formed document, contexts, decimals, fact signs
+from balance_type and the batch output written by the worker pool
+Run with pytest or directly: python test_ixbrl_export.py
+"""
+import sys
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from functools import partial
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.compiled_mappings import XbrlConcept
+from services.parsed_se import FiscalPeriod
+from services.ixbrl_export import iter_ixbrl
+from services.batch_pipeline import SeSource, create_pool, process_source
+from services.mapping_snapshot import MappingSnapshot
+
+IX = '{http://www.xbrl.org/2013/inlineXBRL}'
+
+
+def concept(name: str, balance_type: str, period_type: str) -> XbrlConcept:
+    return XbrlConcept(name=name, data_type='xbrli:monetaryItemType', balance_type=balance_type,
+                       period_type=period_type, is_abstract=False)
+
+
+def row(row_id: int, label: str, current: float, previous: float) -> dict:
+    return {'id': row_id, 'label': label, 'show_amount': True, 'style': 'NORMAL', 'always_show': 'TRUE',
+            'current_amount': current, 'previous_amount': previous}
+
+
+def export() -> ET.Element:
+    rr_rows = [row(1, 'Nettoomsättning', 900000.0, 800000.0),
+               row(2, 'Övriga externa kostnader', -206500.4, -150000.0),
+               row(3, 'Årets resultat', -10000.0, 5000.0)]
+    br_rows = [row(10, 'Kassa och bank', 150000.5, 120000.0),
+               row(11, 'Periodiseringsfonder', 40000.0, 30000.0)]
+    rr_concepts = {1: concept('se-gen-base:Nettoomsattning', 'CREDIT', 'DURATION'),
+                   2: concept('OvrigaExternaKostnader', 'DEBIT', 'DURATION'),
+                   3: concept('se-gen-base:AretsResultat', 'CREDIT', 'DURATION')}
+    br_concepts = {10: concept('se-gen-base:KassaBank', 'DEBIT', 'INSTANT'),
+                   11: concept('se-gen-base:Periodiseringsfonder', 'CREDIT', 'INSTANT')}
+    periods = {0: FiscalPeriod('20240101', '20241231'), -1: FiscalPeriod('20230101', '20231231')}
+    company_info = {'company_name': 'Testbolaget AB', 'organization_number': '556610-3643'}
+    document = b''.join(iter_ixbrl(rr_rows, br_rows, rr_concepts, br_concepts, company_info, periods))
+    return ET.fromstring(document)
+
+
+def facts(root: ET.Element) -> dict:
+    """(name, context) -> (signed value, element)"""
+    result = {}
+    for fact in root.iter(f'{IX}nonFraction'):
+        value = float(fact.text.replace(' ', '').replace(',', ''))
+        if fact.get('sign') == '-':
+            value = -value
+        result[(fact.get('name'), fact.get('contextRef'))] = (value, fact)
+    return result
+
+
+def test_contexts_and_decimals():
+    root = export()
+    context_ids = {element.get('id') for element in root.iter('{http://www.xbrl.org/2003/instance}context')}
+    assert context_ids == {'period0', 'period1', 'balans0', 'balans1'}
+    all_facts = facts(root)
+    assert len(all_facts) == 10
+    # Amounts are rounded to whole kronor, so they must not claim to be exact
+    assert {fact.get('decimals') for _, fact in all_facts.values()} == {'0'}
+    assert all_facts[('se-gen-base:KassaBank', 'balans0')][0] == 150000
+
+
+def test_fact_signs_follow_balance_type():
+    all_facts = facts(export())
+    # A cost shown as negative in RR is a positive DEBIT fact
+    assert all_facts[('se-gen-base:OvrigaExternaKostnader', 'period0')][0] == 206500
+    assert all_facts[('se-gen-base:Nettoomsattning', 'period0')][0] == 900000
+    # A loss is a negative CREDIT fact
+    assert all_facts[('se-gen-base:AretsResultat', 'period0')][0] == -10000
+    assert all_facts[('se-gen-base:AretsResultat', 'period1')][0] == 5000
+    # BR rows are tagged as shown
+    assert all_facts[('se-gen-base:Periodiseringsfonder', 'balans1')][0] == 30000
+
+
+SE_FILE = '\r\n'.join([
+    '#FLAGGA 0',
+    '#FNAMN "Batchbolaget AB"',
+    '#ORGNR 556610-3643',
+    '#RAR 0 20240101 20241231',
+    '#RAR -1 20230101 20231231',
+    '#UB 0 1930 150000.50',
+    '#UB -1 1930 120000.00',
+    '#RES 0 3010 -900000',
+    '#RES -1 3010 -800000',
+    '#RES 0 6110 206500',
+]).encode('iso-8859-1')
+
+
+def mapping(row_id: int, title: str, variable_name: str, element_name: str, balance_type: str,
+            period_type: str, accounts: tuple) -> dict:
+    return {'id': row_id, 'row_id': row_id, 'row_title': title, 'variable_name': variable_name,
+            'show_amount': True, 'style': 'NORMAL', 'is_calculated': False, 'calculation_formula': None,
+            'always_show': 'TRUE', 'accounts_included_start': accounts[0], 'accounts_included_end': accounts[1],
+            'element_name': element_name, 'data_type': 'xbrli:monetaryItemType',
+            'balance_type': balance_type, 'period_type': period_type}
+
+
+def batch_snapshot() -> MappingSnapshot:
+    return MappingSnapshot.from_payload({
+        'version': 'ixbrl-batch-test',
+        'rr_mappings': [mapping(1, 'Nettoomsättning', 'Nettoomsattning', 'se-gen-base:Nettoomsattning',
+                                'CREDIT', 'DURATION', (3000, 3799)),
+                        mapping(2, 'Övriga externa kostnader', 'OvrigaExternaKostnader',
+                                'se-gen-base:OvrigaExternaKostnader', 'DEBIT', 'DURATION', (5000, 6999))],
+        'br_mappings': [mapping(10, 'Kassa och bank', 'KassaBank', 'se-gen-base:KassaBank',
+                                'DEBIT', 'INSTANT', (1900, 1999))],
+        'ink2_mappings': [],
+        'global_variables': {},
+    })
+
+
+def test_batch_pool_writes_one_document_per_file():
+    with tempfile.TemporaryDirectory() as directory:
+        sources = []
+        for folder in ('a', 'b'):
+            # Equally named files in different folders must not overwrite each other
+            os.makedirs(os.path.join(directory, folder))
+            path = os.path.join(directory, folder, 'bolag.se')
+            with open(path, 'wb') as f:
+                f.write(SE_FILE + (b'\r\n#RES 0 6110 1' if folder == 'b' else b''))
+            sources.append(SeSource(path))
+        bad = os.path.join(directory, 'trasig.se')
+        with open(bad, 'wb') as f:
+            f.write(b'#FNAMN "Utan RAR"\r\n')
+        sources.append(SeSource(bad))
+        output_dir = os.path.join(directory, 'ixbrl')
+        os.makedirs(output_dir)
+
+        with create_pool(batch_snapshot(), processes=2) as executor:
+            results = list(executor.map(partial(process_source, output='ixbrl', output_dir=output_dir), sources))
+
+        assert [result['ok'] for result in results] == [True, True, False]
+        paths = [result['data'] for result in results[:2]]
+        assert len(set(paths)) == 2
+        assert sorted(os.listdir(output_dir)) == sorted(os.path.basename(path) for path in paths)
+        all_facts = facts(ET.parse(paths[0]).getroot())
+        assert all_facts[('se-gen-base:Nettoomsattning', 'period0')][0] == 900000
+        assert all_facts[('se-gen-base:OvrigaExternaKostnader', 'period0')][0] == 206500
+        assert all_facts[('se-gen-base:KassaBank', 'balans1')][0] == 120000
+
+
+if __name__ == "__main__":
+    test_contexts_and_decimals()
+    print("✅ Contexts and decimals")
+    test_fact_signs_follow_balance_type()
+    print("✅ Fact signs follow balance_type")
+    test_batch_pool_writes_one_document_per_file()
+    print("✅ Batch pool writes one document per file")
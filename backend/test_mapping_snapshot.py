@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test the mapping change token: one single-row query per table, the fallback for
+tables without updated_at, and that other errors reach the refresher
+Run with pytest or directly: python test_mapping_snapshot.py
+"""
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.mapping_snapshot import MAPPING_TABLES, MappingRefresher, fetch_change_token
+
+
+class QueryError(Exception):
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeQuery:
+    def __init__(self, client, table: str):
+        self.client, self.table = client, table
+        self.columns = None
+        self.limited = False
+
+    def select(self, columns, count=None):
+        self.columns = columns
+        return self
+
+    def order(self, column, desc=False):
+        if column == 'updated_at' and self.table in self.client.without_updated_at:
+            self.client.failure = QueryError(f'column {self.table}.updated_at does not exist', '42703')
+        return self
+
+    def limit(self, n):
+        self.limited = True
+        return self
+
+    def execute(self):
+        self.client.queries.append((self.table, self.columns, self.limited))
+        failure, self.client.failure = self.client.failure or self.client.error, None
+        if failure:
+            raise failure
+        return SimpleNamespace(data=[{'updated_at': '2025-01-01', 'id': 7}], count=3)
+
+
+class FakeClient:
+    def __init__(self, without_updated_at=(), error: Exception = None):
+        self.without_updated_at = set(without_updated_at)
+        self.error = error
+        self.failure = None
+        self.queries = []
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+
+def test_one_limited_query_per_table():
+    client = FakeClient()
+    token = fetch_change_token(client)
+    assert len(client.queries) == len(MAPPING_TABLES)
+    assert all(limited and columns == 'updated_at' for _, columns, limited in client.queries)
+    assert token.split('|')[0] == 'variable_mapping_rr:3:2025-01-01'
+
+
+def test_missing_updated_at_falls_back_to_count_and_id():
+    client = FakeClient(without_updated_at={'accounts_table'})
+    token = fetch_change_token(client)
+    assert token.split('|')[-1] == 'accounts_table:3:id7'
+    # Never the whole table
+    assert all(limited and columns != '*' for _, columns, limited in client.queries)
+
+
+def test_other_errors_reach_the_refresher():
+    client = FakeClient(error=QueryError('connection reset'))
+    try:
+        fetch_change_token(client)
+        assert False, "network error swallowed"
+    except QueryError:
+        pass
+    assert len(client.queries) == 1
+
+    async def run():
+        refresher = MappingRefresher(client, poll_interval=0.01)
+        refresher._wakeup = asyncio.Event()
+        task = asyncio.ensure_future(refresher._run())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return refresher.last_error
+
+    assert asyncio.run(run()) == 'connection reset'
+
+
+if __name__ == "__main__":
+    test_one_limited_query_per_table()
+    print("✅ One limited query per table")
+    test_missing_updated_at_falls_back_to_count_and_id()
+    print("✅ Missing updated_at falls back to count and id")
+    test_other_errors_reach_the_refresher()
+    print("✅ Other errors reach the refresher")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test the report job queue: submit on the event loop, workers pick jobs up
+right away, queue limit and per-user quota
+Run with pytest or directly: python test_report_jobs.py
+"""
+import sys
+import os
+import asyncio
+import tempfile
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.report_jobs import ReportJobQueue, ReportJobStore, QueueFullError, UserQuotaError, DONE
+
+
+def make_queue(directory: str, **kwargs) -> ReportJobQueue:
+    queue = ReportJobQueue(ReportJobStore(os.path.join(directory, 'jobs.sqlite3')), **kwargs)
+    queue.max_per_user = 2
+    return queue
+
+
+def test_submitted_job_runs_without_other_activity():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            ran = asyncio.Event()
+
+            async def runner(job_id, request, progress):
+                ran.set()
+                return {"report_id": job_id}
+
+            queue = make_queue(directory, workers=1)
+            await queue.start(runner)
+            job_id = await queue.submit('u1', {"x": 1})
+            # The idle worker must wake up by itself
+            await asyncio.wait_for(ran.wait(), timeout=2)
+            await asyncio.sleep(0.05)
+            assert queue.store.get(job_id)['status'] == DONE
+            assert queue._active_users == {}
+            await queue.stop()
+    asyncio.run(run())
+
+
+def test_queue_limit_and_user_quota():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            release = asyncio.Event()
+
+            async def runner(job_id, request, progress):
+                await release.wait()
+                return {}
+
+            queue = make_queue(directory, workers=1, max_pending=3)
+            await queue.start(runner)
+            await queue.submit('u1', {})
+            await queue.submit('u1', {})
+            try:
+                await queue.submit('u1', {})
+                assert False, "per-user quota not enforced"
+            except UserQuotaError:
+                pass
+            # Concurrent submissions reserve their slot before the row is written
+            results = await asyncio.gather(*(queue.submit(f'u{i}', {}) for i in range(2, 6)),
+                                           return_exceptions=True)
+            assert sum(isinstance(r, QueueFullError) for r in results) >= 1
+            assert queue._queue.qsize() + queue.running <= 3 + 1
+            release.set()
+            await asyncio.sleep(0.2)
+            assert queue._active_users == {}
+            assert queue._reserved == 0
+            await queue.stop()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_submitted_job_runs_without_other_activity()
+    print("✅ Submitted jobs start without waiting for other activity")
+    test_queue_limit_and_user_quota()
+    print("✅ Queue limit and per-user quota enforced")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test the upload result cache: LRU bounds, fall-through to the shared cache and
+the pending financial_data write
+Run with pytest or directly: python test_result_cache.py
+"""
+import sys
+import os
+import tempfile
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.result_cache import ResultCache, UploadResult
+from services.shared_cache import SharedResultCache
+
+
+def make_result(upload_id: str, stored_ids=None, organization_number='556610-3643') -> UploadResult:
+    return UploadResult(
+        upload_id=upload_id,
+        snapshot_version='v1',
+        current_accounts={'1930': 100.0},
+        previous_accounts={},
+        company_info={'organization_number': organization_number, 'fiscal_year': 2024},
+        account_details={},
+        response_data={'upload_id': upload_id, 'rr_data': [], 'br_data': []},
+        stored_ids=stored_ids
+    )
+
+
+def test_lru_bounds():
+    cache = ResultCache(max_entries=2, max_bytes=10 * 1024 * 1024)
+    for upload_id in ('a', 'b', 'c'):
+        cache.put(make_result(upload_id))
+    assert cache.get('a', 'v1') is None
+    assert cache.get('c', 'v1') is not None
+    assert len(cache) == 2
+
+
+def test_shared_cache_fall_through():
+    with tempfile.TemporaryDirectory() as directory:
+        shared = SharedResultCache(os.path.join(directory, 'cache.sqlite3'))
+        ResultCache(shared=shared).put(make_result('a', stored_ids={'rr_id': 'x'}))
+        # Another worker (empty L1, same file) gets the result with its stored_ids
+        result = ResultCache(shared=shared).get('a', 'v1')
+        assert result is not None
+        assert result.stored_ids == {'rr_id': 'x'}
+        assert not result.store_pending
+
+
+def test_store_pending():
+    assert make_result('a', stored_ids={}).store_pending
+    assert not make_result('a', stored_ids={'rr_id': 'x'}).store_pending
+    # Without an organization number nothing is written
+    assert not make_result('a', organization_number=None).store_pending
+    # Shared-cache entries from before stored_ids was persisted are written again
+    payload = make_result('a', stored_ids={'rr_id': 'x'}).to_payload()
+    del payload['stored_ids']
+    assert UploadResult.from_payload(payload).store_pending
+
+
+if __name__ == "__main__":
+    test_lru_bounds()
+    print("✅ LRU bounds")
+    test_shared_cache_fall_through()
+    print("✅ Shared cache fall-through")
+    test_store_pending()
+    print("✅ Pending financial_data write")
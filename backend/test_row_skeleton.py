@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Test compact responses: amounts aligned to the row skeleton, also for INK2
+rows that share or lack a variable_name
+Run with pytest or directly: python test_row_skeleton.py
+"""
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.row_skeleton import compact_rows
+
+
+def test_rows_aligned_to_skeleton():
+    skeleton = {
+        "version": "v1",
+        "rr": [{"id": 1}, {"id": 2}, {"id": 3}],
+        "br": [{"id": 10}],
+        "ink2": [{"row_id": 1, "variable_name": "INK4.3c"}, {"row_id": 2, "variable_name": ""},
+                 {"row_id": 3, "variable_name": ""}, {"row_id": 4, "variable_name": "INK4.3c"},
+                 {"row_id": 5, "variable_name": "INK4.15"}],
+    }
+    rr_data = [{"id": 3, "current_amount": 30.0, "previous_amount": None},
+               {"id": 1, "current_amount": 10.0, "previous_amount": 5.0}]
+    br_data = [{"id": 10, "current_amount": 100.0, "previous_amount": 90.0}]
+    ink2_data = [{"row_id": 4, "variable_name": "INK4.3c", "amount": 400.0, "has_account_details": False},
+                 {"row_id": 1, "variable_name": "INK4.3c", "amount": 100.0, "has_account_details": True},
+                 {"row_id": 2, "variable_name": "", "amount": 200.0, "has_account_details": False},
+                 {"row_id": 3, "variable_name": "", "amount": 300.0, "has_account_details": False}]
+
+    compact = compact_rows(skeleton, rr_data, br_data, ink2_data)
+    assert compact["skeleton_version"] == "v1"
+    assert compact["rr"] == {"current_amount": [10.0, None, 30.0], "previous_amount": [5.0, None, None]}
+    assert compact["br"] == {"current_amount": [100.0], "previous_amount": [90.0]}
+    # Rows sharing a name keep their own values; rows not in the output are None
+    assert compact["ink2"] == {"amount": [100.0, 200.0, 300.0, 400.0, None],
+                               "has_account_details": [True, False, False, False, None]}
+
+
+if __name__ == "__main__":
+    test_rows_aligned_to_skeleton()
+    print("✅ Rows aligned to the skeleton")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test the shared (L2) result cache: round trip, checksum, size budget, and that
+only a corrupt file is recreated (a locked one disables L2 and is left alone)
+Run with pytest or directly: python test_shared_cache.py
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.shared_cache import SharedResultCache
+
+
+def test_round_trip_and_eviction():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SharedResultCache(os.path.join(directory, 'cache.sqlite3'), max_bytes=300)
+        cache.put('a', 'v1', {"value": "x" * 100})
+        assert cache.get('a', 'v1') == {"value": "x" * 100}
+        assert cache.get('a', 'v2') is None
+        cache.put('b', 'v1', {"value": "y" * 100})
+        cache.put('c', 'v1', {"value": "z" * 100})
+        # Over budget: the least recently used entry is gone
+        assert cache.get('c', 'v1') is not None
+        assert cache.stats()["bytes"] <= 300
+
+
+def test_corrupt_file_is_recreated():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        with open(path, 'wb') as f:
+            f.write(b'not a database' * 100)
+        cache = SharedResultCache(path)
+        cache.put('a', 'v1', {"value": 1})
+        assert cache.get('a', 'v1') == {"value": 1}
+
+
+def test_locked_file_is_left_alone():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        holder = sqlite3.connect(path, isolation_level=None)
+        holder.execute('CREATE TABLE keep (x INTEGER)')
+        holder.execute('INSERT INTO keep VALUES (42)')
+        holder.execute('BEGIN EXCLUSIVE')
+        try:
+            os.environ['RESULT_CACHE_DB'] = path
+            # "database is locked" is not corruption: L2 is disabled for this process instead
+            assert SharedResultCache.from_env() is None
+        finally:
+            os.environ.pop('RESULT_CACHE_DB', None)
+            holder.execute('COMMIT')
+        holder.close()
+        # Still the same file (not deleted and recreated under the other connection)
+        assert sqlite3.connect(path).execute('SELECT x FROM keep').fetchone() == (42,)
+
+
+if __name__ == "__main__":
+    test_round_trip_and_eviction()
+    print("✅ Round trip and eviction")
+    test_corrupt_file_is_recreated()
+    print("✅ Corrupt file recreated")
+    test_locked_file_is_left_alone()
+    print("✅ Locked file left alone")
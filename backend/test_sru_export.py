@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test the SRU export: identities, deklarationsperiod, blankett and INFO.SRU
+records, and the file format of a batch export (CRLF, ISO-8859-1, #FIL_SLUT)
+Run with pytest or directly: python test_sru_export.py
+"""
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.batch_pipeline import SeSource
+from services.mapping_snapshot import MappingSnapshot
+from services.parsed_se import FiscalPeriod
+from services.sru_export import (
+    SruSender, sru_identity, declaration_period, build_blankett, build_info, export_sru_batch,
+    INFO_FILENAME, BLANKETTER_FILENAME
+)
+
+SE_FILE = '\r\n'.join([
+    '#FLAGGA 0',
+    '#FNAMN "Testbolaget Åkeri AB"',
+    '#ORGNR 556610-3643',
+    '#RAR 0 20240501 20250430',
+    '#RAR -1 20230501 20240430',
+    '#UB 0 1930 150000.50',
+    '#RES 0 3010 -900000',
+    '#RES 0 6072 5000',
+    '#RES 0 6110 1200.60',
+    '#RES 0 6992 300',
+]).encode('iso-8859-1')
+
+
+def ink2_mapping(row_id: int, variable_name: str, accounts: str, sru_code: str) -> dict:
+    return {'id': row_id, 'row_id': row_id, 'row_title': variable_name, 'variable_name': variable_name,
+            'accounts_included': accounts, 'calculation_formula': None, 'show_amount': 'TRUE',
+            'is_calculated': 'FALSE', 'always_show': None, 'show_tag': False, 'style': 'NORMAL',
+            'explainer': '', 'block': 'INK4', 'header': False, 'sru_code': sru_code}
+
+
+def snapshot() -> MappingSnapshot:
+    return MappingSnapshot.from_payload({
+        'version': 'test',
+        'rr_mappings': [],
+        'br_mappings': [],
+        'ink2_mappings': [ink2_mapping(1, 'INK4.3c', '6072;6992-6993', '7653'),
+                          ink2_mapping(2, 'INK4.3b', '6000-6999', '7652'),
+                          ink2_mapping(3, 'INK_ingen_kod', '6110', '')],
+        'global_variables': {},
+    })
+
+
+def test_identity_and_period():
+    assert sru_identity('556610-3643') == '165566103643'
+    assert sru_identity('195566103643') == '195566103643'
+    try:
+        sru_identity('12345')
+        assert False, "invalid organisationsnummer accepted"
+    except ValueError:
+        pass
+    assert [declaration_period(f'2024{month:02d}31') for month in (1, 4, 5, 6, 7, 8, 9, 12)] == [1, 1, 2, 2, 3, 3, 4, 4]
+
+
+def test_blankett_records():
+    rows = [SimpleNamespace(meta={'variable_name': 'INK4.3c'}, amount=-5300.4),
+            SimpleNamespace(meta={'variable_name': 'INK4.3c'}, amount=1.0),
+            SimpleNamespace(meta={'variable_name': 'INK4.3b'}, amount=0.0),
+            SimpleNamespace(meta={'variable_name': 'INK_ingen_kod'}, amount=100.0)]
+    block = build_blankett({'organization_number': '556610-3643', 'company_name': 'Rad\nbrytning AB'},
+                           FiscalPeriod('20240101', '20241231'), rows, {'INK4.3c': '7653', 'INK4.3b': '7652'},
+                           created='20250101 120000')
+    assert block.split('\r\n') == [
+        '#BLANKETT INK2S-2024P4',
+        '#IDENTITET 165566103643 20250101 120000',
+        '#NAMN Rad brytning AB',
+        '#UPPGIFT 7011 20240101',
+        '#UPPGIFT 7012 20241231',
+        # Whole kronor without sign, first row per code, zero amounts left out
+        '#UPPGIFT 7653 5300',
+        '#BLANKETTSLUT',
+        '',
+    ]
+    try:
+        build_blankett({'organization_number': '556610-3643'}, None, [], {})
+        assert False, "missing fiscal year accepted"
+    except ValueError:
+        pass
+
+
+def test_info_records():
+    sender = SruSender('556000-0001', 'Byrån AB', '111 22', 'Stockholm', email='info@byran.se')
+    lines = build_info(sender, created='20250101 120000').split('\r\n')
+    assert lines[0] == '#DATABESKRIVNING_START'
+    assert f'#FILNAMN {BLANKETTER_FILENAME}' in lines
+    assert '#ORGNR 165560000001' in lines
+    assert '#POSTNR 11122' in lines
+    assert '#EMAIL info@byran.se' in lines
+    assert lines[-2:] == ['#MEDIELEV_SLUT', '']
+
+
+def test_batch_export_file_format():
+    with tempfile.TemporaryDirectory() as directory:
+        good = os.path.join(directory, 'bolag.se')
+        with open(good, 'wb') as f:
+            f.write(SE_FILE)
+        bad = os.path.join(directory, 'trasig.se')
+        with open(bad, 'wb') as f:
+            f.write(b'#FNAMN "Utan RAR"\r\n')
+        output_dir = os.path.join(directory, 'sru')
+        sender = SruSender('556000-0001', 'Byrån AB', '111 22', 'Stockholm')
+
+        result = export_sru_batch([SeSource(good), SeSource(bad)], output_dir, sender, snapshot(), processes=1)
+        assert result.exported == 1
+        assert [failure['file'] for failure in result.failures] == [bad]
+
+        with open(os.path.join(output_dir, BLANKETTER_FILENAME), 'rb') as f:
+            blanketter = f.read()
+        # CRLF line ends, ISO-8859-1 and the end-of-file record
+        assert b'\n' not in blanketter.replace(b'\r\n', b'')
+        text = blanketter.decode('iso-8859-1')
+        assert '#NAMN Testbolaget Åkeri AB\r\n' in text
+        assert '#BLANKETT INK2S-2025P1\r\n' in text
+        assert '#UPPGIFT 7653 5300\r\n' in text
+        assert '#UPPGIFT 7652 6501\r\n' in text
+        assert text.endswith('#BLANKETTSLUT\r\n#FIL_SLUT\r\n')
+        assert sorted(os.listdir(output_dir)) == sorted([INFO_FILENAME, BLANKETTER_FILENAME])
+
+
+if __name__ == "__main__":
+    test_identity_and_period()
+    print("✅ SRU identity and deklarationsperiod")
+    test_blankett_records()
+    print("✅ Blankett records")
+    test_info_records()
+    print("✅ INFO.SRU records")
+    test_batch_export_file_format()
+    print("✅ Batch export file format")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test the stage pipeline: only required stages run, independent stages run
+concurrently, cycles are rejected and stage errors reach the caller
+Run with pytest or directly: python test_stage_pipeline.py
+"""
+import sys
+import os
+import time
+import threading
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.stage_pipeline import Stage, Pipeline
+from services.upload_pipeline import UPLOAD_PIPELINE
+
+
+def slow(hold: float = 0.2):
+    def fn(x):
+        time.sleep(hold)
+        return x + 1
+    return fn
+
+
+def diamond() -> Pipeline:
+    return Pipeline([
+        Stage('a', slow(), ('x',), ('a',)),
+        Stage('b', slow(), ('x',), ('b',)),
+        Stage('c', lambda a, b: a + b, ('a', 'b'), ('c',)),
+        Stage('d', lambda c: (c, -c), ('c',), ('d', 'neg_d')),
+    ])
+
+
+def test_required_stages():
+    pipeline = diamond()
+    assert [s.name for s in pipeline.required_stages(['c'], available=['x'])] == ['a', 'b', 'c']
+    assert [s.name for s in pipeline.required_stages(['d'], available=['c'])] == ['d']
+    assert pipeline.external_inputs == {'x'}
+    try:
+        pipeline.required_stages(['missing'], available=['x'])
+        assert False, "unknown target accepted"
+    except ValueError:
+        pass
+
+
+def test_independent_stages_run_concurrently():
+    reported = []
+    started = time.perf_counter()
+    values = diamond().run({'x': 1}, ['d'], on_stage=lambda name, data: reported.append(name))
+    elapsed = time.perf_counter() - started
+    assert values['d'] == 4 and values['neg_d'] == -4
+    # a and b sleep 0.2 s each; run one after the other it would take 0.4 s
+    assert elapsed < 0.35, elapsed
+    assert sorted(reported[:2]) == ['a', 'b'] and reported[2:] == ['c', 'd']
+
+
+def test_cycle_and_duplicate_output_rejected():
+    try:
+        Pipeline([Stage('a', slow(), ('b',), ('a',)), Stage('b', slow(), ('a',), ('b',))])
+        assert False, "cycle accepted"
+    except ValueError as e:
+        assert 'Cykel' in str(e)
+    try:
+        Pipeline([Stage('a', slow(), ('x',), ('y',)), Stage('b', slow(), ('x',), ('y',))])
+        assert False, "duplicate output accepted"
+    except ValueError:
+        pass
+
+
+def test_stage_error_stops_the_run():
+    ran = threading.Event()
+
+    def boom(x):
+        raise RuntimeError('boom')
+
+    pipeline = Pipeline([
+        Stage('a', boom, ('x',), ('a',)),
+        Stage('b', slow(0.05), ('x',), ('b',)),
+        Stage('c', lambda a, b: ran.set(), ('a', 'b'), ('c',)),
+    ])
+    try:
+        pipeline.run({'x': 1}, ['c'])
+        assert False, "stage error swallowed"
+    except RuntimeError as e:
+        assert str(e) == 'boom'
+    assert not ran.is_set()
+
+
+def test_upload_pipeline_inputs():
+    # The upload only needs the parser and the file bytes
+    assert UPLOAD_PIPELINE.external_inputs == {'parser', 'raw'}
+
+
+if __name__ == "__main__":
+    test_required_stages()
+    print("✅ Required stages")
+    test_independent_stages_run_concurrently()
+    print("✅ Independent stages run concurrently")
+    test_cycle_and_duplicate_output_rejected()
+    print("✅ Cycles and duplicate outputs rejected")
+    test_stage_error_stops_the_run()
+    print("✅ Stage errors stop the run")
+    test_upload_pipeline_inputs()
+    print("✅ Upload pipeline inputs")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test that /upload-se-file and /api/recalculate-ink2 responses match their
+response models. The routes return the rows as-is (no FastAPI validation), so
+a calculation change that breaks the documented shape must fail here.
+Run with pytest or directly: python test_upload_response.py
+"""
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# No shared result cache file for the test run
+os.environ['RESULT_CACHE_DB'] = ''
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from models.schemas import UploadSeFileResponse, RecalculateInk2Response
+from services.database_parser import DatabaseParser
+from services.mapping_snapshot import MappingSnapshot
+
+# No #ORGNR, so nothing is written to financial_data
+SE_FILE = '\r\n'.join([
+    '#FLAGGA 0',
+    '#FNAMN "Svarstest AB"',
+    '#RAR 0 20240101 20241231',
+    '#RAR -1 20230101 20231231',
+    '#UB 0 1930 150000.50',
+    '#UB -1 1930 120000.00',
+    '#UB 0 2110 -40000',
+    '#RES 0 3010 -900000',
+    '#RES -1 3010 -800000',
+    '#RES 0 6072 5000',
+    '#RES 0 6110 1200',
+]).encode('iso-8859-1')
+
+
+def report_mapping(row_id: int, title: str, variable_name: str, style: str = 'NORMAL',
+                   accounts: tuple = None, formula: str = None, **extra) -> dict:
+    mapping = {'id': row_id, 'row_id': row_id, 'row_title': title, 'variable_name': variable_name,
+               'show_amount': style != 'H2' or formula is not None, 'style': style,
+               'is_calculated': formula is not None, 'calculation_formula': formula, 'always_show': None}
+    if accounts:
+        mapping['accounts_included_start'], mapping['accounts_included_end'] = accounts
+    mapping.update(extra)
+    return mapping
+
+
+def ink2_mapping(row_id: int, title: str, variable_name: str, accounts: str = None, **extra) -> dict:
+    mapping = {'id': row_id, 'row_id': row_id, 'row_title': title, 'variable_name': variable_name,
+               'accounts_included': accounts, 'calculation_formula': None, 'show_amount': 'TRUE',
+               'is_calculated': 'FALSE' if accounts else 'TRUE', 'always_show': 'TRUE',
+               'show_tag': bool(accounts), 'style': 'NORMAL', 'explainer': '', 'block': 'INK4', 'header': False}
+    mapping.update(extra)
+    return mapping
+
+
+def snapshot() -> MappingSnapshot:
+    return MappingSnapshot.from_payload({
+        'version': 'upload-response-test',
+        'rr_mappings': [
+            report_mapping(1, 'Rörelseintäkter', 'RorelseintakterHeader', 'H2', always_show='TRUE',
+                           block_group='rorelseintakter', show_amount=False),
+            report_mapping(2, 'Nettoomsättning', 'Nettoomsattning', accounts=(3000, 3799),
+                           block_group='rorelseintakter'),
+            report_mapping(3, 'Övriga externa kostnader', 'OvrigaExternaKostnader', accounts=(5000, 6999)),
+            report_mapping(4, 'Årets resultat', 'SumAretsResultat', 'H2',
+                           formula='Nettoomsattning + OvrigaExternaKostnader', always_show='TRUE'),
+        ],
+        'br_mappings': [
+            report_mapping(10, 'Kassa och bank', 'KassaBank', accounts=(1900, 1999), balance_type='DEBIT'),
+            report_mapping(11, 'Periodiseringsfonder', 'Periodiseringsfonder', accounts=(2110, 2149),
+                           balance_type='CREDIT'),
+            report_mapping(12, 'Årets resultat (BR)', 'AretsResultatEK', formula='SumAretsResultat',
+                           balance_type='CREDIT'),
+        ],
+        'ink2_mappings': [
+            ink2_mapping(1, 'Årets resultat, vinst', 'INK4.1'),
+            ink2_mapping(2, 'Ej avdragsgilla kostnader', 'INK4.3c', '6072;6992-6993'),
+            ink2_mapping(3, 'Skattemässigt resultat', 'INK_skattemassigt_resultat', style='TNORMAL'),
+        ],
+        'global_variables': {'statslaneranta': 0.0262, 'skattesats': 0.206, 'sarskild_loneskatt': 0.2426},
+        # All accounts in the file have a text, so no account lookups reach the database
+        'account_texts': [{'account_id': account_id, 'account_text': f'Konto {account_id}'}
+                          for account_id in (1930, 2110, 3010, 6072, 6110)],
+    })
+
+
+TEST_SNAPSHOT = snapshot()
+
+
+def make_client(monkeypatch) -> TestClient:
+    # Routes build their parser from the test snapshot (undone at teardown); the lifespan
+    # (mapping refresh, report workers) is not started
+    monkeypatch.setattr(main, "DatabaseParser", lambda: DatabaseParser(TEST_SNAPSHOT))
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def client(monkeypatch) -> TestClient:
+    return make_client(monkeypatch)
+
+
+def upload(client: TestClient, layout: str = 'full') -> dict:
+    response = client.post(f'/upload-se-file?layout={layout}', files={'file': ('svarstest.se', SE_FILE)})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_upload_response_matches_model(client):
+    body = upload(client)
+    UploadSeFileResponse.model_validate(body)
+    data = body['data']
+    assert data['rr_count'] == len(data['rr_data']) and data['rr_count'] > 0
+    assert data['br_count'] == len(data['br_data']) and data['br_count'] > 0
+    assert data['ink2_count'] == len(data['ink2_data']) and data['ink2_count'] > 0
+
+
+def test_compact_upload_response_matches_model(client):
+    body = upload(client, 'compact')
+    UploadSeFileResponse.model_validate(body)
+    data = body['data']
+    assert 'rr_data' not in data and data['skeleton_version']
+    assert len(data['rr']['current_amount']) == len(TEST_SNAPSHOT.rr_mappings)
+
+
+def test_recalculate_response_matches_model(client):
+    data = upload(client)['data']
+    response = client.post('/api/recalculate-ink2', json={
+        'upload_id': data['upload_id'],
+        'current_accounts': data['current_accounts'],
+        'fiscal_year': 2024,
+        'rr_data': data['rr_data'],
+        'br_data': data['br_data'],
+        'manual_amounts': {'INK4.3c': 1000},
+    })
+    assert response.status_code == 200, response.text
+    RecalculateInk2Response.model_validate(response.json())
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_client = make_client(monkeypatch)
+        test_upload_response_matches_model(test_client)
+        print("✅ Upload response matches UploadSeFileResponse")
+        test_compact_upload_response_matches_model(test_client)
+        print("✅ Compact upload response matches UploadSeFileResponse")
+        test_recalculate_response_matches_model(test_client)
+        print("✅ Recalculation response matches RecalculateInk2Response")
@@ -0,0 +1,158 @@
+"""
+Negotiated response compression
+Compresses complete (single-chunk) responses with brotli or gzip depending on the
+client's Accept-Encoding. Streaming responses (file downloads, SSE, NDJSON) are
+passed through untouched so they are never buffered.
+"""
+
+import gzip
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/javascript',
+    'text/',
+)
+
+# Streaming formats that must reach the client as soon as they are written
+NEVER_COMPRESS_TYPES = (
+    'text/event-stream',
+    'application/x-ndjson',
+)
+
+
+def parse_accept_encoding(header: str) -> List[str]:
+    """Encodings accepted by the client (q=0 excluded), most preferred first"""
+    accepted: List[Tuple[float, str]] = []
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.append((quality, token))
+    accepted.sort(key=lambda item: -item[0])
+    return [token for _, token in accepted]
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Best supported encoding for an Accept-Encoding header"""
+    for token in parse_accept_encoding(header):
+        if token == 'br' and brotli is not None:
+            return 'br'
+        if token in ('gzip', '*'):
+            return 'gzip'
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith(NEVER_COMPRESS_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware for brotli/gzip compression above a size threshold"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ''
+        for name, value in scope.get('headers', []):
+            if name == b'accept-encoding':
+                accept_encoding = value.decode('latin-1')
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if message['type'] == 'http.response.start':
+                # Hold the headers until we've seen the body
+                start_message = message
+                return
+
+            if message['type'] != 'http.response.body' or passthrough:
+                if start_message is not None and not passthrough:
+                    # Body sent through an extension (e.g. zero-copy sendfile) - never compressed
+                    passthrough = True
+                    await send(start_message)
+                await send(message)
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            headers = start_message.get('headers', [])
+            header_map = {name.lower(): value for name, value in headers}
+            content_type = header_map.get(b'content-type', b'').decode('latin-1')
+
+            compress = (
+                not more_body
+                and len(body) >= self.minimum_size
+                and b'content-encoding' not in header_map
+                and is_compressible(content_type)
+            )
+            if not compress:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self.compress(body, encoding)
+            new_headers = [
+                (name, value) for name, value in headers
+                if name.lower() not in (b'content-length', b'vary', b'etag')
+            ]
+            vary = header_map.get(b'vary')
+            new_headers.append((b'vary', vary + b', Accept-Encoding' if vary else b'Accept-Encoding'))
+            etag = header_map.get(b'etag')
+            if etag is not None:
+                # The representation changed, so a strong validator must not be reused
+                new_headers.append((b'etag', etag if etag.startswith(b'W/') else b'W/' + etag))
+            new_headers.append((b'content-encoding', encoding.encode('latin-1')))
+            new_headers.append((b'content-length', str(len(compressed)).encode('latin-1')))
+
+            passthrough = True
+            await send({**start_message, 'headers': new_headers})
+            await send({'type': 'http.response.body', 'body': compressed, 'more_body': False})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
@@ -0,0 +1,164 @@
+"""
+Response helpers
+Large financial payloads are available as MessagePack for clients that ask for it
+with `Accept: application/msgpack`; everyone else gets JSON via orjson.
+Stored files are served with ETag and single-range support (range_file_response).
+"""
+
+import os
+import re
+from email.utils import formatdate
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+
+def wants_msgpack(request: Request) -> bool:
+    """True if the client opted in to MessagePack and it is available"""
+    if msgpack is None:
+        return False
+    accept = request.headers.get('accept', '')
+    return any(part.split(';')[0].strip().lower() in (MSGPACK_MEDIA_TYPE, 'application/x-msgpack')
+               for part in accept.split(','))
+
+
+def negotiated_response(request: Request, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """MessagePack if the client asked for it, otherwise JSON"""
+    headers = {**(headers or {}), 'Vary': 'Accept'}
+    if wants_msgpack(request):
+        return MsgPackResponse(content, headers=headers)
+    return ORJSONResponse(content, headers=headers)
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header into inclusive (start, end).
+    Returns None for no/unsupported ranges (send the whole file) and raises
+    ValueError if the range can't be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None:
+        # Multiple ranges or other units - the full response is always allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """
+    A file or one byte range of it. Uses the server's zero-copy sendfile
+    extension when available, otherwise streams the range in chunks.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, start: int, end: int, status_code: int = 200,
+                 headers: Optional[Dict[str, str]] = None, media_type: Optional[str] = None,
+                 method: Optional[str] = None):
+        self.path = path
+        self.start = start
+        self.length = end - start + 1
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.send_header_only = method is not None and method.upper() == 'HEAD'
+        self.init_headers(headers)
+        self.headers['content-length'] = str(self.length)
+
+    async def __call__(self, scope, receive, send):
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        if self.send_header_only or self.length == 0:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            return
+
+        if 'http.response.zerocopysend' in scope.get('extensions', {}):
+            with open(self.path, 'rb') as file:
+                await send({'type': 'http.response.zerocopysend', 'file': file.fileno(),
+                            'offset': self.start, 'count': self.length, 'more_body': False})
+            return
+
+        async with await anyio.open_file(self.path, mode='rb') as file:
+            await file.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; end the response rather than hang
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+def range_file_response(request: Request, path: str, etag: Optional[str] = None,
+                        filename: Optional[str] = None, media_type: str = 'application/octet-stream',
+                        cache_control: str = 'private, max-age=86400') -> Response:
+    """Serve a stored file with ETag/If-None-Match, Range/If-Range and Content-Disposition"""
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    # Stored artifacts are content-addressed, so their hash is a strong validator
+    etag = f'"{etag}"' if etag else f'W/"{int(stat_result.st_mtime)}-{size}"'
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control,
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True),
+    }
+    if filename:
+        quoted = quote(filename)
+        headers['Content-Disposition'] = (f'attachment; filename="{filename}"' if quoted == filename
+                                          else f"attachment; filename*=utf-8''{quoted}")
+
+    if_none_match = [tag.strip().removeprefix('W/') for tag in request.headers.get('if-none-match', '').split(',')]
+    if etag.removeprefix('W/') in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get('if-range')
+    # A range only applies to the version the client already has part of
+    if if_range is None or (if_range == etag and not etag.startswith('W/')):
+        try:
+            byte_range = parse_range(request.headers.get('range'), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+    if byte_range is None:
+        return RangeFileResponse(path, 0, size - 1, headers=headers, media_type=media_type, method=request.method)
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return RangeFileResponse(path, start, end, status_code=206, headers=headers,
+                             media_type=media_type, method=request.method)
@@ -0,0 +1,89 @@
+"""
+Server-Sent Events helpers
+Long-running work reports its stages from a worker thread through a StageStream,
+which turns them into SSE events for a StreamingResponse. When the client goes
+away the stream is cancelled and the worker stops at its next stage boundary.
+"""
+
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Optional, AsyncIterator, Awaitable, Callable
+
+import orjson
+
+SSE_MEDIA_TYPE = 'text/event-stream'
+# Proxies drop idle connections; send a comment line this often while waiting
+KEEPALIVE_SECONDS = 15.0
+# Headers that keep proxies (nginx) from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """One SSE message with a JSON payload"""
+    return b"event: " + event.encode('utf-8') + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+
+class StageCancelled(Exception):
+    """Raised in the worker when the client of the stage stream has disconnected"""
+
+
+class StageStream:
+    """
+    Stage callback for a worker thread: stream(stage, data) sends a 'stage' event with
+    the stage's duration, the total elapsed time and data (partial results).
+    Raises StageCancelled once the client is gone, so the remaining stages are skipped.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = threading.Event()
+        self._started = self._last = time.perf_counter()
+
+    def __call__(self, stage: str, data: Optional[Dict[str, Any]] = None):
+        if self.cancelled.is_set():
+            raise StageCancelled(stage)
+        now = time.perf_counter()
+        event = {"stage": stage, "seconds": round(now - self._last, 4), "elapsed": round(now - self._started, 4)}
+        if data:
+            event.update(data)
+        self._last = now
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    async def events(self, work: Awaitable[Any], on_result: Callable[[Any], Any]) -> AsyncIterator[bytes]:
+        """
+        Run work (which calls this stream from its thread) and yield its stage events,
+        then the events from on_result(result) - a list of (event, data) - or an 'error' event.
+        """
+        task = asyncio.ensure_future(work)
+        try:
+            while True:
+                getter = asyncio.ensure_future(self._queue.get())
+                done, _ = await asyncio.wait({getter, task}, timeout=KEEPALIVE_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield sse_event("stage", getter.result())
+                    continue
+                getter.cancel()
+                if task in done:
+                    break
+                yield SSE_KEEPALIVE
+            # Stages reported just before the work finished
+            while not self._queue.empty():
+                yield sse_event("stage", self._queue.get_nowait())
+            try:
+                result = task.result()
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+                return
+            for event, data in on_result(result):
+                yield sse_event(event, data)
+        finally:
+            if not task.done():
+                # Client disconnected: the worker stops at its next stage
+                self.cancelled.set()
+                task.cancel()
@@ -313,6 +313,7 @@ export function AnnualReportChat() {
     
     try {
       const result = await apiService.recalculateInk2({
+        upload_id: companyData.seFileData.upload_id,
         current_accounts: companyData.seFileData.current_accounts || {},
         fiscal_year: companyData.fiscalYear,
         rr_data: companyData.seFileData.rr_data || [],
@@ -5,7 +5,7 @@ import { Popover, PopoverContent, PopoverTrigger } from "@/components/ui/popover
 import { Button } from "@/components/ui/button";
 import { Tooltip, TooltipContent, TooltipProvider, TooltipTrigger } from "@/components/ui/tooltip";
 import { calculateRRSums, extractKeyMetrics, formatAmount, type SEData } from '@/utils/seFileCalculations';
-import { apiService } from '@/services/api';
+import { apiService, type AccountDetail } from '@/services/api';
 
 interface CompanyData {
   results?: string;
@@ -21,6 +21,7 @@ interface CompanyData {
   boardMembers: Array<{ name: string; personalNumber: string }>;
   ink2Data?: any[]; // INK2 tax calculation data
   seFileData?: SEData & {
+    upload_id?: string;
     current_accounts?: Record<string, number>;
     annualReport?: {
       header: {
@@ -105,11 +106,7 @@ interface CompanyData {
       explainer?: string;
       block?: string;
       header?: boolean;
-      account_details?: Array<{
-        account_id: string;
-        account_text: string;
-        balance: number;
-      }>;
+      has_account_details?: boolean;
     }>;
          company_info?: {
        organization_number?: string;
@@ -167,6 +164,8 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
   const [editedAmounts, setEditedAmounts] = useState<Record<string, number>>({});
   const [originalAmounts, setOriginalAmounts] = useState<Record<string, number>>({});
   const [recalculatedData, setRecalculatedData] = useState<any[]>([]);
+  const [accountDetails, setAccountDetails] = useState<Record<string, AccountDetail[]>>({});
+  const [accountDetailsErrors, setAccountDetailsErrors] = useState<Record<string, string>>({});
 
   // Get new database-driven parser data (moved up to avoid initialization errors)
   const seFileData = companyData.seFileData;
@@ -197,6 +196,27 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
     await recalculateValues(originalAmounts);
   };
 
+  // Account details for SHOW rows are fetched when the popover is opened
+  const loadAccountDetails = async (variableName: string) => {
+    if (!seFileData?.upload_id || accountDetails[variableName]) return;
+    setAccountDetailsErrors(prev => ({ ...prev, [variableName]: '' }));
+    try {
+      const result = await apiService.getAccountDetails(
+        seFileData.upload_id,
+        variableName,
+        seFileData.current_accounts
+      );
+      if (result.success) {
+        setAccountDetails(prev => ({ ...prev, [variableName]: result.account_details }));
+      } else {
+        setAccountDetailsErrors(prev => ({ ...prev, [variableName]: 'Kunde inte hämta kontodetaljer' }));
+      }
+    } catch (error) {
+      console.error('Error loading account details:', error);
+      setAccountDetailsErrors(prev => ({ ...prev, [variableName]: 'Kunde inte hämta kontodetaljer, försök igen' }));
+    }
+  };
+
   // Recalculate dependent values when amounts change
   const recalculateValues = async (updatedAmounts: Record<string, number>) => {
     try {
@@ -204,6 +224,7 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
       
       // Call backend API to recalculate INK2 values using API service
       const result = await apiService.recalculateInk2({
+        upload_id: seFileData?.upload_id,
         current_accounts: seFileData?.current_accounts || {},
         fiscal_year: seFileData?.company_info?.fiscal_year,
         rr_data: seFileData?.rr_data || [],
@@ -653,8 +674,8 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
                       </TooltipProvider>
                     )}
                   </div>
-                  {item.show_tag && item.account_details && item.account_details.length > 0 && (
-                    <Popover>
+                  {item.show_tag && item.has_account_details && (
+                    <Popover onOpenChange={(open) => open && loadAccountDetails(item.variable_name)}>
                       <PopoverTrigger asChild>
                         <Button variant="outline" size="sm" className="ml-2 h-5 px-2 text-xs">
                           SHOW
@@ -663,6 +684,9 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
                       <PopoverContent className="w-96 p-4 bg-white border shadow-lg">
                         <div className="space-y-3">
                           <h4 className="font-medium text-sm">Detaljer för {item.row_title}</h4>
+                          {accountDetailsErrors[item.variable_name] && (
+                            <p className="text-sm text-red-600">{accountDetailsErrors[item.variable_name]}</p>
+                          )}
                           <div className="overflow-x-auto">
                             <table className="w-full text-sm">
                               <thead>
@@ -673,7 +697,7 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
                                 </tr>
                               </thead>
                               <tbody>
-                                {item.account_details.map((detail, detailIndex) => (
+                                {(accountDetails[item.variable_name] || []).map((detail, detailIndex) => (
                                   <tr key={detailIndex} className="border-b">
                                     <td className="py-2">{detail.account_id}</td>
                                     <td className="py-2">{detail.account_text}</td>
@@ -693,7 +717,7 @@ export function AnnualReportPreview({ companyData, currentStep, editableAmounts
                                     {new Intl.NumberFormat('sv-SE', {
                                       minimumFractionDigits: 2,
                                       maximumFractionDigits: 2
-                                    }).format(item.account_details.reduce((sum: number, detail: any) => sum + detail.balance, 0))}
+                                    }).format((accountDetails[item.variable_name] || []).reduce((sum: number, detail: AccountDetail) => sum + detail.balance, 0))}
                                   </td>
                                 </tr>
                               </tbody>
@@ -4,6 +4,7 @@ import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table';
+import { apiService, type AccountDetail } from '@/services/api';
 
 interface TaxCalculationItem {
   row_id: number;
@@ -12,21 +13,32 @@ interface TaxCalculationItem {
   variable_name: string;
   show_tag: boolean;
   accounts_included: string;
-  account_details?: Array<{
-    account_id: string;
-    account_text: string;
-    balance: number;
-  }>;
+  has_account_details?: boolean;
 }
 
 interface TaxCalculationProps {
   ink2Data: TaxCalculationItem[];
+  uploadId?: string;
   fiscalYear?: number;
   onContinue: () => void;
 }
 
-export function TaxCalculation({ ink2Data, fiscalYear, onContinue }: TaxCalculationProps) {
+export function TaxCalculation({ ink2Data, uploadId, fiscalYear, onContinue }: TaxCalculationProps) {
   const [selectedItem, setSelectedItem] = useState<TaxCalculationItem | null>(null);
+  const [accountDetails, setAccountDetails] = useState<Record<string, AccountDetail[]>>({});
+
+  // Account details are fetched when the dialog is opened
+  const loadAccountDetails = async (variableName: string) => {
+    if (!uploadId || accountDetails[variableName]) return;
+    try {
+      const result = await apiService.getAccountDetails(uploadId, variableName);
+      if (result.success) {
+        setAccountDetails(prev => ({ ...prev, [variableName]: result.account_details }));
+      }
+    } catch (error) {
+      console.error('Error loading account details:', error);
+    }
+  };
 
   const formatAmount = (amount: number) => {
     return new Intl.NumberFormat('sv-SE', {
@@ -43,7 +55,7 @@ export function TaxCalculation({ ink2Data, fiscalYear, onContinue }: TaxCalculat
   };
 
   const AccountDetailsDialog = ({ item }: { item: TaxCalculationItem }) => (
-    <Dialog>
+    <Dialog onOpenChange={(open) => open && loadAccountDetails(item.variable_name)}>
       <DialogTrigger asChild>
         <Badge 
           variant="secondary" 
@@ -67,7 +79,7 @@ export function TaxCalculation({ ink2Data, fiscalYear, onContinue }: TaxCalculat
               </TableRow>
             </TableHeader>
             <TableBody>
-              {item.account_details?.map((detail, index) => (
+              {accountDetails[item.variable_name]?.map((detail, index) => (
                 <TableRow key={index}>
                   <TableCell className="font-mono">{detail.account_id}</TableCell>
                   <TableCell>{detail.account_text}</TableCell>
@@ -76,7 +88,7 @@ export function TaxCalculation({ ink2Data, fiscalYear, onContinue }: TaxCalculat
                   </TableCell>
                 </TableRow>
               ))}
-              {(!item.account_details || item.account_details.length === 0) && (
+              {(!accountDetails[item.variable_name] || accountDetails[item.variable_name].length === 0) && (
                 <TableRow>
                   <TableCell colSpan={3} className="text-center text-gray-500">
                     Inga konton med saldo hittades
@@ -109,7 +121,7 @@ export function TaxCalculation({ ink2Data, fiscalYear, onContinue }: TaxCalculat
             >
               <div className="flex items-center">
                 <span className="text-sm">{item.row_title}</span>
-                {item.show_tag && item.account_details && (
+                {item.show_tag && item.has_account_details && (
                   <AccountDetailsDialog item={item} />
                 )}
               </div>
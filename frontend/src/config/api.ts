@@ -10,4 +10,5 @@ export const API_ENDPOINTS = {
   userReports: `${API_BASE_URL}/user-reports`,
   downloadReport: `${API_BASE_URL}/download-report`,
   recalculateInk2: `${API_BASE_URL}/api/recalculate-ink2`,
+  accountDetails: `${API_BASE_URL}/api/account-details`,
 } as const; 
\ No newline at end of file
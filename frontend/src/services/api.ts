@@ -20,6 +20,12 @@ export interface TestParserResponse {
   message: string;
 }
 
+export interface AccountDetail {
+  account_id: string;
+  account_text: string;
+  balance: number;
+}
+
 class ApiService {
   private async makeRequest<T>(
     url: string, 
@@ -86,6 +92,7 @@ class ApiService {
   }
 
   async recalculateInk2(data: {
+    upload_id?: string;
     current_accounts: Record<string, number>;
     fiscal_year?: number;
     rr_data: any[];
@@ -98,6 +105,29 @@ class ApiService {
       body: JSON.stringify(data),
     });
   }
+
+  async getAccountDetails(
+    uploadId: string,
+    variableName: string,
+    currentAccounts?: Record<string, number>
+  ): Promise<{
+    success: boolean;
+    account_details: AccountDetail[];
+  }> {
+    const url = `${API_ENDPOINTS.accountDetails}/${encodeURIComponent(uploadId)}/${encodeURIComponent(variableName)}`;
+    const response = await fetch(url);
+    if (response.status === 404 && currentAccounts) {
+      // The server no longer has the upload (restart or another instance): send the accounts along
+      return this.makeRequest(url, {
+        method: 'POST',
+        body: JSON.stringify({ current_accounts: currentAccounts }),
+      });
+    }
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return await response.json();
+  }
 }
 
 export const apiService = new ApiService(); 
\ No newline at end of file